@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark cho các thao tác ghi của DatabaseManager
+
+So sánh save_teams cũ (update_one từng team) với bulk_write hiện tại cho 5, 50 và 500 team.
+Mặc định chạy trên mongomock (pip install mongomock); dùng --url để chạy với MongoDB thật.
+--rtt-ms mô phỏng độ trễ mạng tới Atlas cho mỗi round trip khi chạy trên mongomock.
+
+Ví dụ:
+    python benchmark.py
+    python benchmark.py --rtt-ms 40
+    python benchmark.py --url mongodb://localhost:27017/
+"""
+
+import argparse
+import time
+import sys
+from datetime import datetime
+
+from database import DatabaseManager
+from config import COLLECTIONS
+
+BENCH_DATABASE = 'game_show_benchmark'
+
+
+class LatencyCollection:
+    """Bọc collection và thêm độ trễ giả lập cho mỗi lệnh gửi tới server"""
+
+    ROUND_TRIP_METHODS = {'update_one', 'bulk_write', 'find_one', 'insert_one', 'delete_one', 'delete_many'}
+
+    def __init__(self, collection, rtt, counter):
+        self._collection = collection
+        self._rtt = rtt
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self.ROUND_TRIP_METHODS:
+            return attr
+
+        def wrapper(*args, **kwargs):
+            self._counter[0] += 1
+            if self._rtt:
+                time.sleep(self._rtt)
+            return attr(*args, **kwargs)
+        return wrapper
+
+
+class LatencyDatabase:
+    def __init__(self, db, rtt, counter):
+        self._db = db
+        self._rtt = rtt
+        self._counter = counter
+
+    def __getitem__(self, name):
+        return LatencyCollection(self._db[name], self._rtt, self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def legacy_save_teams(collection, teams_data):
+    """save_teams trước đây: một update_one (một round trip) cho mỗi team"""
+    for team in teams_data:
+        collection.update_one(
+            {'team_id': team['team_id']},
+            {
+                '$set': {'name': str(team['name']), 'updated_at': datetime.utcnow()},
+                '$setOnInsert': {'team_id': team['team_id'], 'created_at': datetime.utcnow()}
+            },
+            upsert=True
+        )
+
+
+def make_manager(url, rtt, counter):
+    """Tạo DatabaseManager trỏ tới database benchmark riêng"""
+    manager = DatabaseManager()
+    if url:
+        import pymongo
+        client = pymongo.MongoClient(url, serverSelectionTimeoutMS=5000)
+        client.admin.command('ping')
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            print("❌ Cần cài mongomock (pip install mongomock) hoặc truyền --url tới MongoDB local")
+            sys.exit(1)
+        client = mongomock.MongoClient()
+
+    client.drop_database(BENCH_DATABASE)
+    manager.client = client
+    manager.db = LatencyDatabase(client[BENCH_DATABASE], rtt, counter)
+    manager.connected = True
+    manager._last_ping = time.monotonic()
+    manager.PING_CACHE_SECONDS = float('inf')
+    return manager
+
+
+def bench_save_teams(manager, counter, team_count, repeat):
+    teams = [{'team_id': f"bench_{i}", 'name': f"Bench Team {i}"} for i in range(team_count)]
+    collection = manager.db[COLLECTIONS['teams']]
+
+    results = {}
+    for label, func in (('update_one loop', lambda: legacy_save_teams(collection, teams)),
+                        ('bulk_write', lambda: manager.save_teams(teams))):
+        collection.delete_many({})
+        counter[0] = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - start) / repeat
+        # delete_many ở trên không tính vào số round trip
+        results[label] = (elapsed * 1000, counter[0] / repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark DatabaseManager.save_teams')
+    parser.add_argument('--url', help='MongoDB URL (mặc định: mongomock trong bộ nhớ)')
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='Độ trễ giả lập mỗi round trip (ms)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 500])
+    args = parser.parse_args()
+
+    counter = [0]
+    manager = make_manager(args.url, args.rtt_ms / 1000.0, counter)
+
+    print("save_teams benchmark")
+    print("=" * 64)
+    print(f"Backend: {args.url or 'mongomock'} | RTT giả lập: {args.rtt_ms:.0f} ms | repeat: {args.repeat}")
+    print("-" * 64)
+    print(f"{'Teams':>6} | {'Method':<16} | {'Time (ms)':>10} | {'Round trips':>11} | {'Speedup':>7}")
+    print("-" * 64)
+
+    for size in args.sizes:
+        results = bench_save_teams(manager, counter, size, args.repeat)
+        legacy_ms = results['update_one loop'][0]
+        for label, (ms, trips) in results.items():
+            speedup = legacy_ms / ms if ms > 0 else 0.0
+            print(f"{size:>6} | {label:<16} | {ms:>10.1f} | {trips:>11.0f} | {speedup:>6.1f}x")
+
+    manager.client.drop_database(BENCH_DATABASE)
+    manager.client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,35 @@ HOST = "0.0.0.0" if IS_BUNDLED else "localhost" # Use 0.0.0.0 for bundled app, l
 PUBLIC_IP = "113.161.151.124" # IP Public của server.
 PORT = 8127
 
+# Concurrent serving - số thread xử lý request song song và số kết nối được phép chờ
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '32'))
+SERVER_QUEUE_SIZE = int(os.getenv('SERVER_QUEUE_SIZE', '64'))
+
+# Server-Sent Events (/api/events) - số màn hình tối đa và chu kỳ gửi keepalive (giây)
+SSE_MAX_CLIENTS = 500
+SSE_HEARTBEAT = 15
+
+# Nén HTTP: body nhỏ hơn ngưỡng này gửi nguyên (gzip luôn có, brotli nếu cài 'pip install brotli')
+COMPRESS_MIN_BYTES = 1024
+# Thư mục chứa file nén sẵn (.gz/.br) của index.html, script.js, styles.css. Bản .exe giải nén
+# vào thư mục tạm mới mỗi lần chạy nên cache đặt cạnh file .exe để dùng lại giữa các lần chạy
+STATIC_CACHE_DIRECTORY = os.getenv('STATIC_CACHE_DIRECTORY', os.path.join(
+    os.path.dirname(sys.executable) if IS_BUNDLED else os.path.dirname(os.path.abspath(__file__)),
+    '.cache', 'static'))
+
+# HTTP/1.1 keep-alive: đóng kết nối rảnh sau N giây / sau M request trên cùng kết nối
+HTTP_KEEPALIVE_TIMEOUT = 5
+HTTP_KEEPALIVE_MAX_REQUESTS = 100
+
+# Lưu trữ file của server_python.py (thư mục db/):
+#   'json'    - mỗi lần lưu ghi lại nguyên file <name>.json (ghi nguyên tử)
+#   'journal' - ghi nối từng thay đổi vào <name>.journal, gộp định kỳ vào <name>.json
+FILE_STORE_BACKEND = os.getenv('FILE_STORE_BACKEND', 'json')
+# Gộp journal khi có quá N thay đổi hoặc journal lớn hơn JOURNAL_COMPACT_BYTES; kiểm tra mỗi INTERVAL giây
+JOURNAL_COMPACT_OPS = 500
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+JOURNAL_COMPACT_INTERVAL = 30
+
 # Collections
 COLLECTIONS = {
     'teams': 'teams',
@@ -35,6 +64,32 @@ COLLECTIONS = {
     'used_final_questions': 'used_final_questions'
 }
 
+# Số ô trên lưới câu hỏi của từng phần (màn hình Phần 1 / Phần 2)
+QUESTION_GRID_SIZES = {1: 58, 2: 60}
+
+# Nhập câu hỏi từ CSV (POST /api/import/questions): ghi theo lô N câu, file tối đa 50MB,
+# trả về chi tiết tối đa M dòng lỗi
+QUESTION_IMPORT_BATCH_SIZE = 500
+QUESTION_IMPORT_MAX_BYTES = 50 * 1024 * 1024
+QUESTION_IMPORT_MAX_ERRORS = 100
+
+# Câu hỏi gần trùng (dedup.py): độ tương đồng Jaccard tối thiểu trên các cặp 2 từ liên tiếp
+# của nội dung đã bỏ dấu - dùng khi nhập CSV, migrate và GET /api/questions/duplicates
+QUESTION_DUPLICATE_THRESHOLD = 0.8
+
+# In-memory cache cho get_data / get_teams (0 = không hết hạn, chỉ bị xóa khi có ghi dữ liệu)
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', '1') != '0'
+CACHE_TTL = float(os.getenv('CACHE_TTL', '0'))
+
+# Đồng bộ cache khi nhiều server_mongodb.py cùng trỏ tới một cluster:
+#   'off'           - chỉ một server (mặc định)
+#   'auto'          - dùng change stream, tự chuyển sang poll nếu không hỗ trợ (vd: mongod standalone)
+#   'change_stream' - chỉ dùng change stream (yêu cầu replica set / Atlas)
+#   'poll'          - đọc bảng version dùng chung mỗi CACHE_SYNC_POLL_INTERVAL giây
+CACHE_SYNC_MODE = os.getenv('CACHE_SYNC_MODE', 'off')
+CACHE_SYNC_POLL_INTERVAL = 2.0
+CACHE_VERSIONS_COLLECTION = '_cache_versions'
+
 # GridFS Configuration
 GRIDFS_BUCKET = 'images'
 
@@ -44,7 +99,37 @@ ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'ima
 IMAGE_QUALITY = 95  # Chất lượng cao cho JPEG compression
 MAX_DIMENSION = 3840  # 4K resolution - chỉ thu nhỏ nếu lớn hơn 4K
 
+# Các biến thể ảnh tạo lúc upload (cạnh dài tối đa, px). 'full' là ảnh đã tối ưu
+# Mỗi biến thể có bản WebP và bản JPEG (PNG nếu ảnh trong suốt) cho trình duyệt cũ
+IMAGE_VARIANTS = {'thumb': 320, 'medium': 960}
+WEBP_QUALITY = 80
+VARIANT_JPEG_QUALITY = 82
+
+# Xử lý ảnh trên process pool (0 = tự chọn theo số CPU, tối đa 4)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '0'))
+IMAGE_QUEUE_SIZE = 32
+IMAGE_JOB_TTL = 600  # Giữ trạng thái job đã xong trong 10 phút
+IMAGE_JOB_TIMEOUT = 120  # Upload đồng bộ chờ tối đa 2 phút
+
+# LRU cache bytes ảnh GridFS cho /api/image (0 = tắt). Ảnh lớn hơn MAX_ITEM không được cache
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+IMAGE_CACHE_MAX_ITEM_BYTES = 8 * 1024 * 1024
+
+# Ảnh trùng nội dung (SHA-256 ảnh đã tối ưu) dùng chung một file; 'python maintenance.py gc' chỉ xóa
+# ảnh / file không còn tham chiếu và không được dùng tới trong N giây gần nhất (upload đang dở)
+IMAGE_GC_MIN_AGE = 3600
+
 # Legacy file paths (for migration)
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 DB_DIRECTORY = os.path.join(DIRECTORY, 'db')
-IMAGES_DIRECTORY = os.path.join(DIRECTORY, 'images', 'teams')
\ No newline at end of file
+IMAGES_DIRECTORY = os.path.join(DIRECTORY, 'images', 'teams')
+
+# Backend lưu trữ của server_mongodb.py:
+#   'mongodb' - MongoDB Atlas / MongoDB local theo MONGODB_URL (mặc định)
+#   'sqlite'  - file SQLite cục bộ (SQLITE_PATH), chạy hoàn toàn offline
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'mongodb')
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DB_DIRECTORY, 'game_show.sqlite3'))
+
+# migrate.py: ghi ảnh theo lô N ảnh, lưu tiến độ vào checkpoint để chạy tiếp sau khi bị ngắt
+MIGRATE_BATCH_SIZE = 20
+MIGRATE_CHECKPOINT_PATH = os.path.join(DB_DIRECTORY, 'migrate.checkpoint')
@@ -3,19 +3,24 @@ Database Manager for Game Show Application using MongoDB
 """
 
 import pymongo
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, InsertOne, ReplaceOne, UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import (
+    ConnectionFailure, ServerSelectionTimeoutError, BulkWriteError, DuplicateKeyError,
+    OperationFailure, PyMongoError
+)
 import gridfs
 from bson import ObjectId
 import json
 import os
-from datetime import datetime
-from PIL import Image, ImageFile
-import io
-import base64
+from datetime import datetime, timedelta
+from PIL import ImageFile
 import uuid
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import time
+import bisect
+from collections import Counter, defaultdict, deque, OrderedDict
+from typing import Dict, Iterable, List, Optional, Any
 import sys
 
 # Enable loading of truncated images (helps with corrupted files)
@@ -30,10 +35,14 @@ else:
     application_path = os.path.dirname(os.path.abspath(__file__))
 # ==========================
 
+from image_processing import process_image, image_content_hash
+from json_migration import JsonMigration
 from config import (
     MONGODB_URL, MONGODB_DATABASE, COLLECTIONS, GRIDFS_BUCKET,
-    MAX_IMAGE_SIZE, ALLOWED_IMAGE_TYPES, IMAGE_QUALITY, MAX_DIMENSION,
-    DB_DIRECTORY 
+    IMAGE_QUALITY, MAX_DIMENSION,
+    DB_DIRECTORY, CACHE_ENABLED, CACHE_TTL, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_ITEM_BYTES,
+    CACHE_SYNC_MODE, CACHE_SYNC_POLL_INTERVAL, CACHE_VERSIONS_COLLECTION,
+    MIGRATE_BATCH_SIZE, MIGRATE_CHECKPOINT_PATH, IMAGE_GC_MIN_AGE
     # S_DIRECTORY
 )
 
@@ -41,12 +50,115 @@ from config import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class LRUByteCache:
+    """
+    Cache LRU giới hạn theo tổng số bytes cho ảnh GridFS.
+    Key là tuple bắt đầu bằng image_id để có thể xóa mọi biến thể của một ảnh.
+    """
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int) -> bool:
+        """Lưu value (size bytes). Trả về False nếu quá lớn để cache"""
+        if size > self.max_item_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.resident_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.resident_bytes += size
+            while self.resident_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.resident_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def discard(self, image_id: str):
+        """Xóa mọi biến thể đã cache của một ảnh"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == image_id]:
+                self.resident_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+
+
 class DatabaseManager:
+    # Tên backend (hiển thị ở /api/health)
+    backend = 'mongodb'
+
+    # Kết quả ping được dùng lại trong khoảng thời gian này (giây)
+    PING_CACHE_SECONDS = 2.0
+
+    # Các collection lưu danh sách giá trị 'đã sử dụng'
+    USED_KEYS = ('used_questions', 'used_judges', 'used_final_questions')
+
     def __init__(self):
         self.client = None
         self.db = None
         self.fs = None
         self.connected = False
+        self._last_ping = 0.0
+
+        # Read-through cache: (view, collection_name) -> (expires_at, data)
+        self._cache = {}
+        self._cache_lock = threading.RLock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Tăng mỗi khi collection bị ghi, dùng để bỏ qua kết quả đọc đã cũ
+        self._versions = {}
+
+        # Khóa ghi theo collection (save_data đọc - tính diff - ghi)
+        self._write_locks = defaultdict(threading.Lock)
+        # Kết quả lần migrate_from_json_files gần nhất (vd: các nhóm câu hỏi gần trùng)
+        self.last_migration_stats = {}
+
+        # Bytes + metadata ảnh GridFS theo (image_id, size, webp)
+        self.image_cache = LRUByteCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_ITEM_BYTES)
+
+        # Callback(collection_name, version) được gọi mỗi khi dữ liệu thay đổi
+        self._change_listeners = []
+
+        # Đồng bộ cache giữa nhiều process (change stream / poll version)
+        self.cache_sync_mode = None
+        self._sync_thread = None
+        self._sync_stop = threading.Event()
+        self._shared_versions = None  # None = chưa có mốc so sánh
         
     def connect(self):
         """Kết nối tới MongoDB"""
@@ -97,10 +209,28 @@ class DatabaseManager:
             
             # Index cho questions collection  
             self.db[COLLECTIONS['questions']].create_index("question")
+            self.db[COLLECTIONS['questions']].create_index("id")
+            
+            # Index thứ tự phần tử cho các collection lưu dạng danh sách (save_data)
+            for key in ('judges', 'questions', 'used_judges', 'used_questions', 'used_final_questions'):
+                self.db[COLLECTIONS[key]].create_index("_pos")
+            
+            # Unique index cho các danh sách 'đã dùng' để add_used_item an toàn khi nhiều máy cùng ghi
+            for key in self.USED_KEYS:
+                try:
+                    self.db[COLLECTIONS[key]].create_index(
+                        "value", unique=True, partialFilterExpression={'value': {'$exists': True}}
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not create unique index on {key}.value (duplicate values?): {e}")
             
             # Index cho images collection
             self.db[COLLECTIONS['images']].create_index("team_id")
             self.db[COLLECTIONS['images']].create_index("filename")
+            # Ảnh cũ (trước khi có content_hash) không tham gia dedup
+            self.db[COLLECTIONS['images']].create_index(
+                "content_hash", unique=True, partialFilterExpression={'content_hash': {'$exists': True}}
+            )
             
             logger.info("Database indexes created")
             
@@ -109,31 +239,258 @@ class DatabaseManager:
     
     def disconnect(self):
         """Ngắt kết nối MongoDB"""
+        self.stop_cache_sync()
         if self.client:
             self.client.close()
             self.connected = False
+            self.invalidate_cache(local=False)
             logger.info("Disconnected from MongoDB")
     
     def is_connected(self):
         """Kiểm tra trạng thái kết nối"""
         if not self.connected or not self.client:
             return False
+        # Bỏ qua ping nếu vừa ping thành công (tránh 1 round trip cho mỗi request)
+        if time.monotonic() - self._last_ping < self.PING_CACHE_SECONDS:
+            return True
         try:
             # The ismaster command is cheap and does not require auth.
             self.client.admin.command('ping')
+            self._last_ping = time.monotonic()
             return True
         except (ConnectionFailure, ServerSelectionTimeoutError):
             self.connected = False
             return False
 
+    def server_time(self) -> Optional[datetime]:
+        """Giờ hiện tại của database server (None nếu mất kết nối)"""
+        if not self.is_connected():
+            return None
+        return self.db.command("serverStatus")["localTime"]
+
+    # =============== CACHE OPERATIONS ===============
+
+    def _cache_get(self, key):
+        """Lấy dữ liệu từ cache, trả về None nếu không có hoặc đã hết hạn"""
+        if not CACHE_ENABLED:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._cache_hits += 1
+                    return value
+                del self._cache[key]
+            self._cache_misses += 1
+            return None
+
+    def _cache_put(self, key, value, version):
+        """Lưu vào cache nếu collection không bị ghi trong lúc đang đọc"""
+        if not CACHE_ENABLED:
+            return
+        with self._cache_lock:
+            if self._versions.get(key[1], 0) != version:
+                return
+            expires_at = time.monotonic() + CACHE_TTL if CACHE_TTL > 0 else None
+            self._cache[key] = (expires_at, value)
+
+    def invalidate_cache(self, collection_name: str = None, local: bool = True):
+        """
+        Xóa cache của một collection (hoặc toàn bộ nếu không truyền tên),
+        tăng version và thông báo cho các change listener.
+        local=False khi thay đổi đến từ process khác (không báo ngược lại bảng version chung).
+        """
+        if local and self.cache_sync_mode == 'poll':
+            # Báo cho các process khác TRƯỚC khi xóa cache local (tránh bỏ lỡ ghi xen giữa)
+            self._bump_shared_versions([collection_name] if collection_name else list(set(COLLECTIONS.values())))
+
+        with self._cache_lock:
+            if collection_name is None:
+                names = set(COLLECTIONS.values()) | set(self._versions)
+                self._cache.clear()
+                self.image_cache.clear()
+            else:
+                names = {collection_name}
+                for key in [k for k in self._cache if k[1] == collection_name]:
+                    del self._cache[key]
+            changes = []
+            for name in sorted(names):
+                self._versions[name] = self._versions.get(name, 0) + 1
+                changes.append((name, self._versions[name]))
+            listeners = list(self._change_listeners)
+
+        for name, version in changes:
+            for listener in listeners:
+                try:
+                    listener(name, version)
+                except Exception as e:
+                    logger.error(f"Change listener failed for {name}: {e}")
+
+    def add_change_listener(self, callback):
+        """Đăng ký callback(collection_name, version) khi dữ liệu thay đổi"""
+        with self._cache_lock:
+            self._change_listeners.append(callback)
+
+    def get_versions(self) -> Dict[str, int]:
+        """Version hiện tại của từng collection (tăng mỗi lần ghi)"""
+        with self._cache_lock:
+            return {name: self._versions.get(name, 0) for name in COLLECTIONS.values()}
+
+    def cache_stats(self) -> Dict:
+        """Thống kê cache (dùng cho health check / monitoring)"""
+        with self._cache_lock:
+            total = self._cache_hits + self._cache_misses
+            return {
+                'enabled': CACHE_ENABLED,
+                'ttl': CACHE_TTL,
+                'sync': self.cache_sync_mode or 'off',
+                'entries': len(self._cache),
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'hit_ratio': round(self._cache_hits / total, 4) if total else 0.0
+            }
+
+    # =============== MULTI-INSTANCE CACHE SYNC ===============
+
+    def start_cache_sync(self, mode: str = CACHE_SYNC_MODE) -> None:
+        """
+        Bật đồng bộ cache với các process khác dùng chung database.
+        Chạy một background thread theo dõi change stream; nếu server không hỗ trợ
+        (mongod standalone) và mode='auto' thì chuyển sang poll bảng version chung.
+        """
+        if mode == 'off' or not self.connected:
+            return
+        if self._sync_thread and self._sync_thread.is_alive():
+            return
+        if mode not in ('auto', 'change_stream', 'poll'):
+            logger.warning(f"Unknown CACHE_SYNC_MODE '{mode}', cache sync disabled")
+            return
+
+        self._sync_stop.clear()
+        self.cache_sync_mode = 'poll' if mode == 'poll' else 'change_stream'
+        self._sync_thread = threading.Thread(
+            target=self._cache_sync_loop, args=(mode,), name='cache-sync', daemon=True
+        )
+        self._sync_thread.start()
+
+    def stop_cache_sync(self) -> None:
+        self._sync_stop.set()
+        if self._sync_thread and self._sync_thread.is_alive() and self._sync_thread is not threading.current_thread():
+            self._sync_thread.join(timeout=5)
+        self._sync_thread = None
+        self.cache_sync_mode = None
+
+    def _cache_sync_loop(self, mode: str) -> None:
+        logger.info(f"Cache sync started (mode: {mode})")
+        while not self._sync_stop.is_set():
+            if self.cache_sync_mode == 'change_stream':
+                try:
+                    self._watch_changes()
+                except OperationFailure as e:
+                    if mode == 'auto':
+                        logger.warning(f"Change streams unavailable ({e}), falling back to version polling")
+                        self._shared_versions = None
+                        self.cache_sync_mode = 'poll'
+                    else:
+                        logger.error(f"Change stream failed: {e}")
+                        self._sync_stop.wait(5)
+                except PyMongoError as e:
+                    logger.warning(f"Change stream interrupted, reconnecting: {e}")
+                    self._sync_stop.wait(2)
+                except Exception as e:
+                    logger.error(f"Unexpected change stream error: {e}")
+                    self._sync_stop.wait(5)
+            else:
+                try:
+                    self._poll_shared_versions()
+                except Exception as e:
+                    logger.warning(f"Cache version polling failed: {e}")
+                self._sync_stop.wait(CACHE_SYNC_POLL_INTERVAL)
+        logger.info("Cache sync stopped")
+
+    def _watch_changes(self) -> None:
+        """Theo dõi change stream, gom các thay đổi liên tiếp rồi mới xóa cache"""
+        names = sorted(set(COLLECTIONS.values()))
+        pipeline = [{'$match': {'ns.coll': {'$in': names}}}]
+        with self.db.watch(pipeline, max_await_time_ms=500) as stream:
+            # Có thể đã bỏ lỡ thay đổi trong lúc chưa mở stream
+            self.invalidate_cache(local=False)
+            pending = set()
+            first_pending_at = None
+            while not self._sync_stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    operation = change.get('operationType')
+                    if operation in ('drop', 'dropDatabase', 'rename', 'invalidate'):
+                        pending.add(None)
+                    else:
+                        pending.add(change.get('ns', {}).get('coll'))
+                    first_pending_at = first_pending_at or time.monotonic()
+                    # Một save_data sinh nhiều event: gom trong tối đa 200ms
+                    if time.monotonic() - first_pending_at < 0.2:
+                        continue
+                if pending:
+                    self._apply_remote_changes(pending)
+                    pending = set()
+                    first_pending_at = None
+
+    def _apply_remote_changes(self, names) -> None:
+        if None in names:
+            self.invalidate_cache(local=False)
+            return
+        for name in names:
+            if name == COLLECTIONS['images']:
+                # Ảnh bị xóa ở process khác - không biết image_id nào, xóa cả cache ảnh
+                self.image_cache.clear()
+            self.invalidate_cache(name, local=False)
+
+    def _bump_shared_versions(self, names) -> None:
+        """Tăng version dùng chung của các collection vừa được ghi (chế độ poll)"""
+        try:
+            collection = self.db[CACHE_VERSIONS_COLLECTION]
+            for name in names:
+                doc = collection.find_one_and_update(
+                    {'_id': name}, {'$inc': {'version': 1}},
+                    upsert=True, return_document=pymongo.ReturnDocument.AFTER
+                )
+                if self._shared_versions is not None:
+                    self._shared_versions[name] = doc['version']
+        except PyMongoError as e:
+            logger.warning(f"Could not publish cache version for {names}: {e}")
+
+    def _read_shared_versions(self) -> Dict[str, int]:
+        return {doc['_id']: doc.get('version', 0) for doc in self.db[CACHE_VERSIONS_COLLECTION].find({})}
+
+    def _poll_shared_versions(self) -> None:
+        """So sánh bảng version dùng chung với lần đọc trước, xóa cache các collection đã đổi"""
+        current = self._read_shared_versions()
+        if self._shared_versions is None:
+            # Lần đầu chỉ ghi nhận mốc
+            self._shared_versions = current
+            return
+        changed = [name for name, version in current.items() if self._shared_versions.get(name) != version]
+        self._shared_versions.update(current)
+        if changed:
+            self._apply_remote_changes(changed)
+
     # =============== TEAM OPERATIONS ===============
     
     # lấy list
     def get_teams(self) -> List[Dict]:
-        """Lấy danh sách tất cả các team"""
+        """
+        Lấy danh sách tất cả các team (có cache).
+        Kết quả được dùng chung giữa các request - không sửa trực tiếp list trả về.
+        """
+        cache_key = ('teams', COLLECTIONS['teams'])
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         if not self.is_connected():
             return []
         
+        version = self._versions.get(cache_key[1], 0)
         try:
             teams = list(self.db[COLLECTIONS['teams']].find({}, {'_id': 0, 'created_at': 0, 'updated_at': 0}))
             
@@ -152,21 +509,30 @@ class DatabaseManager:
                     if hasattr(value, 'isoformat'):  # datetime objects
                         team[key] = value.isoformat()
             
+            self._cache_put(cache_key, teams, version)
             return teams
             
         except Exception as e:
             logger.error(f"Error getting teams: {e}")
             return []
     
-    def save_teams(self, teams_data: List[Dict]) -> bool:
-        """Lưu danh sách teams bằng cách cập nhật hoặc chèn (upsert) để tránh mất dữ liệu."""
+    def save_teams(self, teams_data: List[Dict], stats: Optional[Dict] = None) -> bool:
+        """
+        Lưu danh sách teams bằng cách cập nhật hoặc chèn (upsert) để tránh mất dữ liệu.
+        Toàn bộ danh sách được gửi trong một bulk_write (unordered) - một round trip duy nhất.
+        Team đổi ảnh: ref_count của ảnh mới tăng, ảnh cũ được bỏ một tham chiếu.
+        stats: dict nhận số thao tác đã ghi; lỗi của từng team nằm trong stats['errors'].
+        """
         if not self.is_connected():
             return False
         
         try:
             collection = self.db[COLLECTIONS['teams']]
+            operations = []
+            team_ids = []
+            image_fields = {}  # vị trí trong operations -> trường ảnh mới của team
             
-            # Lặp qua dữ liệu team được gửi đến và upsert từng team
+            # Tạo một UpdateOne upsert cho mỗi team hợp lệ
             for team in teams_data:
                 if 'team_id' not in team or 'name' not in team:
                     continue
@@ -184,17 +550,68 @@ class DatabaseManager:
                     team_updates['image_id'] = team['image_id']
                 if 'imagePath' in team:
                     team_updates['imagePath'] = team['imagePath']
+                if 'image_id' in team or 'imagePath' in team:
+                    image_fields[len(operations)] = {k: team[k] for k in ('image_id', 'imagePath') if k in team}
                 
                 # Tạo câu lệnh update hoàn chỉnh
                 update_query = {
                     '$set': team_updates,
                     '$setOnInsert': {'team_id': team['team_id'], 'created_at': datetime.utcnow()}
                 }
-                collection.update_one(filter_query, update_query, upsert=True)
+                operations.append(UpdateOne(filter_query, update_query, upsert=True))
+                team_ids.append(team['team_id'])
+            
+            stats = {} if stats is None else stats
+            stats.update({'operations': len(operations), 'upserted': 0, 'modified': 0, 'errors': []})
+            if not operations:
+                return True
+            
+            with self._write_locks[COLLECTIONS['teams']]:
+                # Ảnh các team đang dùng trước khi ghi (chỉ team có gửi trường ảnh)
+                old_images = {}
+                if image_fields:
+                    old_images = {doc['team_id']: doc for doc in collection.find(
+                        {'team_id': {'$in': [team_ids[index] for index in image_fields]}},
+                        {'_id': 0, 'team_id': 1, 'image_id': 1, 'imagePath': 1})}
+
+                failed = set()
+                try:
+                    result = collection.bulk_write(operations, ordered=False)
+                    stats['upserted'] = result.upserted_count
+                    stats['modified'] = result.modified_count
+                except BulkWriteError as bwe:
+                    # Unordered: các team khác vẫn được ghi, chỉ báo lỗi cho team hỏng
+                    details = bwe.details
+                    stats['upserted'] = details.get('nUpserted', 0)
+                    stats['modified'] = details.get('nModified', 0)
+                    for error in details.get('writeErrors', []):
+                        failed.add(error['index'])
+                        team_id = team_ids[error['index']]
+                        stats['errors'].append({
+                            'team_id': team_id,
+                            'code': error.get('code'),
+                            'message': error.get('errmsg')
+                        })
+                        logger.error(f"Error saving team {team_id}: {error.get('errmsg')}")
+
+                # team_id -> lần ghi cuối của team (danh sách có thể lặp team)
+                written = {team_ids[index]: index for index in image_fields if index not in failed}
+                self._update_image_references(
+                    self._reference_counts(old_images.get(team_id) for team_id in written),
+                    self._reference_counts({**old_images.get(team_id, {}), **image_fields[index]}
+                                           for team_id, index in written.items())
+                )
+            if failed:
+                return False
+            
+            logger.info(f"Saved {len(operations)} teams in one bulk_write "
+                        f"({stats['upserted']} upserted, {stats['modified']} modified)")
             return True
         except Exception as e:
             logger.error(f"Error saving teams: {e}")
             return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
 
     # Lưu team
     def save_team(self, team_data: Dict) -> bool:
@@ -214,12 +631,15 @@ class DatabaseManager:
             team_data['updated_at'] = datetime.utcnow()
             
             collection.insert_one(team_data)
+            self._update_image_references(Counter(), self._reference_counts([team_data]))
             logger.info(f"Successfully saved team: {team_data['name']}")
             return True
             
         except Exception as e:
             logger.error(f"Error saving teams: {e}")
             return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
     
     # Xóa
     def delete_team(self, team_id: str) -> bool:
@@ -230,19 +650,17 @@ class DatabaseManager:
 
         try:
             # Tìm team để lấy image_id trước khi xóa
-            team_doc = self.db[COLLECTIONS['teams']].find_one({'team_id': team_id})
-            
-            result = self.db[COLLECTIONS['teams']].delete_one({'team_id': team_id})
+            with self._write_locks[COLLECTIONS['teams']]:
+                team_doc = self.db[COLLECTIONS['teams']].find_one({'team_id': team_id})
+                result = self.db[COLLECTIONS['teams']].delete_one({'team_id': team_id})
 
             if result.deleted_count > 0:
                 logger.info(f"Successfully deleted team with id: {team_id}")
                 
-                # === LOGIC MỚI: Xóa ảnh liên quan trong GridFS ===
-                if team_doc and 'image_id' in team_doc:
-                    image_id_to_delete = team_doc['image_id']
-                    image_meta = self.db[COLLECTIONS['images']].find_one_and_delete({'image_id': image_id_to_delete})
-                    if image_meta and 'grid_file_id' in image_meta:
-                        self.fs.delete(image_meta['grid_file_id'])
+                # Bỏ một tham chiếu tới ảnh; file GridFS chỉ bị xóa khi không còn ai dùng
+                image_id_to_delete = self._image_reference(team_doc)
+                if image_id_to_delete:
+                    if self._release_image(image_id_to_delete):
                         logger.info(f"Successfully deleted associated image with id: {image_id_to_delete}")
 
                 return True
@@ -252,6 +670,28 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Error deleting team {team_id}: {e}")
             return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
+
+    def delete_judge(self, judge_id: str) -> bool:
+        """Xóa một judge dựa trên id (bỏ tham chiếu tới ảnh của judge)"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self._write_locks[COLLECTIONS['judges']]:
+                judge_doc = self.db[COLLECTIONS['judges']].find_one_and_delete({'id': judge_id})
+                if judge_doc is None:
+                    logger.warning(f"Judge with id: {judge_id} not found for deletion.")
+                    return False
+                self._update_image_references(self._reference_counts([judge_doc]), Counter())
+            logger.info(f"Successfully deleted judge with id: {judge_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting judge {judge_id}: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['judges'])
         
     # =============== IMAGE OPERATIONS ===============
     
@@ -270,325 +710,446 @@ class DatabaseManager:
             return None
             
         try:
-            # Step 1: Parse and decode image
-            logger.info("Step 1/5: Parsing and decoding image data...")
-            if not image_data.startswith('data:image/'):
-                raise ValueError("Invalid image data format")
-            
-            header, base64_data = image_data.split(',', 1)
-            mime_type = header.split(':')[1].split(';')[0]
-            
-            if mime_type not in ALLOWED_IMAGE_TYPES:
-                raise ValueError(f"Unsupported image type: {mime_type}")
-            
-            # Clean base64 data thoroughly - multiple passes to ensure all problematic characters are removed
-            base64_data = base64_data.replace('\n', '').replace('\r', '').replace(' ', '').replace('\t', '')
-            
-            # Remove any non-ASCII characters from base64 data
-            base64_data = ''.join(char for char in base64_data if ord(char) < 128)
-            
-            # More aggressive cleaning - only keep valid base64 characters, but be careful not to remove essential data
-            import re
-            
-            # First, count how many valid base64 chars we have
-            valid_chars = re.findall(r'[A-Za-z0-9+/=]', base64_data)
-            original_length = len(base64_data)
-            valid_length = len(valid_chars)
-            
-            if valid_length < original_length:
-                logger.warning(f"Found {original_length - valid_length} invalid characters in base64 data")
-            
-            # Join valid characters
-            base64_data = ''.join(valid_chars)
-            
-            # Remove any existing padding first, then add correct padding
-            base64_data = base64_data.rstrip('=')
-            
-            # Add correct padding
-            missing_padding = len(base64_data) % 4
-            if missing_padding:
-                base64_data += '=' * (4 - missing_padding)
-                
-            # Final validation of base64 characters (only A-Z, a-z, 0-9, +, /, =)
-            if not re.match(r'^[A-Za-z0-9+/]*={0,3}$', base64_data):
-                raise ValueError("Base64 string contains invalid characters")
-                
-            logger.info(f"Base64 data length after cleaning: {len(base64_data)} characters")
-            
-            # Additional validation - check that the length is valid for base64
-            if len(base64_data) % 4 != 0:
-                logger.error(f"Base64 data length is not multiple of 4: {len(base64_data)}")
-                raise ValueError(f"Invalid base64 length: {len(base64_data)} characters")
-            
-            try:
-                # Test decode with validation and altchars to handle different encodings
-                image_bytes = base64.b64decode(base64_data, validate=True)
-            except Exception as decode_error:
-                logger.error(f"Base64 decode error: {decode_error}")
-                logger.error(f"Problematic data length: {len(base64_data)}")
-                # Try alternative decoding approaches
-                try:
-                    # Sometimes there might be URL-safe base64
-                    logger.info("Trying URL-safe base64 decoding")
-                    image_bytes = base64.urlsafe_b64decode(base64_data + '==')  # Add extra padding just in case
-                except Exception:
-                    logger.error(f"First 100 chars: {base64_data[:100]}")
-                    logger.error(f"Last 100 chars: {base64_data[-100:]}")
-                    raise ValueError(f"Invalid base64 data: {decode_error}")
-            
-            if len(image_bytes) > MAX_IMAGE_SIZE:
-                raise ValueError(f"Image too large: {len(image_bytes)} bytes")
-            
-            # Additional check: verify we have enough bytes for a valid image
-            if len(image_bytes) < 100:  # Even smallest valid images are > 100 bytes
-                raise ValueError(f"Image data too small to be valid: {len(image_bytes)} bytes")
-            
-            # Check for basic image format signatures
-            if image_bytes[:4] == b'\x89PNG':
-                logger.info("Detected PNG format")
-            elif image_bytes[:2] == b'\xff\xd8':
-                logger.info("Detected JPEG format")
-            elif image_bytes[:6] in (b'GIF87a', b'GIF89a'):
-                logger.info("Detected GIF format")
-            elif image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
-                logger.info("Detected WebP format")
-            else:
-                logger.warning(f"Unknown image format signature: {image_bytes[:10].hex()}")
-            
-            logger.info("Step 1/5: Success")
+            # Step 1-2: decode + tối ưu + biến thể (xem image_processing.process_image)
+            processed = process_image(image_data)
+        except Exception as e:
+            logger.error(f"Error processing team image: {e}")
+            return None
 
-            # Step 2: Optimize image for web display while keeping good quality
-            logger.info("Step 2/5: Optimizing image for web display...")
-            
-            try:
-                # Multiple attempts to handle different image formats and potential issues
-                image = None
-                original_width = original_height = 0
-                
-                # Attempt 1: Standard opening with immediate load
-                try:
-                    image = Image.open(io.BytesIO(image_bytes))
-                    image.load()  # Force load all image data
-                    original_width, original_height = image.size
-                    logger.info(f"Successfully opened image: {original_width}x{original_height}, mode: {image.mode}")
-                
-                except Exception as e1:
-                    logger.warning(f"Standard image opening failed: {e1}")
-                    
-                    # Attempt 2: Try with verify first, then reopen
-                    try:
-                        test_img = Image.open(io.BytesIO(image_bytes))
-                        test_img.verify()  # Just verify structure
-                        # Reopen after verify (verify closes the image)
-                        image = Image.open(io.BytesIO(image_bytes))
-                        original_width, original_height = image.size
-                        logger.info(f"Verified and reopened image: {original_width}x{original_height}")
-                    
-                    except Exception as e2:
-                        logger.warning(f"Verify approach failed: {e2}")
-                        
-                        # Attempt 3: Try with relaxed error handling
-                        try:
-                            # For PNG files with CRC errors, try to load with ignore errors
-                            from PIL import ImageFile
-                            ImageFile.LOAD_TRUNCATED_IMAGES = True
-                            
-                            temp_img = Image.open(io.BytesIO(image_bytes))
-                            # Convert to RGB immediately to bypass format issues
-                            image = temp_img.convert('RGB')
-                            original_width, original_height = image.size
-                            logger.info(f"Force converted to RGB with truncated load: {original_width}x{original_height}")
-                        
-                        except Exception as e3:
-                            logger.warning(f"RGB conversion failed: {e3}")
-                            
-                            # Attempt 4: Try saving and reloading to fix corruption
-                            try:
-                                # Write raw bytes to temp buffer and try to recover
-                                temp_buffer = io.BytesIO(image_bytes)
-                                temp_img = Image.open(temp_buffer)
-                                
-                                # Save to new buffer with error recovery
-                                recovery_buffer = io.BytesIO()
-                                temp_img.save(recovery_buffer, format='PNG', optimize=False)
-                                recovery_bytes = recovery_buffer.getvalue()
-                                
-                                # Try to reopen the recovered image
-                                image = Image.open(io.BytesIO(recovery_bytes))
-                                original_width, original_height = image.size
-                                logger.info(f"Recovered corrupted image: {original_width}x{original_height}")
-                                
-                            except Exception as e4:
-                                logger.error(f"All image opening methods failed: {e1}, {e2}, {e3}, {e4}")
-                                raise ValueError(f"Cannot process image data - may be corrupted or in unsupported format")
-                
-                if image is None or original_width == 0:
-                    raise ValueError("Failed to open image - no valid image data found")
-                
-                # Normalize color mode for consistent processing
-                if image.mode in ('RGBA', 'LA'):
-                    # Keep transparency modes as-is for now
-                    pass
-                elif image.mode == 'P':
-                    # Convert palette images to RGBA to preserve potential transparency
-                    if 'transparency' in image.info:
-                        image = image.convert('RGBA')
-                    else:
-                        image = image.convert('RGB')
-                elif image.mode not in ('RGB', 'L'):
-                    # Convert other modes to RGB
-                    image = image.convert('RGB')
-                    
-            except Exception as pil_error:
-                logger.error(f"PIL image processing error: {pil_error}")
-                logger.error(f"Image data appears to be corrupted or in an unsupported format")
-                raise ValueError(f"Image data is corrupted or unsupported: {pil_error}")
-            
-            # Only resize if image is very large (over 2000px on any side)
-            max_dimension = 1920  # Good for web display
-            if max(original_width, original_height) > max_dimension:
-                # Calculate resize ratio while maintaining aspect ratio
-                ratio = min(max_dimension / original_width, max_dimension / original_height)
-                new_width = int(original_width * ratio)
-                new_height = int(original_height * ratio)
-                
-                try:
-                    # Use high-quality resampling with error handling
-                    logger.info(f"Attempting to resize from {original_width}x{original_height} to {new_width}x{new_height}")
-                    
-                    # For complex modes, convert to RGB first before resizing
-                    if image.mode not in ('RGB', 'RGBA', 'L'):
-                        logger.info(f"Converting from {image.mode} to RGB before resize")
-                        image = image.convert('RGB')
-                    
-                    resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    image = resized_image
-                    logger.info(f"Successfully resized to {new_width}x{new_height}")
-                    
-                except Exception as resize_error:
-                    logger.error(f"LANCZOS resize failed: {resize_error}")
-                    # Try with simpler resampling method
-                    try:
-                        logger.info("Trying BILINEAR resampling as fallback")
-                        if image.mode not in ('RGB', 'RGBA', 'L'):
-                            image = image.convert('RGB')
-                        resized_image = image.resize((new_width, new_height), Image.Resampling.BILINEAR)
-                        image = resized_image
-                        logger.info(f"Successfully resized with BILINEAR to {new_width}x{new_height}")
-                    except Exception as fallback_error:
-                        logger.error(f"All resize methods failed: {resize_error}, {fallback_error}")
-                        # Use original image if resize fails
-                        logger.warning("Using original image size due to resize failures")
-                        pass
-            else:
-                logger.info("Image size is acceptable, no resizing needed")
-            
-            # Save optimized image with good quality and format handling
-            output_buffer = io.BytesIO()
-            
-            try:
-                if mime_type == 'image/png' or image.mode in ('RGBA', 'LA'):
-                    # For PNG or images with transparency, save as PNG
-                    image.save(output_buffer, format='PNG', optimize=True, compress_level=6)
-                    logger.info("Saved as PNG format")
-                else:
-                    # For JPEG and other formats, convert to RGB first
-                    if image.mode in ('RGBA', 'LA', 'P'):
-                        # Create white background for transparent images
-                        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-                        if image.mode in ('RGBA', 'LA'):
-                            rgb_image.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                        else:
-                            rgb_image.paste(image)
-                        image = rgb_image
-                    
-                    image.save(output_buffer, format='JPEG', quality=85, optimize=True, progressive=True)
-                    logger.info("Saved as JPEG format")
-                    
-            except Exception as save_error:
-                logger.error(f"Error saving optimized image: {save_error}")
-                # Fallback: save as PNG with RGB conversion
-                try:
-                    if image.mode not in ('RGB', 'L'):
-                        image = image.convert('RGB')
-                    output_buffer = io.BytesIO()  # Reset buffer
-                    image.save(output_buffer, format='PNG')
-                    logger.info("Fallback: saved as PNG after RGB conversion")
-                except Exception as fallback_error:
-                    logger.error(f"Fallback save also failed: {fallback_error}")
-                    raise ValueError(f"Cannot save processed image: {save_error}")
-            
-            optimized_bytes = output_buffer.getvalue()
-            
-            if len(optimized_bytes) == 0:
-                raise ValueError("Image processing resulted in empty data")
-                
-            logger.info(f"Step 2/5: Success - optimized from {len(image_bytes)} to {len(optimized_bytes)} bytes ({((len(image_bytes) - len(optimized_bytes)) / len(image_bytes) * 100):.1f}% reduction)")
-
-            # Step 3: Save to GridFS
-            logger.info("Step 3/5: Saving image to GridFS...")
-            file_id = str(uuid.uuid4())
-            filename = f"{file_id}.{mime_type.split('/')[1]}"
-            
-            grid_file_id = self.fs.put(
-                optimized_bytes,
-                filename=filename,
-                content_type=mime_type,
-                team_name=team_name,
-                team_id=team_id,
-                upload_date=datetime.utcnow(),
-                original_size=len(image_bytes),
-                optimized_size=len(optimized_bytes),
-                dimensions={'width': image.size[0], 'height': image.size[1]}
-            )
-            logger.info(f"Step 3/5: Success, GridFS file ID: {grid_file_id}")
+        return self.store_processed_image(processed, team_name, team_id)
+
+    def store_processed_image(self, processed: Dict, team_name: str, team_id: str = None,
+                              image_id: str = None) -> Optional[Dict]:
+        """
+        Lưu ảnh đã xử lý bởi process_image vào GridFS (bước 3-5 của save_team_image)
+        Args:
+            processed: kết quả của image_processing.process_image
+            image_id: ID đặt trước cho ảnh (vd: upload bất đồng bộ đã trả ID cho client)
+        Returns:
+            Dict với thông tin ảnh đã lưu hoặc None nếu lỗi
+        """
+        if not self.is_connected():
+            logger.error("Cannot save image: Not connected to database")
+            return None
+
+        try:
+            # Ảnh đã có (cùng nội dung): dùng lại, không ghi thêm file GridFS.
+            # ref_count chỉ tăng khi team / judge thật sự dùng ảnh (save_teams / save_data)
+            content_hash = image_content_hash(processed)
+            existing = self._reuse_image(content_hash)
+            if existing is not None:
+                logger.info(f"Image content already stored as {existing['image_id']} "
+                            f"(ref_count={existing.get('ref_count')}), reusing it")
+                return self._image_result(existing)
+
+            image_doc = self._put_image_files(processed, team_name, team_id, image_id)
 
             # Step 4: Save metadata to 'images' collection
             logger.info("Step 4/5: Saving metadata to 'images' collection...")
-            image_doc = {
-                'image_id': file_id,
-                'grid_file_id': grid_file_id,
-                'team_id': team_id,
-                'team_name': team_name,
-                'filename': filename,
-                'mime_type': mime_type,
-                'original_size': len(image_bytes),
-                'optimized_size': len(optimized_bytes),
-                'dimensions': {'width': image.size[0], 'height': image.size[1]},
-                'created_at': datetime.utcnow()
-            }
-            
-            self.db[COLLECTIONS['images']].insert_one(image_doc)
+            try:
+                self.db[COLLECTIONS['images']].insert_one(image_doc)
+            except DuplicateKeyError:
+                # Một upload khác cùng nội dung vừa lưu xong trước: bỏ file vừa ghi, dùng ảnh đó
+                self._delete_image_files(image_doc)
+                existing = self._reuse_image(content_hash)
+                if existing is None:
+                    raise
+                return self._image_result(existing)
             logger.info("Step 4/5: Success")
 
             # Step 5: Return result
             logger.info("Step 5/5: Image saved successfully. Returning result.")
-            return {
-                'success': True,
-                'image_id': file_id,
-                'grid_file_id': str(grid_file_id),
-                'original_size': len(image_bytes),
-                'optimized_size': len(optimized_bytes),
-                'dimensions': {'width': image.size[0], 'height': image.size[1]}
-            }
+            return self._image_result(image_doc)
             
         except Exception as e:
             # Log the full traceback for detailed debugging
             import traceback
             logger.error(f"Error saving team image: {e}\n{traceback.format_exc()}")
             return None
+
+    def store_processed_images(self, items: List[tuple]) -> List[Optional[Dict]]:
+        """
+        Lưu một lô ảnh đã xử lý: items là các (processed, team_name, team_id).
+        File GridFS ghi từng ảnh, metadata ghi chung một insert_many. Ảnh trùng nội dung
+        (trong lô hoặc với ảnh đã lưu) dùng chung một image_id, không ghi thêm file.
+        Returns:
+            Kết quả của từng ảnh theo thứ tự (None nếu ảnh đó lỗi)
+        """
+        if not self.is_connected():
+            logger.error("Cannot save images: Not connected to database")
+            return [None] * len(items)
+
+        images = self.db[COLLECTIONS['images']]
+        hashes = [image_content_hash(processed) for processed, _, _ in items]
+        try:
+            known = {doc['content_hash'] for doc in images.find({'content_hash': {'$in': list(set(hashes))}},
+                                                                  {'content_hash': 1})}
+        except Exception as e:
+            logger.error(f"Error looking up stored images: {e}")
+            return [None] * len(items)
+
+        new_docs = {}   # content_hash -> document mới của lô
+        reuses = set()   # content_hash của ảnh đã lưu được dùng lại
+        failed = set()
+        for (processed, team_name, team_id), content_hash in zip(items, hashes):
+            if content_hash in known:
+                reuses.add(content_hash)
+            elif content_hash not in new_docs and content_hash not in failed:
+                try:
+                    new_docs[content_hash] = self._put_image_files(processed, team_name, team_id)
+                except Exception as e:
+                    logger.error(f"Error saving image for '{team_name}': {e}")
+                    failed.add(content_hash)
+
+        stored = list(new_docs.values())
+        try:
+            if stored:
+                images.insert_many(stored, ordered=False)
+        except BulkWriteError as e:
+            # ordered=False: các document khác trong lô vẫn được ghi
+            logger.error(f"Error saving image metadata batch: {e.details.get('writeErrors')}")
+            for error in e.details.get('writeErrors', []):
+                image_doc = stored[error['index']]
+                del new_docs[image_doc['content_hash']]
+                self._delete_image_files(image_doc)
+                if error.get('code') == 11000:
+                    # Nội dung vừa được lưu bởi upload khác: dùng ảnh đó
+                    reuses.add(image_doc['content_hash'])
+        except Exception as e:
+            logger.error(f"Error saving image metadata batch: {e}")
+            new_docs = {}
+
+        resolved = dict(new_docs)
+        for content_hash in reuses:
+            try:
+                existing = self._reuse_image(content_hash)
+            except Exception as e:
+                logger.error(f"Error reusing stored image {content_hash}: {e}")
+                existing = None
+            if existing is not None:
+                resolved[content_hash] = existing
+
+        results = [self._image_result(resolved[content_hash]) if content_hash in resolved else None
+                   for content_hash in hashes]
+        logger.info(f"Stored {sum(result is not None for result in results)}/{len(items)} images in one batch "
+                    f"({len(new_docs)} new, {len(reuses)} reused)")
+        return results
+
+    def _put_image_files(self, processed: Dict, team_name: str, team_id: str = None,
+                         image_id: str = None) -> Dict:
+        """Step 3: ghi ảnh gốc + biến thể vào GridFS, trả về document metadata cho collection images"""
+        mime_type = processed['mime_type']
+        optimized_bytes = processed['optimized']
+        dimensions = processed['dimensions']
+        variants = processed['variants']
+
+        logger.info("Step 3/5: Saving image to GridFS...")
+        file_id = image_id or str(uuid.uuid4())
+        filename = f"{file_id}.{mime_type.split('/')[1]}"
+        
+        grid_file_id = self.fs.put(
+            optimized_bytes,
+            filename=filename,
+            content_type=mime_type,
+            team_name=team_name,
+            team_id=team_id,
+            upload_date=datetime.utcnow(),
+            original_size=processed['original_size'],
+            optimized_size=len(optimized_bytes),
+            dimensions=dimensions
+        )
+        logger.info(f"Step 3/5: Success, GridFS file ID: {grid_file_id}")
+
+        variant_docs = {}
+        stored = {}
+        for name, variant in variants.items():
+            files = {}
+            for variant_mime, data in variant['formats'].items():
+                # Biến thể trùng kích thước dùng chung một file GridFS
+                if id(data) not in stored:
+                    stored[id(data)] = self.fs.put(
+                        data,
+                        filename=f"{file_id}_{name}.{variant_mime.split('/')[1]}",
+                        content_type=variant_mime,
+                        image_id=file_id,
+                        variant=name,
+                        upload_date=datetime.utcnow()
+                    )
+                files[variant_mime] = {'grid_file_id': stored[id(data)], 'size': len(data)}
+            variant_docs[name] = {'width': variant['width'], 'height': variant['height'], 'files': files}
+        if variant_docs:
+            logger.info(f"Stored {len(stored)} variant files: "
+                        + ", ".join(f"{name} {doc['width']}x{doc['height']}" for name, doc in variant_docs.items()))
+
+        now = datetime.utcnow()
+        return {
+            'image_id': file_id,
+            'grid_file_id': grid_file_id,
+            'content_hash': image_content_hash(processed),
+            # Chưa team / judge nào dùng; ảnh không được gắn sẽ bị gc xóa sau IMAGE_GC_MIN_AGE
+            'ref_count': 0,
+            'team_id': team_id,
+            'team_name': team_name,
+            'filename': filename,
+            'mime_type': mime_type,
+            'original_size': processed['original_size'],
+            'optimized_size': len(optimized_bytes),
+            'dimensions': dimensions,
+            'variants': variant_docs,
+            'created_at': now,
+            'updated_at': now
+        }
+
+    @staticmethod
+    def _image_result(image_doc: Dict) -> Dict:
+        """Kết quả trả về cho client sau khi lưu ảnh"""
+        return {
+            'success': True,
+            'image_id': image_doc['image_id'],
+            'grid_file_id': str(image_doc['grid_file_id']),
+            'original_size': image_doc['original_size'],
+            'optimized_size': image_doc['optimized_size'],
+            'dimensions': image_doc['dimensions'],
+            'variants': {name: {'width': doc['width'], 'height': doc['height'], 'formats': list(doc['files'])}
+                         for name, doc in image_doc['variants'].items()}
+        }
     
-    def get_team_image(self, image_id: str) -> Optional[Dict]:
+    def _reuse_image(self, content_hash: str) -> Optional[Dict]:
+        """
+        Ảnh đã lưu có cùng nội dung (None nếu chưa có). updated_at được làm mới để
+        gc không xóa ảnh trước khi team kịp dùng.
+        """
+        return self.db[COLLECTIONS['images']].find_one_and_update(
+            {'content_hash': content_hash},
+            {'$set': {'updated_at': datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def _image_reference(item) -> Optional[str]:
+        """image_id mà một team / judge đang dùng (None nếu không dùng ảnh đã lưu)"""
+        if not isinstance(item, dict):
+            return None
+        image_id = item.get('image_id')
+        if not image_id:
+            # Dữ liệu cũ chỉ lưu imagePath = /api/image/<image_id>
+            path = item.get('imagePath') or item.get('image') or ''
+            if isinstance(path, str) and path.startswith('/api/image/'):
+                image_id = path[len('/api/image/'):].split('?')[0]
+        return image_id or None
+
+    @classmethod
+    def _reference_counts(cls, items: Iterable) -> Counter:
+        """image_id -> số phần tử (team / judge) trong items đang dùng ảnh đó"""
+        return Counter(image_id for image_id in map(cls._image_reference, items) if image_id)
+
+    def _update_image_references(self, old_references: Counter, new_references: Counter):
+        """
+        Cập nhật ref_count theo số team / judge dùng mỗi ảnh trước và sau một lần ghi.
+        Tăng trước rồi mới giảm; ảnh hết tham chiếu bị xóa. Nếu lỗi, ref_count lệch
+        sẽ được sửa bởi maintenance.py gc.
+        """
+        changes = Counter(new_references)
+        changes.subtract(old_references)
+        try:
+            increments = [UpdateOne({'image_id': image_id}, {'$inc': {'ref_count': delta}})
+                          for image_id, delta in changes.items() if delta > 0]
+            if increments:
+                self.db[COLLECTIONS['images']].bulk_write(increments, ordered=False)
+            for image_id, delta in changes.items():
+                if delta < 0 and self._release_image(image_id, -delta):
+                    logger.info(f"Deleted image {image_id}: no team / judge uses it anymore")
+        except Exception as e:
+            logger.warning(f"Could not update image ref_count ({dict(changes)}): {e}")
+
+    def _release_image(self, image_id: str, count: int = 1) -> bool:
+        """
+        Bỏ `count` tham chiếu tới ảnh; khi không còn tham chiếu thì xóa metadata và
+        file GridFS. Ảnh vừa được upload / dùng lại trong IMAGE_GC_MIN_AGE giây gần nhất
+        được giữ lại cho gc (một team khác có thể sắp lưu image_id đó). Returns True nếu ảnh đã bị xóa.
+        """
+        images = self.db[COLLECTIONS['images']]
+        # Ảnh cũ không có ref_count: $inc tạo -1 -> xóa như trước
+        image_doc = images.find_one_and_update({'image_id': image_id}, {'$inc': {'ref_count': -count}},
+                                               return_document=ReturnDocument.AFTER)
+        if image_doc is None or image_doc['ref_count'] > 0:
+            return False
+        # Chỉ xóa nếu chưa có team nào vừa dùng lại ảnh (ref_count vẫn <= 0) và không có upload mới
+        cutoff = datetime.utcnow() - timedelta(seconds=IMAGE_GC_MIN_AGE)
+        image_doc = images.find_one_and_delete({
+            'image_id': image_id,
+            'ref_count': {'$lte': 0},
+            '$or': [{'updated_at': {'$lt': cutoff}}, {'updated_at': None}]
+        })
+        if image_doc is None:
+            logger.info(f"Image {image_id} has no references but was uploaded recently, leaving it to gc")
+            return False
+        self._delete_image_files(image_doc)
+        return True
+
+    def _delete_image_files(self, image_doc: Dict):
+        """Xóa ảnh gốc + biến thể trong GridFS và bỏ ảnh khỏi cache"""
+        try:
+            self.fs.delete(image_doc['grid_file_id'])
+        except Exception as e:
+            logger.warning(f"Could not delete image file {image_doc['grid_file_id']}: {e}")
+        self._delete_variant_files(image_doc)
+        self.image_cache.discard(image_doc['image_id'])
+        # Báo cho các process khác (CACHE_SYNC_MODE) xóa ảnh khỏi cache
+        self.invalidate_cache(COLLECTIONS['images'])
+
+    @staticmethod
+    def _image_file_ids(image_doc: Dict) -> set:
+        """id file GridFS của ảnh gốc và mọi biến thể"""
+        file_ids = {image_doc['grid_file_id']}
+        for variant in (image_doc.get('variants') or {}).values():
+            file_ids.update(entry['grid_file_id'] for entry in variant['files'].values())
+        return file_ids
+
+    def _image_references(self) -> Counter:
+        """
+        image_id -> số team / judge đang dùng ảnh đó, đọc thẳng từ database (không qua cache).
+        Không bắt lỗi: get_teams / get_data trả về [] khi lỗi sẽ làm mọi ảnh trông như không ai dùng.
+        """
+        projection = {'_id': 0, 'image_id': 1, 'imagePath': 1, 'image': 1}
+        teams = list(self.db[COLLECTIONS['teams']].find({}, projection))
+        judges = list(self.db[COLLECTIONS['judges']].find({}, projection))
+        return self._reference_counts(teams + judges)
+
+    def collect_garbage(self, dry_run: bool = False, min_age: float = IMAGE_GC_MIN_AGE) -> Optional[Dict]:
+        """
+        Đếm lại tham chiếu của từng ảnh từ teams / judges: sửa ref_count lệch, xóa ảnh
+        không còn ai dùng và file GridFS mồ côi. Ảnh / file được dùng tới trong
+        min_age giây gần nhất được bỏ qua (upload chưa gắn vào team).
+        Returns:
+            Thống kê {'images', 'deleted_images', 'ref_counts_fixed', 'orphan_files', 'freed_bytes'} hoặc None nếu lỗi
+            (không đọc được teams / judges thì dừng, không xóa gì)
+        """
+        if not self.is_connected():
+            logger.error("Cannot collect garbage: Not connected to database")
+            return None
+
+        try:
+            references = self._image_references()
+            cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+            images = self.db[COLLECTIONS['images']]
+            files = self.db[f"{GRIDFS_BUCKET}.files"]
+            stats = {'images': 0, 'deleted_images': 0, 'ref_counts_fixed': 0, 'orphan_files': 0, 'freed_bytes': 0}
+
+            live_files = set()
+            garbage = []
+            for image_doc in images.find({}, {'image_id': 1, 'grid_file_id': 1, 'variants': 1, 'ref_count': 1,
+                                              'created_at': 1, 'updated_at': 1}):
+                stats['images'] += 1
+                count = references[image_doc['image_id']]
+                touched = image_doc.get('updated_at') or image_doc.get('created_at')
+                if touched is not None and touched >= cutoff:
+                    live_files |= self._image_file_ids(image_doc)
+                elif count == 0:
+                    garbage.append(image_doc)
+                else:
+                    live_files |= self._image_file_ids(image_doc)
+                    if image_doc.get('ref_count') != count:
+                        stats['ref_counts_fixed'] += 1
+                        if not dry_run:
+                            # updated_at không đổi = không có upload nào vừa dùng lại ảnh
+                            images.update_one({'_id': image_doc['_id'], 'updated_at': image_doc.get('updated_at')},
+                                              {'$set': {'ref_count': count}})
+
+            garbage_files = set()
+            for image_doc in garbage:
+                file_ids = list(self._image_file_ids(image_doc))
+                garbage_files.update(file_ids)
+                size = sum(f.get('length', 0) for f in files.find({'_id': {'$in': file_ids}}, {'length': 1}))
+                if not dry_run:
+                    deleted = images.find_one_and_delete({'_id': image_doc['_id'],
+                                                          'updated_at': image_doc.get('updated_at')})
+                    if deleted is None:
+                        live_files.update(file_ids)
+                        continue
+                    self._delete_image_files(deleted)
+                stats['deleted_images'] += 1
+                stats['freed_bytes'] += size
+
+            # File GridFS không thuộc ảnh nào (vd: server dừng giữa lúc ghi ảnh)
+            for grid_file in files.find({'uploadDate': {'$lt': cutoff}}, {'_id': 1, 'length': 1}):
+                if grid_file['_id'] in live_files or grid_file['_id'] in garbage_files:
+                    continue
+                stats['orphan_files'] += 1
+                stats['freed_bytes'] += grid_file.get('length', 0)
+                if not dry_run:
+                    self.fs.delete(grid_file['_id'])
+
+            logger.info(f"Image GC{' (dry run)' if dry_run else ''}: {stats}")
+            return stats
+        except Exception as e:
+            logger.error(f"Error collecting image garbage: {e}")
+            return None
+
+    def _delete_variant_files(self, image_doc: Dict):
+        """Xóa các file GridFS của biến thể ảnh (thumb / medium / full)"""
+        grid_file_ids = {
+            entry['grid_file_id']
+            for variant in (image_doc.get('variants') or {}).values()
+            for entry in variant['files'].values()
+        }
+        for grid_file_id in grid_file_ids:
+            try:
+                self.fs.delete(grid_file_id)
+            except Exception as e:
+                logger.warning(f"Could not delete image variant {grid_file_id}: {e}")
+
+    @staticmethod
+    def _select_variant(image_doc: Dict, size: str = None, accept_webp: bool = False):
+        """
+        Chọn biến thể theo ?size= và header Accept (ảnh cũ không có variants).
+        Returns:
+            (file entry của biến thể hoặc None = dùng ảnh gốc, content_type, dimensions, tên biến thể)
+        """
+        variant = (image_doc.get('variants') or {}).get(size or 'full')
+        if variant:
+            files = variant['files']
+            if accept_webp and 'image/webp' in files:
+                content_type = 'image/webp'
+            else:
+                content_type = next((mime for mime in files if mime != 'image/webp'), None)
+            if content_type:
+                dimensions = {'width': variant['width'], 'height': variant['height']}
+                return files[content_type], content_type, dimensions, size or 'full'
+            # 'full' không có fallback riêng: dùng ảnh gốc
+        return None, image_doc['mime_type'], image_doc['dimensions'], None
+
+    def get_team_image(self, image_id: str, size: str = None, accept_webp: bool = False) -> Optional[Dict]:
+        """
+        Lấy ảnh team từ GridFS theo image_id (đọc toàn bộ bytes vào 'data')
+        Args:
+            size: 'thumb', 'medium' hoặc 'full' (mặc định: ảnh gốc đã tối ưu)
+            accept_webp: trình duyệt nhận WebP - ưu tiên bản WebP của biến thể
+        """
+        image_info = self.open_team_image(image_id, size, accept_webp)
+        if image_info and 'stream' in image_info:
+            image_info = dict(image_info)
+            image_info['data'] = image_info.pop('stream').read()
+        return image_info
+
+    def open_team_image(self, image_id: str, size: str = None, accept_webp: bool = False) -> Optional[Dict]:
         """
-        Lấy ảnh team từ GridFS theo image_id
+        Mở ảnh team để gửi cho client.
+        Ảnh nhỏ (<= IMAGE_CACHE_MAX_ITEM_BYTES) được đọc hết và cache, trả về trong 'data';
+        ảnh lớn hơn trả về 'stream' (GridOut, hỗ trợ seek) để gửi dần từng chunk.
+        Luôn có 'length', 'etag' và 'last_modified'.
         """
+        # Ảnh đã lưu không bao giờ bị sửa (chỉ bị xóa), nên cache theo id + biến thể là an toàn
+        cache_key = (image_id, size or 'full', bool(accept_webp))
+        cached = self.image_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         if not self.is_connected():
             logger.error("Cannot get image: Not connected to database")
             return None
             
         try:
-            logger.info(f"🔍 Getting image {image_id} from MongoDB...")
-            
             # Lấy metadata từ collection 'images'
             image_doc = self.db[COLLECTIONS['images']].find_one({'image_id': image_id})
             
@@ -596,31 +1157,37 @@ class DatabaseManager:
                 logger.warning(f"⚠️  Image metadata not found for ID: {image_id}")
                 return None
                 
-            logger.info(f"📋 Image metadata found:")
-            logger.info(f"   - Filename: {image_doc['filename']}")
-            logger.info(f"   - MIME type: {image_doc['mime_type']}")
-            logger.info(f"   - Original size: {image_doc['original_size']} bytes")
-            logger.info(f"   - Optimized size: {image_doc['optimized_size']} bytes")
-            logger.info(f"   - Dimensions: {image_doc['dimensions']['width']}x{image_doc['dimensions']['height']}")
-            
-            # Lấy dữ liệu ảnh từ GridFS
-            grid_file = self.fs.get(image_doc['grid_file_id'])
-            image_data = grid_file.read()
-            
-            logger.info(f"📤 Retrieved image data: {len(image_data)} bytes")
-            
-            if len(image_data) == 0:
+            entry, content_type, dimensions, variant_name = self._select_variant(image_doc, size, accept_webp)
+            grid_file_id = entry['grid_file_id'] if entry else image_doc['grid_file_id']
+
+            grid_file = self.fs.get(grid_file_id)
+            if grid_file.length == 0:
                 logger.error(f"❌ Image data is empty for ID: {image_id}")
                 return None
             
-            return {
-                'data': image_data,
-                'content_type': image_doc['mime_type'],
+            image_info = {
+                'content_type': content_type,
                 'filename': image_doc['filename'],
-                'size': len(image_data),
-                'dimensions': image_doc['dimensions'],
+                'size': grid_file.length,
+                'length': grid_file.length,
+                # Mỗi file GridFS là bất biến nên id của file là strong ETag
+                'etag': f'"{grid_file_id}"',
+                'last_modified': grid_file.upload_date,
+                'dimensions': dimensions,
+                'variant': variant_name,
+                'has_variants': bool(image_doc.get('variants')),
                 'team_name': image_doc['team_name']
             }
+
+            if grid_file.length > self.image_cache.max_item_bytes:
+                logger.debug(f"Streaming image {image_id} ({size or 'full'}): {grid_file.length} bytes")
+                image_info['stream'] = grid_file
+                return image_info
+
+            image_info['data'] = grid_file.read()
+            logger.debug(f"Retrieved image {image_id} ({size or 'full'}): {grid_file.length} bytes, {content_type}")
+            self.image_cache.put(cache_key, image_info, grid_file.length)
+            return image_info
             
         except Exception as e:
             logger.error(f"❌ Error getting team image {image_id}: {e}")
@@ -631,18 +1198,28 @@ class DatabaseManager:
     # =============== GENERIC OPERATIONS ===============
     
     def get_data(self, collection_name: str) -> List[Dict]:
-        """Lấy dữ liệu từ collection"""
-        if not self.is_connected():
-            return []
-        
+        """
+        Lấy dữ liệu từ collection (có cache).
+        Kết quả được dùng chung giữa các request - không sửa trực tiếp list trả về.
+        """
         # Kiểm tra collection có tồn tại trong cấu hình không
         if collection_name not in COLLECTIONS.values():
             logger.warning(f"Collection {collection_name} not found in configuration")
             return []
         
+        cache_key = ('data', collection_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            return []
+        
+        version = self._versions.get(collection_name, 0)
         try:
             # Convert datetime objects to strings for JSON serialization
-            data = list(self.db[collection_name].find({}, {'_id': 0}))
+            # Sắp xếp theo _pos để giữ đúng thứ tự danh sách đã lưu bằng save_data
+            data = list(self.db[collection_name].find({}, {'_id': 0, '_pos': 0}).sort([('_pos', 1), ('_id', 1)]))
             # Process data to make it JSON serializable
             processed_data = []
             for item in data:
@@ -656,13 +1233,97 @@ class DatabaseManager:
                         if hasattr(value, 'isoformat'):  # datetime objects
                             item[key] = value.isoformat()
                     processed_data.append(item)
+            self._cache_put(cache_key, processed_data, version)
             return processed_data
         except Exception as e:
             logger.error(f"Error getting data from {collection_name}: {e}")
             return []
     
-    def save_data(self, collection_name: str, data: List[Dict]) -> bool:
-        """Lưu dữ liệu vào collection"""
+    # Các trường do save_data tự quản lý, không tính khi so sánh nội dung
+    _META_FIELDS = ('_id', '_pos', 'updated_at')
+
+    @staticmethod
+    def _document_key(doc: Dict):
+        """Khóa dùng để ghép document cũ với phần tử mới khi tính diff"""
+        if 'id' in doc:
+            field, value = 'id', doc['id']
+        elif set(doc) <= {'value'}:
+            field, value = 'value', doc.get('value')
+        else:
+            field, value = 'content', doc
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+        return field, type(value).__name__, value
+
+    @staticmethod
+    def _kept_positions(positions: List) -> set:
+        """
+        Chọn các phần tử giữ nguyên _pos: dãy con tăng dài nhất (LIS) của các _pos cũ.
+        Các phần tử còn lại mới cần ghi lại vị trí.
+        """
+        tails, tail_index, parent = [], [], [None] * len(positions)
+        for i, pos in enumerate(positions):
+            if pos is None:
+                continue
+            j = bisect.bisect_left(tails, pos)
+            parent[i] = tail_index[j - 1] if j > 0 else None
+            if j == len(tails):
+                tails.append(pos)
+                tail_index.append(i)
+            else:
+                tails[j] = pos
+                tail_index[j] = i
+        kept = set()
+        i = tail_index[-1] if tail_index else None
+        while i is not None:
+            kept.add(i)
+            i = parent[i]
+        return kept
+
+    @classmethod
+    def _new_positions(cls, old_positions: List) -> List[float]:
+        """
+        _pos mới cho danh sách đã ghép với document cũ (None = phần tử mới).
+        Phần tử thuộc LIS giữ nguyên _pos, phần tử khác được chèn vào giữa hai vị trí giữ nguyên.
+        Khi hết độ chính xác float (chèn vào giữa nhiều lần, trung điểm trùng với một đầu)
+        thì đánh số lại cả danh sách 0, 1, 2, ... - save_data ghi lại _pos mọi phần tử trong cùng lần ghi.
+        """
+        kept = cls._kept_positions(old_positions)
+        new_positions = [None] * len(old_positions)
+        next_kept = None
+        for i in range(len(old_positions) - 1, -1, -1):
+            if i in kept:
+                next_kept = old_positions[i]
+                new_positions[i] = next_kept
+            else:
+                new_positions[i] = next_kept  # tạm lưu vị trí giữ nguyên kế tiếp
+        previous = None
+        for i in range(len(old_positions)):
+            if i in kept:
+                previous = new_positions[i]
+                continue
+            upper = new_positions[i]
+            if previous is None and upper is None:
+                new_positions[i] = float(i)
+            elif previous is None:
+                new_positions[i] = upper - 1
+            elif upper is None:
+                new_positions[i] = previous + 1
+            else:
+                new_positions[i] = (previous + upper) / 2
+            if ((previous is not None and new_positions[i] <= previous)
+                    or (upper is not None and new_positions[i] >= upper)):
+                return [float(j) for j in range(len(old_positions))]
+            previous = new_positions[i]
+        return new_positions
+
+    def save_data(self, collection_name: str, data: List[Dict], stats: Optional[Dict] = None) -> bool:
+        """
+        Lưu dữ liệu vào collection.
+        So sánh với dữ liệu hiện có và chỉ gửi các thao tác insert/update/delete
+        cần thiết trong một lần bulk_write (collection không bao giờ bị xóa trống).
+        stats: dict nhận số thao tác đã gửi (operations / inserted / updated / moved / deleted).
+        """
         if not self.is_connected():
             logger.error("Cannot save data: Not connected to database")
             return False
@@ -673,32 +1334,85 @@ class DatabaseManager:
             return False
         
         try:
-            # Xóa dữ liệu cũ
-            self.db[collection_name].delete_many({})
-            
             # Process data to make it BSON serializable
             processed_data = []
             for item in data:
                 if isinstance(item, dict):
-                    processed_item = item.copy()
+                    processed_item = {k: v for k, v in item.items() if k not in self._META_FIELDS}
                     # Process datetime objects
                     for key, value in processed_item.items():
                         if hasattr(value, 'isoformat'):  # datetime objects
                             processed_item[key] = value.isoformat()
-                    processed_item['updated_at'] = datetime.utcnow()
                     processed_data.append(processed_item)
                 else:
                     # Handle primitive values (numbers, strings, etc.) by wrapping in a document
-                    processed_data.append({
-                        'value': item,
-                        'updated_at': datetime.utcnow()
-                    })
-            
-            # Lưu dữ liệu mới
-            if processed_data:
-                self.db[collection_name].insert_many(processed_data)
-            
-            logger.info(f"Saved {len(processed_data)} items to {collection_name}")
+                    processed_data.append({'value': item})
+            
+            collection = self.db[collection_name]
+            with self._write_locks[collection_name]:
+                # Ghép phần tử mới với document cũ theo khóa (id / value / nội dung)
+                existing = defaultdict(deque)
+                old_contents = []
+                for doc in collection.find({}).sort([('_pos', 1), ('_id', 1)]):
+                    content = {k: v for k, v in doc.items() if k not in self._META_FIELDS}
+                    existing[self._document_key(content)].append((doc, content))
+                    old_contents.append(content)
+
+                matches = []
+                for item in processed_data:
+                    bucket = existing.get(self._document_key(item))
+                    matches.append(bucket.popleft() if bucket else None)
+
+                # Tính _pos mới: giữ nguyên vị trí cũ nếu thứ tự không đổi
+                new_positions = self._new_positions([match[0].get('_pos') if match else None for match in matches])
+
+                now = datetime.utcnow()
+                operations = []
+                inserted = updated = moved = deleted = 0
+                for item, match, pos in zip(processed_data, matches, new_positions):
+                    if match is None:
+                        operations.append(InsertOne({**item, '_pos': pos, 'updated_at': now}))
+                        inserted += 1
+                        continue
+                    doc, content = match
+                    if content != item:
+                        operations.append(ReplaceOne({'_id': doc['_id']}, {**item, '_pos': pos, 'updated_at': now}))
+                        updated += 1
+                    elif doc.get('_pos') != pos:
+                        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'_pos': pos}}))
+                        moved += 1
+
+                # Document cũ không còn trong danh sách mới
+                for bucket in existing.values():
+                    for doc, _ in bucket:
+                        operations.append(DeleteOne({'_id': doc['_id']}))
+                        deleted += 1
+
+                if operations:
+                    try:
+                        collection.bulk_write(operations, ordered=False)
+                    except BulkWriteError as bwe:
+                        # Giá trị trùng trong danh sách 'đã dùng' (unique index) - bỏ qua bản trùng
+                        errors = bwe.details.get('writeErrors', [])
+                        if not errors or any(err.get('code') != 11000 for err in errors):
+                            raise
+                        logger.warning(f"Skipped {len(errors)} duplicate values in {collection_name}")
+
+                if collection_name == COLLECTIONS['judges']:
+                    # Judge đổi / bỏ ảnh: cập nhật ref_count của ảnh
+                    self._update_image_references(self._reference_counts(old_contents),
+                                                  self._reference_counts(processed_data))
+
+            if stats is not None:
+                stats.update({
+                    'operations': len(operations),
+                    'inserted': inserted,
+                    'updated': updated,
+                    'moved': moved,
+                    'deleted': deleted
+                })
+            logger.info(f"Saved {len(processed_data)} items to {collection_name} "
+                        f"({len(operations)} ops: +{inserted} ~{updated} >{moved} -{deleted})")
             return True
             
         except Exception as e:
@@ -706,7 +1420,162 @@ class DatabaseManager:
             import traceback
             logger.error(traceback.format_exc())
             return False
+        finally:
+            self.invalidate_cache(collection_name)
     
+    def import_documents(self, collection_name: str, batches: Iterable[List[Dict]],
+                         replace: bool = False) -> Optional[Dict]:
+        """
+        Ghi đè / thêm document theo trường 'id', mỗi lô một bulk_write (dùng cho nhập CSV).
+        batches được đọc dần nên dữ liệu nguồn không cần nằm hết trong bộ nhớ.
+        Document nhập có _pos lớn hơn mọi document cũ (theo thứ tự nhập);
+        replace=True xóa các document cũ không có trong lần nhập sau khi ghi xong
+        (không xóa gì nếu không có document nào được nhập).
+        Returns:
+            {'inserted', 'updated', 'deleted', 'batches'} hoặc None nếu lỗi
+            (lỗi giữa chừng: các lô đã ghi vẫn còn, document cũ chưa bị xóa)
+        """
+        if not self.is_connected():
+            logger.error("Cannot import data: Not connected to database")
+            return None
+
+        if collection_name not in COLLECTIONS.values():
+            logger.error(f"Collection {collection_name} not found in configuration")
+            return None
+
+        collection = self.db[collection_name]
+        inserted = updated = deleted = batch_count = 0
+        try:
+            with self._write_locks[collection_name]:
+                last = collection.find_one({'_pos': {'$ne': None}}, {'_pos': 1}, sort=[('_pos', -1)])
+                base = float(last['_pos']) + 1 if last else 0.0
+                pos = base
+
+                for batch in batches:
+                    now = datetime.utcnow()
+                    operations = []
+                    for doc in batch:
+                        item = {k: v for k, v in doc.items() if k not in self._META_FIELDS}
+                        operations.append(ReplaceOne({'id': item['id']}, {**item, '_pos': pos, 'updated_at': now},
+                                                     upsert=True))
+                        pos += 1
+                    if not operations:
+                        continue
+                    result = collection.bulk_write(operations, ordered=False)
+                    inserted += result.upserted_count
+                    updated += result.matched_count
+                    batch_count += 1
+
+                if replace and batch_count:
+                    # Document được nhập đều có _pos >= base
+                    deleted = collection.delete_many({'$or': [{'_pos': {'$lt': base}},
+                                                              {'_pos': None}]}).deleted_count
+
+            stats = {'inserted': inserted, 'updated': updated, 'deleted': deleted, 'batches': batch_count}
+            logger.info(f"Imported into {collection_name} in {batch_count} batches "
+                        f"(+{inserted} ~{updated} -{deleted})")
+            return stats
+
+        except Exception as e:
+            logger.error(f"Error importing data into {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def count_documents(self, collection_name: str) -> Optional[int]:
+        """Số document trong collection (None nếu lỗi)"""
+        if not self.is_connected():
+            return None
+        try:
+            return self.db[collection_name].count_documents({})
+        except Exception as e:
+            logger.error(f"Error counting {collection_name}: {e}")
+            return None
+
+    # =============== LOGIN STATUS ===============
+
+    def get_login_status(self) -> Dict:
+        """Trạng thái đăng nhập (lưu trong collection users, có cache)"""
+        cache_key = ('login', COLLECTIONS['users'])
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            return {"logged_in": False}
+
+        version = self._versions.get(COLLECTIONS['users'], 0)
+        login_doc = self.db[COLLECTIONS['users']].find_one({'type': 'login_status'})
+        status = {"logged_in": login_doc['logged_in'] if login_doc else False}
+        self._cache_put(cache_key, status, version)
+        return status
+
+    def set_login_status(self, logged_in: bool) -> bool:
+        """Cập nhật trạng thái đăng nhập"""
+        if not self.is_connected():
+            return False
+
+        try:
+            self.db[COLLECTIONS['users']].update_one(
+                {'type': 'login_status'},
+                {'$set': {'logged_in': logged_in, 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving login status: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['users'])
+
+    # =============== USED ITEM OPERATIONS ===============
+
+    def add_used_item(self, collection_name: str, value: Any) -> Optional[bool]:
+        """
+        Đánh dấu một giá trị là 'đã dùng' (kiểu $addToSet, nguyên tử).
+        Returns:
+            True nếu vừa thêm, False nếu đã có sẵn, None nếu lỗi
+        """
+        if not self.is_connected():
+            logger.error("Cannot add used item: Not connected to database")
+            return None
+        
+        try:
+            result = self.db[collection_name].update_one(
+                {'value': value},
+                # _pos theo thời gian để phần tử mới luôn nằm cuối danh sách
+                {'$setOnInsert': {'value': value, '_pos': time.time(), 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            return result.upserted_id is not None
+        except DuplicateKeyError:
+            # Máy khác vừa thêm cùng giá trị
+            return False
+        except Exception as e:
+            logger.error(f"Error adding {value!r} to {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def remove_used_item(self, collection_name: str, value: Any) -> Optional[bool]:
+        """
+        Bỏ đánh dấu 'đã dùng' của một giá trị.
+        Returns:
+            True nếu đã xóa, False nếu không có, None nếu lỗi
+        """
+        if not self.is_connected():
+            logger.error("Cannot remove used item: Not connected to database")
+            return None
+        
+        try:
+            result = self.db[collection_name].delete_many({'value': value})
+            return result.deleted_count > 0
+        except Exception as e:
+            logger.error(f"Error removing {value!r} from {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
     def clear_all_data(self) -> bool:
         """Xóa tất cả dữ liệu"""
         if not self.is_connected():
@@ -742,119 +1611,42 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Error clearing data: {e}")
             return False
+        finally:
+            self.invalidate_cache()
     
     # =============== MIGRATION OPERATIONS ===============
+
+    def _replace_teams(self, teams_data: List[Dict]) -> None:
+        """Thay toàn bộ collection teams (dùng khi migrate)"""
+        collection = self.db[COLLECTIONS['teams']]
+        with self._write_locks[COLLECTIONS['teams']]:
+            old_references = self._reference_counts(collection.find({}, {'_id': 0, 'image_id': 1, 'imagePath': 1}))
+            collection.delete_many({})
+            logger.info("Cleared old team data.")
+            # === FIX: Dùng insert_many để chèn toàn bộ danh sách team đã xử lý ===
+            if teams_data:
+                collection.insert_many(teams_data)
+            self._update_image_references(old_references, self._reference_counts(teams_data))
     
-    def migrate_from_json_files(self) -> bool:
-        """Migrate dữ liệu từ các file JSON sang MongoDB, xử lý cấu trúc dữ liệu mới."""
+    def migrate_from_json_files(self, workers: int = 0, batch_size: int = MIGRATE_BATCH_SIZE,
+                                checkpoint_path: Optional[str] = MIGRATE_CHECKPOINT_PATH,
+                                on_progress=None) -> bool:
+        """
+        Migrate dữ liệu từ các file JSON sang database (xem json_migration.JsonMigration).
+        Ảnh cũ được xử lý song song trên `workers` process và ghi theo lô `batch_size` ảnh;
+        nếu bị ngắt, lần chạy sau đọc checkpoint_path và chỉ xử lý các ảnh còn thiếu.
+        Thống kê được lưu vào last_migration_stats.
+        """
         if not self.is_connected():
             return False
         
         try:
             logger.info("Starting migration from JSON files...")
-            
-            # --- 1. MIGRATE TEAMS (với ảnh) ---
-            teams_file = os.path.join(DB_DIRECTORY, 'teams.json')
-            if os.path.exists(teams_file):
-                # === LOGIC MỚI: XÓA DỮ LIỆU TEAM CŨ TRƯỚC KHI MIGRATE ===
-                self.db[COLLECTIONS['teams']].delete_many({})
-                logger.info("Cleared old team data.")
-
-                with open(teams_file, 'r', encoding='utf-8') as f:
-                    teams_data = json.load(f)
-                
-                for team in teams_data:
-                    # Tìm ảnh cục bộ (nếu có) và upload lên GridFS
-                    image_path_str = team.get('imagePath', '')
-                    # === LOGIC MỚI: Chấp nhận cả đường dẫn 'images/' và '../../' ===
-                    is_local_path = isinstance(image_path_str, str) and (image_path_str.startswith('images/') or image_path_str.startswith('../../'))
-
-                    if is_local_path:
-                        old_image_path = os.path.normpath(os.path.join(application_path, image_path_str))
-                        if os.path.exists(old_image_path):
-                            try:
-                                with open(old_image_path, 'rb') as img_file:
-                                    image_bytes = img_file.read()
-                                
-                                ext = os.path.splitext(old_image_path)[1].lower()
-                                mime_type = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}.get(ext, 'image/jpeg')
-                                
-                                base64_data = base64.b64encode(image_bytes).decode('utf-8')
-                                image_data_url = f"data:{mime_type};base64,{base64_data}"
-                                
-                                result = self.save_team_image(image_data_url, team.get('name', 'Unknown Team'), team.get('team_id'))
-                                
-                                if result:
-                                    team['image_id'] = result['image_id']
-                                    # === FIX: Xóa imagePath cũ sau khi migrate thành công ===
-                                    if 'imagePath' in team:
-                                        del team['imagePath']
-                                    logger.info(f"Migrated image for team '{team.get('name')}'")
-                            except Exception as e:
-                                logger.error(f"Failed to migrate image for team '{team.get('name')}': {e}")
-
-                # === FIX: Dùng insert_many để chèn toàn bộ danh sách team đã xử lý ===
-                if teams_data:
-                    self.db[COLLECTIONS['teams']].insert_many(teams_data)
-                
-                logger.info("Migrated teams.json")
-
-            # --- 2. MIGRATE JUDGES (với ảnh và cấu trúc câu hỏi mới) ---
-            judges_file = os.path.join(DB_DIRECTORY, 'judges.json')
-            if os.path.exists(judges_file):
-                with open(judges_file, 'r', encoding='utf-8') as f:
-                    judges_data = json.load(f)
-                
-                for judge in judges_data:
-                    # Xử lý migrate ảnh (tương tự team)
-                    if 'image' in judge and isinstance(judge.get('image'), str) and judge['image'].startswith('images/'):
-                        old_image_path = os.path.join(application_path, judge['image'])
-                        if os.path.exists(old_image_path):
-                            try:
-                                with open(old_image_path, 'rb') as img_file:
-                                    image_bytes = img_file.read()
-                                ext = os.path.splitext(old_image_path)[1].lower()
-                                mime_type = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}.get(ext, 'image/jpeg')
-                                base64_data = base64.b64encode(image_bytes).decode('utf-8')
-                                image_data_url = f"data:{mime_type};base64,{base64_data}"
-
-                                # Tái sử dụng hàm save_team_image
-                                result = self.save_team_image(image_data_url, judge.get('name', 'Unknown Judge'), judge.get('id'))
-                                
-                                if result:
-                                    judge['image_id'] = result['image_id']
-                                    # Đổi tên 'image' thành 'image_id' và xóa đường dẫn cũ
-                                    if 'image' in judge: del judge['image']
-                                    logger.info(f"Migrated image for judge '{judge.get('name')}'")
-                            except Exception as e:
-                                logger.error(f"Failed to migrate image for judge '{judge.get('name')}': {e}")
-                
-                # Lưu dữ liệu judge đã được xử lý (dùng hàm save_data)
-                self.save_data(COLLECTIONS['judges'], judges_data)
-                logger.info("Migrated judges.json")
-
-            # --- 3. MIGRATE CÁC FILE CÒN LẠI (Đơn giản) ---
-            other_files = ['questions', 'used_judges', 'used_questions', 'used_final_questions']
-            for file_name in other_files:
-                file_path = os.path.join(DB_DIRECTORY, f"{file_name}.json")
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    self.save_data(COLLECTIONS[file_name], data)
-                    logger.info(f"Migrated {file_name}.json")
-
-            # --- 4. MIGRATE LOGIN STATUS (Trường hợp đặc biệt) ---
-            login_file = os.path.join(DB_DIRECTORY, 'login.json')
-            if os.path.exists(login_file):
-                with open(login_file, 'r', encoding='utf-8') as f:
-                    login_data = json.load(f)
-                self.db['users'].update_one(
-                    {'type': 'login_status'},
-                    {'$set': {'logged_in': login_data.get('logged_in', False), 'updated_at': datetime.utcnow()}},
-                    upsert=True
-                )
-                logger.info("Migrated login.json")
-
+            self.last_migration_stats = {}
+            migration = JsonMigration(self, DB_DIRECTORY, application_path, workers=workers,
+                                      batch_size=batch_size, checkpoint_path=checkpoint_path,
+                                      on_progress=on_progress)
+            self.last_migration_stats = migration.run()
             logger.info("Migration completed successfully!")
             return True
             
@@ -862,6 +1654,8 @@ class DatabaseManager:
             import traceback
             logger.error(f"Migration failed: {e}\n{traceback.format_exc()}")
             return False
+        finally:
+            self.invalidate_cache()
 
 # Singleton instance
 db_manager = DatabaseManager()
\ No newline at end of file
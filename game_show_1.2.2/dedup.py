@@ -0,0 +1,200 @@
+"""
+Phát hiện câu hỏi gần trùng (khác dấu câu, khoảng trắng, hoa / thường hoặc
+khác vài chữ) bằng MinHash + LSH.
+
+Nội dung câu hỏi được chuẩn hoá như search_index (không dấu, chỉ giữ chữ / số)
+rồi cắt thành shingle 2 từ liên tiếp. Chữ ký MinHash NUM_BINS giá trị được chia
+thành BANDS dải; hai câu chung ít nhất một dải mới được so Jaccard thật trên
+tập shingle, nên chi phí gần tuyến tính theo số câu hỏi thay vì so từng cặp.
+
+    detector = DuplicateDetector(threshold=0.8)
+    detector.add('q1', 'Những hành vi nào bị nghiêm cấm?')   # -> None
+    detector.add('q2', 'Những hành vi nào bị nghiêm cấm ?')  # -> ('q1', 1.0)
+    detector.clusters()                                      # -> [{'keys': ['q1', 'q2'], ...}]
+"""
+
+import random
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from search_index import tokenize
+
+# MinHash một hoán vị (one permutation hashing): hash của mỗi shingle rơi vào
+# một trong NUM_BINS ô, ô giữ giá trị nhỏ nhất; ô trống mượn giá trị của ô có dữ
+# liệu đầu tiên theo một thứ tự dò ngẫu nhiên cố định riêng cho từng ô (optimal
+# densification). Chữ ký chia thành BANDS dải x ROWS ô - cặp có Jaccard 0.8 được
+# so sánh với xác suất ~99%, Jaccard 0.7 ~93%
+BANDS = 6
+ROWS = 3
+NUM_BINS = BANDS * ROWS
+
+_HASH_MASK = (1 << 64) - 1
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def _probe_orders() -> List[List[int]]:
+    rng = random.Random(NUM_BINS)
+    orders = []
+    for index in range(NUM_BINS):
+        others = [other for other in range(NUM_BINS) if other != index]
+        rng.shuffle(others)
+        orders.append(others)
+    return orders
+
+
+_PROBE_ORDERS = _probe_orders()
+
+
+def shingles(text: str) -> FrozenSet[int]:
+    """Tập hash 64-bit các cặp 2 từ liên tiếp của nội dung đã chuẩn hoá (câu 1 từ: chính từ đó)"""
+    tokens = tokenize(text)
+    if len(tokens) < 2:
+        grams = tokens
+    else:
+        grams = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return frozenset((zlib.crc32(gram.encode('utf-8')) * _HASH_MULTIPLIER) & _HASH_MASK for gram in grams)
+
+
+def minhash(values: FrozenSet[int]) -> List[int]:
+    """Chữ ký MinHash NUM_BINS giá trị của một tập shingle khác rỗng"""
+    bins: List[Optional[int]] = [None] * NUM_BINS
+    for value in values:
+        index = value % NUM_BINS
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    if None not in bins:
+        return bins
+    signature = list(bins)
+    for index in range(NUM_BINS):
+        if bins[index] is None:
+            for other in _PROBE_ORDERS[index]:
+                if bins[other] is not None:
+                    signature[index] = bins[other]
+                    break
+    return signature
+
+
+def jaccard(first: FrozenSet[int], second: FrozenSet[int]) -> float:
+    if not first or not second:
+        return 0.0
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+class DuplicateDetector:
+    """
+    Thêm dần từng câu hỏi; add() trả về câu giống nhất đã thêm trước đó
+    (key, độ tương đồng) nếu đạt threshold. Câu rỗng / không có chữ bị bỏ qua.
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self._shingles: Dict[Hashable, FrozenSet[int]] = {}
+        self._buckets: List[Dict[Tuple[int, ...], List[Hashable]]] = [defaultdict(list) for _ in range(BANDS)]
+        # key -> [(key khác, độ tương đồng)]
+        self._pairs: Dict[Hashable, List[Tuple[Hashable, float]]] = defaultdict(list)
+        self.comparisons = 0
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def add(self, key: Hashable, text: str) -> Optional[Tuple[Hashable, float]]:
+        values = shingles(text or '')
+        if not values or key in self._shingles:
+            return None
+
+        signature = minhash(values)
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            bucket = buckets[tuple(signature[band * ROWS:(band + 1) * ROWS])]
+            candidates.update(bucket)
+            bucket.append(key)
+
+        best = None
+        for other in candidates:
+            self.comparisons += 1
+            similarity = jaccard(values, self._shingles[other])
+            if similarity >= self.threshold:
+                self._pairs[key].append((other, similarity))
+                self._pairs[other].append((key, similarity))
+                if best is None or similarity > best[1]:
+                    best = (other, similarity)
+
+        self._shingles[key] = values
+        return best
+
+    def clusters(self) -> List[Dict[str, Any]]:
+        """
+        Các nhóm câu gần trùng (thành phần liên thông của các cặp đạt threshold),
+        theo thứ tự thêm vào: [{'keys': [...], 'similarity': độ tương đồng thấp nhất trong nhóm}]
+        """
+        order = {key: position for position, key in enumerate(self._shingles)}
+        seen = set()
+        result = []
+        for key in self._shingles:
+            if key in seen or key not in self._pairs:
+                continue
+            members = []
+            lowest = 1.0
+            stack = [key]
+            seen.add(key)
+            while stack:
+                current = stack.pop()
+                members.append(current)
+                for other, similarity in self._pairs[current]:
+                    lowest = min(lowest, similarity)
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+            members.sort(key=order.__getitem__)
+            result.append({'keys': members, 'similarity': round(lowest, 3)})
+        return result
+
+
+def find_duplicates(questions: Iterable[Any], threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """
+    Nhóm câu hỏi gần trùng trong một list questions:
+    [{'similarity', 'questions': [{'index', 'id', 'part', 'question'}, ...]}]
+    """
+    items = list(questions)
+    detector = DuplicateDetector(threshold)
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            detector.add(index, str(item.get('question') or ''))
+
+    return [{
+        'similarity': cluster['similarity'],
+        'questions': [{'index': index, 'id': items[index].get('id'), 'part': items[index].get('part'),
+                       'question': items[index].get('question')} for index in cluster['keys']],
+    } for cluster in detector.clusters()]
+
+
+class DuplicateReport:
+    """
+    Báo cáo câu gần trùng cho GET /api/questions/duplicates: chỉ tính lại khi
+    list questions dùng chung (load_questions()) hoặc threshold đổi.
+    """
+
+    def __init__(self, load_questions: Callable[[], Any]):
+        self._load_questions = load_questions
+        self._cached: Optional[Tuple[Any, float, List[Dict[str, Any]]]] = None
+
+    def report(self, threshold: float) -> Dict[str, Any]:
+        questions = self._load_questions() or []
+        cached = self._cached
+        if cached is not None and cached[0] is questions and cached[1] == threshold:
+            clusters = cached[2]
+        else:
+            clusters = find_duplicates(questions, threshold)
+            self._cached = (questions, threshold, clusters)
+        return {
+            'threshold': threshold,
+            'questions': len(questions),
+            'clusters': len(clusters),
+            'duplicates': sum(len(cluster['questions']) - 1 for cluster in clusters),
+            'groups': clusters,
+        }
@@ -0,0 +1,877 @@
+"""
+Shared HTTP helpers for server_mongodb.py and server_python.py
+"""
+
+import socketserver
+import selectors
+import socket
+import threading
+import time
+import logging
+import hashlib
+import json
+import queue
+import calendar
+import email.utils
+import os
+import re
+import urllib.parse
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli  # Tùy chọn: pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHTTPServer(socketserver.TCPServer):
+    """
+    TCPServer xử lý mỗi kết nối trên một thread pool có giới hạn.
+
+    Tối đa `workers` kết nối được xử lý song song, thêm `queue_size` kết nối
+    chờ trong hàng đợi. Khi pool đầy, vòng accept sẽ dừng lại và các kết nối
+    mới chờ trong backlog của hệ điều hành thay vì tạo thêm thread.
+
+    Kết nối keep-alive đang rảnh giữa hai request không giữ worker: handler gọi
+    keep_idle() và socket được chuyển cho một thread selector duy nhất, request
+    tiếp theo tới mới được đưa lại vào pool (đóng nếu rảnh quá thời gian cho phép).
+    """
+
+    def __init__(self, server_address, handler_class, workers=32, queue_size=64, max_idle=1000):
+        self.request_queue_size = max(workers + queue_size, 5)
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # Socket đã được chuyển cho thành phần khác (vd: EventBroker), không đóng khi request kết thúc
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        # Số kết nối đang xử lý hoặc đang chờ worker
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        # Kết nối keep-alive rảnh: socket -> (client_address, số request đã phục vụ, hạn đóng)
+        self.max_idle = max_idle
+        self._idle = {}
+        self._idle_pending = queue.SimpleQueue()
+        self._idle_requests = {}  # socket handler vừa yêu cầu giữ lại -> (số request, timeout)
+        self._resumed_counts = {}
+        self._idle_lock = threading.Lock()
+        self._idle_selector = selectors.DefaultSelector()
+        self._idle_wakeup, self._idle_waker = socket.socketpair()
+        self._idle_wakeup.setblocking(False)
+        self._idle_waker.setblocking(False)
+        self._idle_selector.register(self._idle_wakeup, selectors.EVENT_READ)
+        self._closing = False
+        self._idle_thread = threading.Thread(target=self._idle_loop, name='http-idle', daemon=True)
+        self._idle_thread.start()
+        # Tạo executor trước: TCPServer gọi server_close() nếu bind thất bại
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        # Chặn vòng accept khi pool + hàng đợi đã đầy (backpressure)
+        self._slots.acquire()
+        with self._inflight_lock:
+            self._inflight += 1
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor đã shutdown (server đang dừng)
+            self._release_slot()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address, slot=True):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._idle_lock:
+                idle = self._idle_requests.pop(request, None)
+            if idle is None:
+                self.shutdown_request(request)
+            else:
+                # Handler đã kết thúc hẳn mới chuyển socket cho thread selector
+                self._idle_pending.put((request, client_address) + idle)
+                self._wake_idle_loop()
+            self._release_slot(slot)
+
+    def _release_slot(self, slot=True):
+        with self._inflight_lock:
+            self._inflight -= 1
+        if slot:
+            self._slots.release()
+
+    def keep_idle(self, request, request_count, timeout):
+        """
+        Handler gọi khi kết nối keep-alive không còn request nào đang chờ:
+        worker được trả lại pool, request tiếp theo sẽ được xử lý khi tới.
+        """
+        with self._idle_lock:
+            self._idle_requests[request] = (request_count, timeout)
+
+    def resumed_request_count(self, request):
+        """Số request đã phục vụ trên kết nối trước khi nó rảnh (0 nếu là kết nối mới)"""
+        with self._idle_lock:
+            return self._resumed_counts.pop(request, 0)
+
+    def _wake_idle_loop(self):
+        try:
+            self._idle_waker.send(b'\0')
+        except OSError:
+            # Buffer đầy: thread selector đã có tín hiệu chưa đọc
+            pass
+
+    def _idle_loop(self):
+        while not self._closing:
+            deadlines = [entry[2] for entry in self._idle.values()]
+            timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            for key, _ in self._idle_selector.select(timeout):
+                if key.fileobj is self._idle_wakeup:
+                    try:
+                        while self._idle_wakeup.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                # Có dữ liệu (request mới hoặc client đã đóng): trả lại cho pool
+                self._idle_selector.unregister(key.fileobj)
+                client_address, request_count, _ = self._idle.pop(key.fileobj)
+                self._resume_request(key.fileobj, client_address, request_count)
+
+            now = time.monotonic()
+            while True:
+                try:
+                    request, client_address, request_count, timeout = self._idle_pending.get_nowait()
+                except queue.Empty:
+                    break
+                if self._closing or len(self._idle) >= self.max_idle:
+                    self.shutdown_request(request)
+                    continue
+                try:
+                    self._idle_selector.register(request, selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    self.shutdown_request(request)
+                    continue
+                self._idle[request] = (client_address, request_count, now + timeout)
+
+            for request, (_, _, deadline) in list(self._idle.items()):
+                if deadline <= now:
+                    self._close_idle(request)
+
+    def _resume_request(self, request, client_address, request_count):
+        with self._idle_lock:
+            self._resumed_counts[request] = request_count
+        with self._inflight_lock:
+            self._inflight += 1
+        try:
+            # Kết nối này đã được nhận trước đó nên không chiếm thêm chỗ trong hàng đợi
+            self._executor.submit(self._process_request_worker, request, client_address, False)
+        except RuntimeError:
+            self._release_slot(False)
+            with self._idle_lock:
+                self._resumed_counts.pop(request, None)
+            self.shutdown_request(request)
+
+    def _close_idle(self, request):
+        del self._idle[request]
+        try:
+            self._idle_selector.unregister(request)
+        except (KeyError, ValueError):
+            pass
+        self.shutdown_request(request)
+
+    def is_busy(self):
+        """Có kết nối đang chờ worker (mọi worker đều bận)"""
+        return self._inflight > self.workers
+
+    def detach_request(self, request):
+        """Giữ socket mở sau khi handler kết thúc, worker thread được trả lại pool"""
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._closing = True
+        self._wake_idle_loop()
+        self._idle_thread.join(timeout=1)
+        for request in list(self._idle):
+            self._close_idle(request)
+        self._idle_selector.close()
+        self._idle_wakeup.close()
+        self._idle_waker.close()
+
+
+class EventBroker:
+    """
+    Kênh Server-Sent Events dùng chung cho mọi màn hình.
+
+    Mỗi client SSE được tách khỏi worker thread (detach_request) và do một
+    thread duy nhất của broker ghi dữ liệu, nên hàng trăm màn hình đang mở
+    không chiếm worker của PooledHTTPServer. Socket của client ở chế độ
+    non-blocking: màn hình nào không nhận kịp (buffer gửi đầy) bị ngắt để
+    EventSource tự kết nối lại, thay vì làm chậm sự kiện của mọi màn hình khác.
+    """
+
+    def __init__(self, heartbeat=15.0, max_clients=500, send_timeout=5.0):
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.send_timeout = send_timeout
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @staticmethod
+    def format_event(event, data):
+        """Định dạng một SSE message"""
+        payload = json.dumps(data, ensure_ascii=False)
+        return f"event: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    def subscribe(self, server, sock, initial=b''):
+        """Nhận socket của một client SSE (header đã được gửi). Trả về False nếu quá số client"""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return False
+        sock.settimeout(self.send_timeout)
+        server.detach_request(sock)
+        try:
+            if initial:
+                sock.sendall(initial)
+        except OSError:
+            sock.close()
+            return True
+        sock.setblocking(False)
+        with self._lock:
+            self._ensure_thread()
+            self._clients.add(sock)
+        return True
+
+    def publish(self, event, data):
+        """Gửi sự kiện tới tất cả client (không chặn thread gọi)"""
+        if self._clients:
+            self._queue.put(self.format_event(event, data))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='sse-broker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                payload = self._queue.get(timeout=self.heartbeat)
+            except queue.Empty:
+                # Comment SSE giữ kết nối sống qua proxy / Wi-Fi
+                payload = b': keepalive\n\n'
+            with self._lock:
+                clients = list(self._clients)
+            for sock in clients:
+                self._send(sock, payload)
+
+    def _send(self, sock, payload):
+        try:
+            sent = sock.send(payload)
+        except OSError:
+            # Gồm BlockingIOError: buffer gửi của client đã đầy
+            sent = 0
+        if sent < len(payload):
+            # Không gửi hết được thì stream SSE đã hỏng - client kết nối lại và tải lại dữ liệu
+            self._drop(sock)
+
+    def _drop(self, sock):
+        with self._lock:
+            self._clients.discard(sock)
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+def etag_matches(if_none_match, etag):
+    """Kiểm tra header If-None-Match có khớp với ETag hiện tại không"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # So sánh weak: bỏ tiền tố W/ ở cả hai phía
+    bare = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == bare for tag in candidates)
+
+
+def parse_byte_range(range_header, length):
+    """
+    Phân tích header Range (chỉ hỗ trợ một khoảng 'bytes=').
+    Returns:
+        (start, end) bao gồm cả end; None nếu header không dùng được (gửi toàn bộ file);
+        False nếu khoảng nằm ngoài file (416 Range Not Satisfiable)
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec or '-' not in spec:
+        # Nhiều khoảng (multipart/byteranges) không hỗ trợ - trả toàn bộ file là hợp lệ
+        return None
+    first, last = (part.strip() for part in spec.split('-', 1))
+    try:
+        if first == '':
+            # bytes=-N: N bytes cuối
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(length - suffix, 0), length - 1
+        start = int(first)
+        end = int(last) if last else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return False
+    return start, min(end, length - 1)
+
+
+# Thứ tự ưu tiên khi client chấp nhận nhiều encoding
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+SIDECAR_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """Chọn Content-Encoding theo header Accept-Encoding (có xét q=0)"""
+    if not accept_encoding:
+        return None
+    prefs = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[token.strip().lower()] = q
+    for encoding in available:
+        if prefs.get(encoding, prefs.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress_bytes(body, encoding, best=False):
+    """Nén body. best=True cho file build sẵn (chậm hơn, nhỏ hơn)"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+
+
+def http_date(timestamp):
+    """Định dạng thời gian (epoch hoặc datetime UTC) cho Last-Modified"""
+    if hasattr(timestamp, 'utctimetuple'):
+        timestamp = calendar.timegm(timestamp.utctimetuple())
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def _parse_http_date(value):
+    try:
+        parsed = email.utils.parsedate_tz(value)
+        return email.utils.mktime_tz(parsed) if parsed else None
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def if_range_matches(if_range, etag, last_modified=None):
+    """If-Range: chỉ áp dụng Range khi ETag (so sánh strong) hoặc Last-Modified còn khớp"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return bool(etag) and not if_range.startswith('W/') and if_range == etag
+    if last_modified is None:
+        return False
+    return if_range == http_date(last_modified)
+
+
+class StaticFiles:
+    """
+    Fingerprint (SHA-1) của các file tĩnh, tính lại khi mtime / size thay đổi.
+
+    Dùng cho strong ETag và URL có hash (styles.css?v=<hash>) - URL có hash
+    đúng với nội dung hiện tại được cache lâu dài (immutable) ở trình duyệt.
+    """
+
+    # href/src tới file .css/.js cục bộ trong HTML
+    ASSET_PATTERN = re.compile(r'(href|src)="(?![a-z]+:|//)([^"?#]+\.(?:css|js))(?:\?[^"#]*)?"')
+
+    # Loại file nên nén (ảnh / âm thanh đã được nén sẵn)
+    COMPRESSIBLE = ('.html', '.css', '.js', '.json', '.svg', '.csv', '.txt')
+    # Chỉ asset web được phục vụ mới có file nén sẵn (không đụng tới data/, db/...)
+    SIDECAR_TYPES = ('.html', '.css', '.js')
+    # Thư mục không build sidecar (dữ liệu thay đổi liên tục hoặc file nhị phân)
+    SKIP_DIRS = {'data', 'db', 'images', 'sounds', '__pycache__'}
+
+    def __init__(self, compress_min_bytes=1024, cache_dir=None):
+        self.compress_min_bytes = compress_min_bytes
+        # File nén sẵn nằm trong cache_dir (theo đường dẫn tương đối + hash nội dung), không ghi vào thư mục ứng dụng
+        self.cache_dir = cache_dir
+        self._root = None
+        self._fingerprints = {}  # path -> (mtime_ns, size, digest)
+        self._html = {}  # path -> (signature, body, etag)
+        self._compressed = {}  # (etag, encoding) -> bytes
+        self._lock = threading.Lock()
+
+    def compressible(self, path, size):
+        return size >= self.compress_min_bytes and path.lower().endswith(self.COMPRESSIBLE)
+
+    def _sidecar_path(self, path, digest, encoding):
+        """<cache_dir>/<đường dẫn tương đối>.<hash>.gz - hash đổi thì file nén cũ tự hết hiệu lực"""
+        relative = os.path.relpath(path, self._root)
+        return os.path.join(self.cache_dir, f"{relative}.{digest[:12]}{SIDECAR_SUFFIX[encoding]}")
+
+    def _has_sidecar(self, path, size):
+        if not self.cache_dir or self._root is None:
+            return False
+        if size < self.compress_min_bytes or not path.lower().endswith(self.SIDECAR_TYPES):
+            return False
+        try:
+            return os.path.commonpath([os.path.abspath(path), self._root]) == self._root
+        except ValueError:  # khác ổ đĩa (Windows)
+            return False
+
+    def _prune_sidecars(self, path, digest):
+        """Xóa file nén của các phiên bản cũ của cùng một file"""
+        keep = {self._sidecar_path(path, digest, encoding) for encoding in ENCODINGS}
+        directory = os.path.dirname(self._sidecar_path(path, digest, ENCODINGS[0]))
+        old_version = re.compile(re.escape(os.path.basename(path)) + r'\.[0-9a-f]{12}\.(gz|br)')
+        for entry in os.listdir(directory):
+            entry_path = os.path.join(directory, entry)
+            if old_version.fullmatch(entry) and entry_path not in keep:
+                os.remove(entry_path)
+
+    def build_sidecars(self, root):
+        """
+        Tạo file .gz (và .br nếu có thư viện brotli) cho các file .html/.css/.js
+        dưới root, ghi vào cache_dir. Chỉ build khi nội dung (hash) đổi. Trả về số file đã tạo.
+        """
+        self._root = os.path.abspath(root)
+        if not self.cache_dir:
+            return 0
+        built = 0
+        for directory, dirnames, filenames in os.walk(self._root):
+            dirnames[:] = [d for d in dirnames if d not in self.SKIP_DIRS and not d.startswith('.')]
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                    if not self._has_sidecar(path, stat.st_size):
+                        continue
+                    digest = self.fingerprint(path, stat)
+                    body = None
+                    for encoding in ENCODINGS:
+                        sidecar = self._sidecar_path(path, digest, encoding)
+                        if os.path.exists(sidecar):
+                            continue
+                        if body is None:
+                            with open(path, 'rb') as f:
+                                body = f.read()
+                        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+                        tmp_path = sidecar + '.tmp'
+                        with open(tmp_path, 'wb') as f:
+                            f.write(compress_bytes(body, encoding, best=True))
+                        os.replace(tmp_path, sidecar)
+                        built += 1
+                    self._prune_sidecars(path, digest)
+                except OSError as e:
+                    logger.warning(f"Could not build compressed sidecar for {path}: {e}")
+        return built
+
+    def sidecar(self, path, stat, accept_encoding):
+        """(encoding, sidecar_path) khớp nội dung hiện tại mà client chấp nhận, hoặc (None, None)"""
+        if not self._has_sidecar(path, stat.st_size):
+            return None, None
+        digest = self.fingerprint(path, stat)
+        available = [encoding for encoding in ENCODINGS
+                     if os.path.exists(self._sidecar_path(path, digest, encoding))]
+        encoding = choose_encoding(accept_encoding, available)
+        return (encoding, self._sidecar_path(path, digest, encoding)) if encoding else (None, None)
+
+    def compressed(self, etag, body, encoding):
+        """Body đã nén cho một phiên bản nội dung (theo ETag), nén một lần rồi dùng lại"""
+        key = (etag, encoding)
+        with self._lock:
+            cached = self._compressed.get(key)
+        if cached is None:
+            cached = compress_bytes(body, encoding)
+            with self._lock:
+                if len(self._compressed) > 64:
+                    self._compressed.clear()
+                self._compressed[key] = cached
+        return cached
+
+    def fingerprint(self, path, stat=None):
+        """SHA-1 hex của nội dung file"""
+        stat = stat or os.stat(path)
+        with self._lock:
+            entry = self._fingerprints.get(path)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                return entry[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        with self._lock:
+            self._fingerprints[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def versioned_html(self, path):
+        """
+        Nội dung HTML với URL .css/.js được gắn ?v=<hash>.
+        Trả về (body, etag); chỉ render lại khi HTML hoặc asset thay đổi.
+        """
+        directory = os.path.dirname(path)
+        html_stat = os.stat(path)
+        with open(path, 'rb') as f:
+            html = f.read().decode('utf-8')
+
+        versions = {}
+        for match in self.ASSET_PATTERN.finditer(html):
+            asset = match.group(2)
+            asset_path = os.path.join(directory, *urllib.parse.unquote(asset).split('/'))
+            if asset not in versions and os.path.isfile(asset_path):
+                versions[asset] = self.fingerprint(asset_path)[:12]
+
+        signature = (html_stat.st_mtime_ns, html_stat.st_size, tuple(sorted(versions.items())))
+        with self._lock:
+            entry = self._html.get(path)
+            if entry and entry[0] == signature:
+                return entry[1], entry[2]
+
+        def replace(match):
+            version = versions.get(match.group(2))
+            if not version:
+                return match.group(0)
+            return f'{match.group(1)}="{match.group(2)}?v={version}"'
+
+        body = self.ASSET_PATTERN.sub(replace, html).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._html[path] = (signature, body, etag)
+        return body, etag
+
+
+class JsonResponseCache:
+    """
+    Cache bytes JSON đã encode sẵn cùng ETag cho từng collection.
+
+    Bytes được dùng lại khi `data` chính là object đã encode lần trước
+    (DatabaseManager trả về cùng một object khi đọc từ cache), nên không cần
+    json.dumps lại cho mỗi GET.
+    """
+
+    def __init__(self, compress_min_bytes=1024):
+        self.compress_min_bytes = compress_min_bytes
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def encode(self, key, data):
+        """Trả về (body, etag) cho dữ liệu của key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is data:
+                return entry[1], entry[2]
+
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            # entry[3]: các bản nén (encoding -> bytes) của đúng body này
+            self._entries[key] = (data, body, etag, {})
+        return body, etag
+
+    def compressed(self, key, etag, encoding):
+        """
+        Body đã nén của key (nén một lần, lưu cạnh bytes JSON).
+        Trả về None nếu body đã đổi hoặc nhỏ hơn ngưỡng nén.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[2] != etag or len(entry[1]) < self.compress_min_bytes:
+            return None
+        variants = entry[3]
+        if encoding not in variants:
+            variants[encoding] = compress_bytes(entry[1], encoding)
+        return variants[encoding]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class GameShowHandlerMixin:
+    """Các helper dùng chung cho CustomHTTPRequestHandler của cả hai server"""
+
+    # HTTP/1.1 keep-alive: mọi response phải có Content-Length (hoặc Connection: close)
+    protocol_version = 'HTTP/1.1'
+    # Kết nối rảnh quá số giây này sẽ bị đóng; cũng là timeout khi đọc một request đang gửi dở
+    timeout = 5
+    # Số request tối đa trên một kết nối trước khi server yêu cầu đóng
+    max_keepalive_requests = 100
+    _request_count = 0
+    _connection_close_sent = False
+
+    def setup(self):
+        super().setup()
+        resumed_request_count = getattr(self.server, 'resumed_request_count', None)
+        if resumed_request_count:
+            self._request_count = resumed_request_count(self.request)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if self._keep_idle():
+                return
+            self.handle_one_request()
+
+    def _keep_idle(self):
+        """
+        Trả worker lại pool nếu chưa có request tiếp theo trên kết nối keep-alive.
+        False nếu request tiếp theo đã tới (hoặc server không hỗ trợ) - xử lý luôn.
+        """
+        keep_idle = getattr(self.server, 'keep_idle', None)
+        if keep_idle is None:
+            return False
+        # Đọc thử không chặn: dữ liệu đã nằm trong buffer của rfile sẽ mất nếu bỏ rfile này
+        self.connection.setblocking(False)
+        try:
+            pending = self.rfile.peek(1)
+        except OSError:
+            pending = b''
+        finally:
+            self.connection.settimeout(self.timeout)
+        if pending:
+            return False
+        keep_idle(self.request, self._request_count, self.timeout)
+        return True
+
+    def handle_one_request(self):
+        self._request_count += 1
+        self._connection_close_sent = False
+        super().handle_one_request()
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        # Không giữ kết nối khi đã phục vụ đủ số request hoặc có kết nối khác đang chờ worker
+        if not self.close_connection and self.request_version == 'HTTP/1.1':
+            busy = getattr(self.server, 'is_busy', None)
+            if self._request_count >= self.max_keepalive_requests or (busy and busy()):
+                self.send_header('Connection', 'close')
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection' and value.lower() == 'close':
+            # send_error cũng gửi 'Connection: close' - chỉ gửi một lần
+            if self._connection_close_sent:
+                return
+            self._connection_close_sent = True
+        super().send_header(keyword, value)
+
+    def log_error(self, format, *args):
+        # Kết nối keep-alive rảnh bị đóng sau `timeout` giây là bình thường
+        if format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+    def send_json(self, data, status=200, **dumps_kwargs):
+        """Gửi một object dưới dạng JSON (có Content-Length)"""
+        self.send_json_body(json.dumps(data, **dumps_kwargs).encode('utf-8'), status=status)
+
+    def send_json_body(self, body, etag=None, status=200, content_encoding=None, vary=None):
+        """
+        Gửi JSON đã encode. Nếu có ETag và client gửi If-None-Match trùng khớp
+        thì trả về 304 Not Modified (không gửi lại body).
+        """
+        if etag and status == 200 and etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            if vary:
+                self.send_header('Vary', vary)
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        if vary:
+            self.send_header('Vary', vary)
+        if etag:
+            self.send_header('ETag', etag)
+            # Cho phép trình duyệt lưu lại nhưng luôn phải xác thực lại với server
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_cached_json(self, cache, key, data):
+        """Gửi dữ liệu qua JsonResponseCache (bytes + ETag dùng lại được, nén nếu đủ lớn)"""
+        body, etag = cache.encode(key, data)
+        if len(body) < cache.compress_min_bytes:
+            self.send_json_body(body, etag)
+            return
+
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        compressed = cache.compressed(key, etag, encoding) if encoding else None
+        if compressed is None:
+            self.send_json_body(body, etag, vary='Accept-Encoding')
+            return
+        # Mỗi encoding là một representation riêng nên cần ETag riêng
+        self.send_json_body(compressed, f'{etag[:-1]}-{encoding}"', content_encoding=encoding,
+                            vary='Accept-Encoding')
+
+    def send_ranged_body(self, content_type, length, write_range, etag=None, last_modified=None,
+                         cache_control='no-cache', extra_headers=(), content_encoding=None):
+        """
+        Gửi nội dung có hỗ trợ 304 / Range / If-Range.
+
+        write_range(start, end) ghi bytes [start, end] ra self.wfile, nên có thể
+        stream từ file hoặc GridFS mà không cần đọc toàn bộ vào bộ nhớ.
+        """
+        not_modified = False
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = etag_matches(if_none_match, etag)
+        elif last_modified is not None and self.headers.get('If-Modified-Since'):
+            since = _parse_http_date(self.headers.get('If-Modified-Since'))
+            modified = last_modified
+            if hasattr(modified, 'utctimetuple'):
+                modified = calendar.timegm(modified.utctimetuple())
+            not_modified = since is not None and int(modified) <= since
+
+        headers = [('Accept-Ranges', 'bytes'), ('Cache-Control', cache_control)]
+        if content_encoding:
+            headers.append(('Content-Encoding', content_encoding))
+        if etag:
+            headers.append(('ETag', etag))
+        if last_modified is not None:
+            headers.append(('Last-Modified', http_date(last_modified)))
+        headers.extend(extra_headers)
+
+        if not_modified:
+            self.send_response(304)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        byte_range = None
+        if self.headers.get('Range') and if_range_matches(self.headers.get('If-Range'), etag, last_modified):
+            byte_range = parse_byte_range(self.headers.get('Range'), length)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{length}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{length}')
+        else:
+            start, end = 0, length - 1
+            self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD' and length > 0:
+            write_range(start, end)
+
+    def serve_static_file(self, full_path, static_files, cache_control='no-cache'):
+        """
+        Gửi một file tĩnh bằng socket.sendfile (không copy qua user space),
+        với strong ETag, Last-Modified, 304 và Range.
+        URL có ?v=<hash> khớp nội dung hiện tại được cache immutable một năm.
+        """
+        try:
+            f = open(full_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            digest = static_files.fingerprint(full_path, stat)
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            version = query.get('v', [''])[0]
+            if version and digest.startswith(version):
+                cache_control = 'public, max-age=31536000, immutable'
+
+            etag = f'"{digest}"'
+            length = stat.st_size
+            body_file = f
+            extra_headers = []
+            encoding, sidecar = static_files.sidecar(full_path, stat, self.headers.get('Accept-Encoding'))
+            if static_files.compressible(full_path, stat.st_size):
+                extra_headers.append(('Vary', 'Accept-Encoding'))
+            if encoding:
+                try:
+                    body_file = open(sidecar, 'rb')
+                    length = os.fstat(body_file.fileno()).st_size
+                    etag = f'"{digest}-{encoding}"'
+                except OSError:
+                    encoding = None
+
+            def write_range(start, end):
+                self.wfile.flush()
+                self.connection.sendfile(body_file, offset=start, count=end - start + 1)
+
+            try:
+                self.send_ranged_body(
+                    self.guess_type(full_path), length, write_range,
+                    etag=etag, last_modified=stat.st_mtime, cache_control=cache_control,
+                    extra_headers=extra_headers, content_encoding=encoding
+                )
+            finally:
+                if body_file is not f:
+                    body_file.close()
+
+    def serve_static(self, static_files):
+        """GET file tĩnh trong thư mục gốc; HTML được gắn hash cho các asset .css/.js"""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and urllib.parse.urlparse(self.path).path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            # Thư mục (redirect / listing) và 404 do SimpleHTTPRequestHandler xử lý
+            super().do_GET()
+            return
+
+        if path.endswith('.html'):
+            body, etag = static_files.versioned_html(path)
+            encoding = None
+            if len(body) >= static_files.compress_min_bytes:
+                encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+            if encoding:
+                body = static_files.compressed(etag, body, encoding)
+                etag = f'{etag[:-1]}-{encoding}"'
+            self.send_ranged_body(
+                'text/html; charset=utf-8', len(body),
+                lambda start, end: self.wfile.write(memoryview(body)[start:end + 1]),
+                etag=etag, content_encoding=encoding, extra_headers=[('Vary', 'Accept-Encoding')]
+            )
+            return
+        self.serve_static_file(path, static_files)
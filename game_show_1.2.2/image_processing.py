@@ -0,0 +1,558 @@
+"""
+Xử lý ảnh cho Game Show: decode base64, tối ưu và tạo biến thể.
+
+Các hàm ở đây là hàm thuần (chỉ nhận/trả bytes và dict) để chạy được trong
+ProcessPoolExecutor - Pillow giữ GIL trong lúc decode / resize / encode, nên
+xử lý ảnh 4K trên thread của request sẽ chặn các request khác.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import mimetypes
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Tuple
+
+from PIL import Image, ImageFile
+
+from config import (
+    MAX_IMAGE_SIZE, ALLOWED_IMAGE_TYPES, IMAGE_VARIANTS, WEBP_QUALITY, VARIANT_JPEG_QUALITY
+)
+
+# Enable loading of truncated images (helps with corrupted files)
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_variant(image, fmt: str) -> bytes:
+    """Encode một biến thể ảnh sang WEBP / JPEG / PNG"""
+    buffer = io.BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'PNG':
+        image.save(buffer, format='PNG', optimize=True)
+    else:
+        if image.mode not in ('RGB', 'L'):
+            # JPEG không có kênh alpha - ghép lên nền trắng
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.convert('RGBA').split()[-1])
+            image = background
+        image.save(buffer, format='JPEG', quality=VARIANT_JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_image_variants(image, sizes: Dict[str, int] = None) -> Dict[str, Dict]:
+    """
+    Tạo các biến thể kích thước (thumb, medium, full) của ảnh đã tối ưu.
+
+    Mỗi biến thể có bản WebP và bản fallback (JPEG, hoặc PNG nếu ảnh trong suốt).
+    Biến thể 'full' chỉ có bản WebP - fallback của nó chính là file ảnh gốc đã tối ưu.
+    Biến thể không nhỏ hơn ảnh gốc dùng lại cùng bytes với biến thể trước đó.
+    Returns:
+        {name: {'width', 'height', 'formats': {mime_type: bytes}}}
+    """
+    sizes = IMAGE_VARIANTS if sizes is None else sizes
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback_format, fallback_mime = ('PNG', 'image/png') if has_alpha else ('JPEG', 'image/jpeg')
+
+    variants = {}
+    encoded_by_size = {}
+    for name, max_side in sorted(sizes.items(), key=lambda item: item[1]):
+        variant = image
+        if max(image.size) > max_side:
+            variant = image.copy()
+            variant.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if variant.size not in encoded_by_size:
+            encoded_by_size[variant.size] = {
+                'image/webp': _encode_variant(variant, 'WEBP'),
+                fallback_mime: _encode_variant(variant, fallback_format),
+            }
+        variants[name] = {
+            'width': variant.size[0],
+            'height': variant.size[1],
+            'formats': encoded_by_size[variant.size],
+        }
+
+    full_formats = encoded_by_size.get(image.size)
+    variants['full'] = {
+        'width': image.size[0],
+        'height': image.size[1],
+        'formats': {'image/webp': full_formats['image/webp'] if full_formats else _encode_variant(image, 'WEBP')},
+    }
+    return variants
+
+
+def process_image(image_data: str) -> Dict:
+    """
+    Decode, tối ưu ảnh base64 và tạo các biến thể (bước 1-2 của save_team_image).
+    Args:
+        image_data: Base64 image data (data:image/...;base64,...)
+    Returns:
+        Dict gồm mime_type, original_size, optimized (bytes), content_hash, dimensions, variants
+    Raises:
+        ValueError nếu dữ liệu ảnh không hợp lệ
+    """
+    mime_type, image_bytes = decode_image_data(image_data)
+    return process_image_bytes(image_bytes, mime_type)
+
+
+def process_image_file(path: str) -> Dict:
+    """process_image cho file ảnh trên đĩa: đọc thẳng bytes, không qua base64 (dùng khi migrate)"""
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    return process_image_bytes(image_bytes, image_file_mime_type(path))
+
+
+def image_content_hash(processed: Dict) -> str:
+    """SHA-256 của ảnh đã tối ưu - khóa để dùng lại file ảnh đã lưu có cùng nội dung"""
+    return processed.get('content_hash') or hashlib.sha256(processed['optimized']).hexdigest()
+
+
+def image_file_mime_type(path: str) -> str:
+    """MIME type theo đuôi file (mặc định image/jpeg như migrate cũ)"""
+    mime_type = mimetypes.guess_type(path)[0]
+    return mime_type if mime_type in ALLOWED_IMAGE_TYPES else 'image/jpeg'
+
+
+def decode_image_data(image_data: str) -> Tuple[str, bytes]:
+    """Step 1: data URL base64 -> (mime_type, bytes ảnh). Raise ValueError nếu không hợp lệ"""
+    logger.info("Step 1/5: Parsing and decoding image data...")
+    if not image_data.startswith('data:image/'):
+        raise ValueError("Invalid image data format")
+    
+    header, base64_data = image_data.split(',', 1)
+    mime_type = header.split(':')[1].split(';')[0]
+    
+    if mime_type not in ALLOWED_IMAGE_TYPES:
+        raise ValueError(f"Unsupported image type: {mime_type}")
+    
+    # Clean base64 data thoroughly - multiple passes to ensure all problematic characters are removed
+    base64_data = base64_data.replace('\n', '').replace('\r', '').replace(' ', '').replace('\t', '')
+    
+    # Remove any non-ASCII characters from base64 data
+    base64_data = ''.join(char for char in base64_data if ord(char) < 128)
+    
+    # More aggressive cleaning - only keep valid base64 characters, but be careful not to remove essential data
+    
+    # First, count how many valid base64 chars we have
+    valid_chars = re.findall(r'[A-Za-z0-9+/=]', base64_data)
+    original_length = len(base64_data)
+    valid_length = len(valid_chars)
+    
+    if valid_length < original_length:
+        logger.warning(f"Found {original_length - valid_length} invalid characters in base64 data")
+    
+    # Join valid characters
+    base64_data = ''.join(valid_chars)
+    
+    # Remove any existing padding first, then add correct padding
+    base64_data = base64_data.rstrip('=')
+    
+    # Add correct padding
+    missing_padding = len(base64_data) % 4
+    if missing_padding:
+        base64_data += '=' * (4 - missing_padding)
+        
+    # Final validation of base64 characters (only A-Z, a-z, 0-9, +, /, =)
+    if not re.match(r'^[A-Za-z0-9+/]*={0,3}$', base64_data):
+        raise ValueError("Base64 string contains invalid characters")
+        
+    logger.info(f"Base64 data length after cleaning: {len(base64_data)} characters")
+    
+    # Additional validation - check that the length is valid for base64
+    if len(base64_data) % 4 != 0:
+        logger.error(f"Base64 data length is not multiple of 4: {len(base64_data)}")
+        raise ValueError(f"Invalid base64 length: {len(base64_data)} characters")
+    
+    try:
+        # Test decode with validation and altchars to handle different encodings
+        image_bytes = base64.b64decode(base64_data, validate=True)
+    except Exception as decode_error:
+        logger.error(f"Base64 decode error: {decode_error}")
+        logger.error(f"Problematic data length: {len(base64_data)}")
+        # Try alternative decoding approaches
+        try:
+            # Sometimes there might be URL-safe base64
+            logger.info("Trying URL-safe base64 decoding")
+            image_bytes = base64.urlsafe_b64decode(base64_data + '==')  # Add extra padding just in case
+        except Exception:
+            logger.error(f"First 100 chars: {base64_data[:100]}")
+            logger.error(f"Last 100 chars: {base64_data[-100:]}")
+            raise ValueError(f"Invalid base64 data: {decode_error}")
+    
+    return mime_type, image_bytes
+
+
+def process_image_bytes(image_bytes: bytes, mime_type: str) -> Dict:
+    """Kiểm tra, tối ưu bytes ảnh gốc và tạo các biến thể - kết quả giống process_image"""
+    if mime_type not in ALLOWED_IMAGE_TYPES:
+        raise ValueError(f"Unsupported image type: {mime_type}")
+    
+    if len(image_bytes) > MAX_IMAGE_SIZE:
+        raise ValueError(f"Image too large: {len(image_bytes)} bytes")
+    
+    # Additional check: verify we have enough bytes for a valid image
+    if len(image_bytes) < 100:  # Even smallest valid images are > 100 bytes
+        raise ValueError(f"Image data too small to be valid: {len(image_bytes)} bytes")
+    
+    # Check for basic image format signatures
+    if image_bytes[:4] == b'\x89PNG':
+        logger.info("Detected PNG format")
+    elif image_bytes[:2] == b'\xff\xd8':
+        logger.info("Detected JPEG format")
+    elif image_bytes[:6] in (b'GIF87a', b'GIF89a'):
+        logger.info("Detected GIF format")
+    elif image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        logger.info("Detected WebP format")
+    else:
+        logger.warning(f"Unknown image format signature: {image_bytes[:10].hex()}")
+    
+    logger.info("Step 1/5: Success")
+
+    # Step 2: Optimize image for web display while keeping good quality
+    logger.info("Step 2/5: Optimizing image for web display...")
+    
+    try:
+        # Multiple attempts to handle different image formats and potential issues
+        image = None
+        original_width = original_height = 0
+        
+        # Attempt 1: Standard opening with immediate load
+        try:
+            image = Image.open(io.BytesIO(image_bytes))
+            image.load()  # Force load all image data
+            original_width, original_height = image.size
+            logger.info(f"Successfully opened image: {original_width}x{original_height}, mode: {image.mode}")
+        
+        except Exception as e1:
+            logger.warning(f"Standard image opening failed: {e1}")
+            
+            # Attempt 2: Try with verify first, then reopen
+            try:
+                test_img = Image.open(io.BytesIO(image_bytes))
+                test_img.verify()  # Just verify structure
+                # Reopen after verify (verify closes the image)
+                image = Image.open(io.BytesIO(image_bytes))
+                original_width, original_height = image.size
+                logger.info(f"Verified and reopened image: {original_width}x{original_height}")
+            
+            except Exception as e2:
+                logger.warning(f"Verify approach failed: {e2}")
+                
+                # Attempt 3: Try with relaxed error handling
+                try:
+                    # For PNG files with CRC errors, try to load with ignore errors
+                    from PIL import ImageFile
+                    ImageFile.LOAD_TRUNCATED_IMAGES = True
+                    
+                    temp_img = Image.open(io.BytesIO(image_bytes))
+                    # Convert to RGB immediately to bypass format issues
+                    image = temp_img.convert('RGB')
+                    original_width, original_height = image.size
+                    logger.info(f"Force converted to RGB with truncated load: {original_width}x{original_height}")
+                
+                except Exception as e3:
+                    logger.warning(f"RGB conversion failed: {e3}")
+                    
+                    # Attempt 4: Try saving and reloading to fix corruption
+                    try:
+                        # Write raw bytes to temp buffer and try to recover
+                        temp_buffer = io.BytesIO(image_bytes)
+                        temp_img = Image.open(temp_buffer)
+                        
+                        # Save to new buffer with error recovery
+                        recovery_buffer = io.BytesIO()
+                        temp_img.save(recovery_buffer, format='PNG', optimize=False)
+                        recovery_bytes = recovery_buffer.getvalue()
+                        
+                        # Try to reopen the recovered image
+                        image = Image.open(io.BytesIO(recovery_bytes))
+                        original_width, original_height = image.size
+                        logger.info(f"Recovered corrupted image: {original_width}x{original_height}")
+                        
+                    except Exception as e4:
+                        logger.error(f"All image opening methods failed: {e1}, {e2}, {e3}, {e4}")
+                        raise ValueError(f"Cannot process image data - may be corrupted or in unsupported format")
+        
+        if image is None or original_width == 0:
+            raise ValueError("Failed to open image - no valid image data found")
+        
+        # Normalize color mode for consistent processing
+        if image.mode in ('RGBA', 'LA'):
+            # Keep transparency modes as-is for now
+            pass
+        elif image.mode == 'P':
+            # Convert palette images to RGBA to preserve potential transparency
+            if 'transparency' in image.info:
+                image = image.convert('RGBA')
+            else:
+                image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'L'):
+            # Convert other modes to RGB
+            image = image.convert('RGB')
+            
+    except Exception as pil_error:
+        logger.error(f"PIL image processing error: {pil_error}")
+        logger.error(f"Image data appears to be corrupted or in an unsupported format")
+        raise ValueError(f"Image data is corrupted or unsupported: {pil_error}")
+    
+    # Only resize if image is very large (over 2000px on any side)
+    max_dimension = 1920  # Good for web display
+    if max(original_width, original_height) > max_dimension:
+        # Calculate resize ratio while maintaining aspect ratio
+        ratio = min(max_dimension / original_width, max_dimension / original_height)
+        new_width = int(original_width * ratio)
+        new_height = int(original_height * ratio)
+        
+        try:
+            # Use high-quality resampling with error handling
+            logger.info(f"Attempting to resize from {original_width}x{original_height} to {new_width}x{new_height}")
+            
+            # For complex modes, convert to RGB first before resizing
+            if image.mode not in ('RGB', 'RGBA', 'L'):
+                logger.info(f"Converting from {image.mode} to RGB before resize")
+                image = image.convert('RGB')
+            
+            resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            image = resized_image
+            logger.info(f"Successfully resized to {new_width}x{new_height}")
+            
+        except Exception as resize_error:
+            logger.error(f"LANCZOS resize failed: {resize_error}")
+            # Try with simpler resampling method
+            try:
+                logger.info("Trying BILINEAR resampling as fallback")
+                if image.mode not in ('RGB', 'RGBA', 'L'):
+                    image = image.convert('RGB')
+                resized_image = image.resize((new_width, new_height), Image.Resampling.BILINEAR)
+                image = resized_image
+                logger.info(f"Successfully resized with BILINEAR to {new_width}x{new_height}")
+            except Exception as fallback_error:
+                logger.error(f"All resize methods failed: {resize_error}, {fallback_error}")
+                # Use original image if resize fails
+                logger.warning("Using original image size due to resize failures")
+                pass
+    else:
+        logger.info("Image size is acceptable, no resizing needed")
+    
+    # Save optimized image with good quality and format handling
+    output_buffer = io.BytesIO()
+    
+    try:
+        if mime_type == 'image/png' or image.mode in ('RGBA', 'LA'):
+            # For PNG or images with transparency, save as PNG
+            image.save(output_buffer, format='PNG', optimize=True, compress_level=6)
+            logger.info("Saved as PNG format")
+        else:
+            # For JPEG and other formats, convert to RGB first
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Create white background for transparent images
+                rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+                if image.mode in ('RGBA', 'LA'):
+                    rgb_image.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+                else:
+                    rgb_image.paste(image)
+                image = rgb_image
+            
+            image.save(output_buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+            logger.info("Saved as JPEG format")
+            
+    except Exception as save_error:
+        logger.error(f"Error saving optimized image: {save_error}")
+        # Fallback: save as PNG with RGB conversion
+        try:
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output_buffer = io.BytesIO()  # Reset buffer
+            image.save(output_buffer, format='PNG')
+            logger.info("Fallback: saved as PNG after RGB conversion")
+        except Exception as fallback_error:
+            logger.error(f"Fallback save also failed: {fallback_error}")
+            raise ValueError(f"Cannot save processed image: {save_error}")
+    
+    optimized_bytes = output_buffer.getvalue()
+    
+    if len(optimized_bytes) == 0:
+        raise ValueError("Image processing resulted in empty data")
+        
+    logger.info(f"Step 2/5: Success - optimized from {len(image_bytes)} to {len(optimized_bytes)} bytes ({((len(image_bytes) - len(optimized_bytes)) / len(image_bytes) * 100):.1f}% reduction)")
+
+    # Các biến thể thumb / medium / full (WebP + fallback) cho lưới đội và màn hình nhỏ
+    try:
+        variants = build_image_variants(image)
+    except Exception as variant_error:
+        logger.warning(f"Could not build image variants, serving original only: {variant_error}")
+        variants = {}
+
+    return {
+        'mime_type': mime_type,
+        'original_size': len(image_bytes),
+        'optimized': optimized_bytes,
+        # Ảnh trùng nội dung dùng chung file trong database (tính ở process con, không chiếm thread server)
+        'content_hash': hashlib.sha256(optimized_bytes).hexdigest(),
+        'dimensions': {'width': image.size[0], 'height': image.size[1]},
+        'variants': variants,
+    }
+
+
+class ImageJobQueue:
+    """
+    Hàng đợi xử lý ảnh trên ProcessPoolExecutor.
+
+    submit() trả về job id ngay; process_image chạy trong process con và kết quả
+    được lưu bằng hàm `store` (vd: DatabaseManager.store_processed_image) trên
+    thread riêng. Tối đa `workers + queue_size` job chưa xong cùng lúc - vượt quá
+    thì submit() trả về None để server trả 503 thay vì dồn ảnh vào bộ nhớ.
+    """
+
+    def __init__(self, store: Callable, workers: int = 0, queue_size: int = 32, job_ttl: float = 600.0):
+        self._store = store
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self.max_pending = self.workers + queue_size
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._store_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-store')
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # 'spawn' giống nhau trên Windows/Linux và không fork các thread của pymongo
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def submit(self, image_data: str, team_name: str, team_id: str = None) -> Optional[str]:
+        """Đưa ảnh (data URL base64) vào hàng đợi. Trả về job id, hoặc None nếu hàng đợi đầy"""
+        return self._submit(team_name, team_id, process_image, image_data)
+
+    def submit_bytes(self, image_bytes: bytes, mime_type: str, team_name: str, team_id: str = None) -> Optional[str]:
+        """submit() cho bytes ảnh gốc (upload image/* hoặc multipart) - bỏ qua bước decode base64"""
+        return self._submit(team_name, team_id, process_image_bytes, image_bytes, mime_type)
+
+    def _submit(self, team_name: str, team_id: Optional[str], fn: Callable, *args) -> Optional[str]:
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                return None
+            try:
+                future = self._get_pool().submit(fn, *args)
+            except (BrokenProcessPool, RuntimeError):
+                # Một process con đã chết - tạo pool mới
+                self._pool = None
+                future = self._get_pool().submit(fn, *args)
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                # ID đặt trước cho ảnh mới; ảnh trùng nội dung dùng ID của ảnh đã lưu
+                # nên status() chỉ trả image_id khi job đã xong
+                'image_id': str(uuid.uuid4()),
+                'team_name': team_name,
+                'team_id': team_id,
+                'status': 'queued',
+                'result': None,
+                'error': None,
+                'invalid': False,
+                'created_at': time.time(),
+                'finished_at': None,
+                'future': future,
+                'done': threading.Event(),
+            }
+            self._jobs[job_id] = job
+            self._pending += 1
+
+        future.add_done_callback(lambda f: self._store_executor.submit(self._finish, job, f))
+        return job_id
+
+    def _finish(self, job: Dict, future):
+        try:
+            job['status'] = 'storing'
+            processed = future.result()
+            result = self._store(processed, job['team_name'], job['team_id'], image_id=job['image_id'])
+            if not result:
+                raise RuntimeError("Failed to save image to database")
+            # Ảnh trùng nội dung với ảnh đã lưu: dùng image_id của ảnh đó
+            job['image_id'] = result['image_id']
+            job['result'] = result
+            job['status'] = 'done'
+        except ValueError as e:
+            job['error'] = str(e)
+            job['invalid'] = True
+            job['status'] = 'error'
+        except BrokenProcessPool as e:
+            logger.error(f"Image worker process crashed: {e}")
+            with self._lock:
+                self._pool = None
+            job['error'] = "Image worker crashed"
+            job['status'] = 'error'
+        except Exception as e:
+            logger.error(f"Image job {job['job_id']} failed: {e}")
+            job['error'] = str(e)
+            job['status'] = 'error'
+        finally:
+            job['finished_at'] = time.time()
+            with self._lock:
+                self._pending -= 1
+            job['done'].set()
+
+    def _prune(self):
+        """Bỏ các job đã xong quá job_ttl giây (gọi khi đang giữ lock)"""
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """
+        Trạng thái job: queued / processing / storing / done / error.
+        image_id / imagePath chỉ có khi status == 'done' (ID thật sự đã lưu).
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        status = job['status']
+        if status == 'queued' and job['future'].running():
+            status = 'processing'
+        info = {
+            'job_id': job['job_id'],
+            'status': status,
+        }
+        if job['result'] is not None:
+            info['image_id'] = job['result']['image_id']
+            info['imagePath'] = f"/api/image/{job['result']['image_id']}"
+            info['result'] = job['result']
+        if job['error'] is not None:
+            info['error'] = job['error']
+            info['invalid'] = job['invalid']
+        return info
+
+    def wait(self, job_id: str, timeout: float = None) -> Optional[Dict]:
+        """Chờ job xong (hoặc hết timeout) rồi trả về trạng thái"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job['done'].wait(timeout)
+        return self.status(job_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'workers': self.workers, 'pending': self._pending, 'max_pending': self.max_pending}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._store_executor.shutdown(wait=False)
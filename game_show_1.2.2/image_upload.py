@@ -0,0 +1,156 @@
+"""
+Đọc body của POST /api/upload-image dạng nhị phân (không qua base64 / JSON).
+
+Hai dạng body được hỗ trợ ngoài JSON {imageData, teamName, teamId} cũ:
+
+    Content-Type: image/png                 body là nguyên file ảnh,
+    (teamName / teamId trên query string)   vd: /api/upload-image?teamName=...&teamId=...
+
+    Content-Type: multipart/form-data       field 'image' (file) + 'teamName', 'teamId'
+
+Body được đọc theo từng khối vào một buffer, dừng ngay khi vượt giới hạn
+(UploadTooLarge -> 413) nên client không thể đẩy quá MAX_IMAGE_SIZE vào bộ nhớ.
+"""
+
+import mimetypes
+from typing import Dict, NamedTuple, Optional, Tuple
+
+READ_CHUNK_SIZE = 256 * 1024
+# Phần header / field text của multipart được cộng thêm vào giới hạn kích thước ảnh
+MULTIPART_OVERHEAD = 64 * 1024
+IMAGE_FIELD_NAMES = ('image', 'file', 'imageData')
+
+
+class UploadTooLarge(ValueError):
+    """Body lớn hơn giới hạn cho phép"""
+
+
+class ImageUpload(NamedTuple):
+    mime_type: str
+    data: bytes
+    team_name: str
+    team_id: str
+
+
+def is_binary_upload(content_type: Optional[str]) -> bool:
+    """True nếu request dùng body nhị phân (image/* hoặc multipart) thay vì JSON base64"""
+    media_type = _parse_content_type(content_type)[0]
+    return media_type.startswith('image/') or media_type == 'multipart/form-data'
+
+
+def read_body(rfile, content_length: int, max_bytes: int) -> bytes:
+    """Đọc đúng content_length bytes theo từng khối READ_CHUNK_SIZE; raise UploadTooLarge nếu vượt max_bytes"""
+    if content_length > max_bytes:
+        raise UploadTooLarge(f"Upload too large: {content_length} bytes (max {max_bytes})")
+    buffer = bytearray()
+    remaining = content_length
+    while remaining > 0:
+        chunk = rfile.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            # Client ngắt kết nối giữa chừng
+            raise ConnectionError(f"Upload ended with {remaining} bytes missing")
+        buffer += chunk
+        remaining -= len(chunk)
+    return bytes(buffer)
+
+
+def read_image_upload(rfile, headers, query: Dict[str, list], max_image_bytes: int) -> ImageUpload:
+    """
+    Đọc ảnh từ body image/* hoặc multipart/form-data.
+    Raise ValueError nếu body không hợp lệ, UploadTooLarge nếu vượt max_image_bytes.
+    """
+    if headers.get('Content-Length') is None:
+        raise ValueError("Content-Length required")
+    content_length = int(headers['Content-Length'])
+    media_type, params = _parse_content_type(headers.get('Content-Type'))
+
+    if media_type.startswith('image/'):
+        data = read_body(rfile, content_length, max_image_bytes)
+        team_name = query.get('teamName', [''])[0]
+        team_id = query.get('teamId', [''])[0]
+        return ImageUpload(_normalize_mime_type(media_type), data, team_name, team_id)
+
+    if media_type != 'multipart/form-data':
+        raise ValueError(f"Unsupported Content-Type: {media_type or 'missing'}")
+    boundary = params.get('boundary')
+    if not boundary:
+        raise ValueError("multipart/form-data without boundary")
+
+    body = read_body(rfile, content_length, max_image_bytes + MULTIPART_OVERHEAD)
+    fields, image = parse_multipart(body, boundary)
+    if image is None:
+        raise ValueError(f"Missing image file field ({', '.join(IMAGE_FIELD_NAMES)})")
+    mime_type, data = image
+    if len(data) > max_image_bytes:
+        raise UploadTooLarge(f"Image too large: {len(data)} bytes (max {max_image_bytes})")
+    return ImageUpload(mime_type, data,
+                       fields.get('teamName', query.get('teamName', [''])[0]),
+                       fields.get('teamId', query.get('teamId', [''])[0]))
+
+
+def parse_multipart(body: bytes, boundary: str) -> Tuple[Dict[str, str], Optional[Tuple[str, bytes]]]:
+    """
+    Tách body multipart/form-data: ({field: text}, (mime_type, bytes) của file ảnh đầu tiên hoặc None).
+    Chỉ tìm vị trí boundary bằng bytes.find - không duyệt từng byte bằng Python.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    view = memoryview(body)
+    position = body.find(delimiter)
+    if position < 0:
+        raise ValueError("Multipart boundary not found in body")
+
+    fields: Dict[str, str] = {}
+    image = None
+    position += len(delimiter)
+    while not body.startswith(b'--', position):
+        header_start = body.find(b'\r\n', position) + 2
+        header_end = body.find(b'\r\n\r\n', header_start)
+        if header_start < 2 or header_end < 0:
+            raise ValueError("Malformed multipart part headers")
+        part_end = body.find(b'\r\n' + delimiter, header_end + 4)
+        if part_end < 0:
+            raise ValueError("Multipart body is truncated")
+
+        part_headers = _parse_part_headers(body[header_start:header_end])
+        _, disposition_params = _parse_content_type(part_headers.get('content-disposition'))
+        name = disposition_params.get('name', '')
+        content = view[header_end + 4:part_end]
+        if 'filename' in disposition_params or name in IMAGE_FIELD_NAMES:
+            if image is None:
+                mime_type = _normalize_mime_type(_parse_content_type(part_headers.get('content-type'))[0])
+                if not mime_type.startswith('image/'):
+                    mime_type = mimetypes.guess_type(disposition_params.get('filename', ''))[0] or mime_type
+                image = (mime_type, bytes(content))
+        elif name:
+            fields[name] = bytes(content).decode('utf-8', errors='replace')
+        position = part_end + 2 + len(delimiter)
+
+    return fields, image
+
+
+def _parse_part_headers(raw: bytes) -> Dict[str, str]:
+    result = {}
+    for line in raw.decode('utf-8', errors='replace').split('\r\n'):
+        name, _, value = line.partition(':')
+        if value:
+            result[name.strip().lower()] = value.strip()
+    return result
+
+
+def _parse_content_type(value: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    """'multipart/form-data; boundary="x"' -> ('multipart/form-data', {'boundary': 'x'})"""
+    if not value:
+        return '', {}
+    media_type, *items = value.split(';')
+    params = {}
+    for item in items:
+        key, _, param = item.partition('=')
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = param[1:-1]
+        params[key.strip().lower()] = param
+    return media_type.strip().lower(), params
+
+
+def _normalize_mime_type(mime_type: str) -> str:
+    return 'image/jpeg' if mime_type == 'image/pjpeg' else mime_type
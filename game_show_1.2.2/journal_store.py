@@ -0,0 +1,296 @@
+"""
+Backend journal cho lưu trữ file của server_python.py (FILE_STORE_BACKEND='journal').
+
+Mỗi collection gồm snapshot db/<name>.json (cùng định dạng với JsonFileStore)
+và journal db/<name>.journal - mỗi dòng là một thay đổi dạng JSON:
+
+    {"op":"set","data":[...]}     thay toàn bộ dữ liệu
+    {"op":"add","value":"q12"}    thêm phần tử vào list nếu chưa có
+    {"op":"remove","value":"q12"} bỏ phần tử khỏi list
+
+Ghi là một lần append + fsync thay vì ghi lại cả file. Khi khởi động, snapshot
+được nạp rồi replay journal vào bộ nhớ; thread nền gộp journal vào snapshot khi
+quá JOURNAL_COMPACT_OPS thay đổi hoặc JOURNAL_COMPACT_BYTES, nên thời gian replay
+luôn có giới hạn. Mọi op đều idempotent, nên mất điện giữa lúc ghi snapshot và
+lúc cắt journal chỉ làm replay lại các op đã có trong snapshot.
+
+Ở chế độ này server giữ dữ liệu trong bộ nhớ - không sửa tay file trong db/
+khi server đang chạy.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from json_store import atomic_write, dumps_compact
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.journal'
+
+
+def apply_op(data: Any, record: Dict) -> Any:
+    """Áp một dòng journal lên dữ liệu, trả về object mới (không sửa data)"""
+    op = record.get('op')
+    if op == 'set':
+        return record.get('data')
+    if op in ('add', 'remove'):
+        items = data if isinstance(data, list) else []
+        value = record.get('value')
+        if op == 'add':
+            return items if value in items else items + [value]
+        return [item for item in items if item != value] if value in items else items
+    raise ValueError(f"Unknown journal op: {op!r}")
+
+
+class JournalStore:
+    """Cùng interface với JsonFileStore, ghi nối thay đổi vào journal"""
+
+    def __init__(self, directory: str, compact_ops: int = 500, compact_bytes: int = 1024 * 1024,
+                 compact_interval: float = 30):
+        self.directory = directory
+        self.compact_ops = compact_ops
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+
+        # name -> dữ liệu hiện tại (None nếu collection chưa có file nào)
+        self._data: Dict[str, Any] = {}
+        # name -> (số op, số bytes) trong journal kể từ lần gộp trước
+        self._pending: Dict[str, list] = {}
+        self._handles: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+        self._compact_lock = threading.Lock()
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def journal_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}{JOURNAL_SUFFIX}")
+
+    def lock(self, name: str) -> threading.RLock:
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.RLock()
+            return lock
+
+    # =============== LOAD / REPLAY ===============
+
+    def load_all(self) -> int:
+        """Nạp snapshot + replay journal của mọi collection trong thư mục; trả về số collection"""
+        names = set()
+        if os.path.isdir(self.directory):
+            for entry in os.listdir(self.directory):
+                if entry.startswith('.'):
+                    continue
+                for suffix in ('.json', JOURNAL_SUFFIX):
+                    if entry.endswith(suffix):
+                        names.add(entry[:-len(suffix)])
+        for name in sorted(names):
+            try:
+                self._ensure_loaded(name)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load {name}: {e}")
+        return len(names)
+
+    def _ensure_loaded(self, name: str) -> bool:
+        """
+        Nạp snapshot + journal của name vào bộ nhớ. Trả về False (và không giữ lại
+        gì cho name) nếu chưa có cả hai file - tên bất kỳ từ URL không làm tăng bộ nhớ.
+        """
+        if name in self._data:
+            return True
+        if not os.path.exists(self.path(name)) and not os.path.exists(self.journal_path(name)):
+            return False
+        with self.lock(name):
+            if name not in self._data:
+                self._data[name] = self._replay(name)
+        return True
+
+    def _replay(self, name: str) -> Any:
+        data = None
+        snapshot_path = self.path(name)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                raw = f.read()
+            if raw.strip():
+                data = json.loads(raw.decode('utf-8-sig'))
+
+        ops = 0
+        good_offset = 0
+        journal_path = self.journal_path(name)
+        if os.path.exists(journal_path):
+            with open(journal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Dòng cuối ghi dở lúc mất điện
+                        break
+                    if line.strip():
+                        try:
+                            data = apply_op(data, json.loads(line))
+                        except ValueError as e:
+                            logger.warning(f"Stopping replay of {journal_path} at byte {good_offset}: {e}")
+                            break
+                        ops += 1
+                    good_offset += len(line)
+            if good_offset < os.path.getsize(journal_path):
+                logger.warning(f"Truncating torn tail of {journal_path} at byte {good_offset}")
+                with open(journal_path, 'r+b') as f:
+                    f.truncate(good_offset)
+
+        self._pending[name] = [ops, good_offset]
+        if self._over_threshold(name):
+            self._wakeup.set()
+        return data
+
+    # =============== READ / WRITE ===============
+
+    def exists(self, name: str) -> bool:
+        return self._ensure_loaded(name) and self._data.get(name) is not None
+
+    def read(self, name: str, default: Any = None) -> Any:
+        if not self._ensure_loaded(name):
+            return default
+        data = self._data.get(name)
+        return default if data is None else data
+
+    def write(self, name: str, data: Any):
+        self._commit(name, {'op': 'set', 'data': data}, data)
+
+    def update(self, name: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        with self.lock(name):
+            current = self.read(name, default)
+            new_data = func(current)
+            if new_data is not current:
+                self.write(name, new_data)
+            return new_data
+
+    def add_item(self, name: str, value: Any) -> bool:
+        return self._apply_item(name, {'op': 'add', 'value': value})
+
+    def remove_item(self, name: str, value: Any) -> bool:
+        return self._apply_item(name, {'op': 'remove', 'value': value})
+
+    def _apply_item(self, name: str, record: Dict) -> bool:
+        with self.lock(name):
+            current = self.read(name, [])
+            new_data = apply_op(current, record)
+            if new_data is current:
+                return False
+            self._commit(name, record, new_data)
+            return True
+
+    def _commit(self, name: str, record: Dict, new_data: Any):
+        """Append + fsync một dòng journal rồi mới cập nhật bộ nhớ"""
+        line = dumps_compact(record) + b'\n'
+        with self.lock(name):
+            self._ensure_loaded(name)
+            handle = self._handles.get(name)
+            if handle is None:
+                os.makedirs(self.directory, exist_ok=True)
+                handle = self._handles[name] = open(self.journal_path(name), 'ab')
+            handle.write(line)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+            self._data[name] = new_data
+            pending = self._pending.setdefault(name, [0, 0])
+            pending[0] += 1
+            pending[1] += len(line)
+            if self._over_threshold(name):
+                self._wakeup.set()
+
+    # =============== COMPACTION ===============
+
+    def _over_threshold(self, name: str) -> bool:
+        ops, size = self._pending.get(name, (0, 0))
+        return ops >= self.compact_ops or size >= self.compact_bytes
+
+    def compact(self, name: str) -> bool:
+        """Ghi snapshot từ bộ nhớ rồi cắt phần journal đã nằm trong snapshot"""
+        with self._compact_lock:
+            with self.lock(name):
+                ops, offset = self._pending.get(name, (0, 0))
+                if not ops:
+                    return False
+                data = self._data.get(name)
+
+            # Ghi snapshot ngoài lock: request vẫn append tiếp vào journal trong lúc này
+            atomic_write(self.path(name), dumps_compact(data))
+
+            with self.lock(name):
+                handle = self._handles.pop(name, None)
+                if handle is not None:
+                    handle.close()
+                journal_path = self.journal_path(name)
+                with open(journal_path, 'rb') as f:
+                    f.seek(offset)
+                    tail = f.read()
+                # Giữ lại các op ghi sau khi chụp snapshot
+                atomic_write(journal_path, tail)
+                pending = self._pending[name]
+                pending[0] -= ops
+                pending[1] = len(tail)
+            return True
+
+    def compact_all(self) -> int:
+        compacted = 0
+        for name in list(self._pending):
+            try:
+                compacted += self.compact(name)
+            except OSError as e:
+                logger.error(f"Journal compaction of {name} failed: {e}")
+        return compacted
+
+    def start(self):
+        """Bật thread nền gộp journal"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._compact_loop, name='journal-compactor', daemon=True)
+        self._thread.start()
+
+    def _compact_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.compact_interval)
+            self._wakeup.clear()
+            for name in list(self._pending):
+                if self._over_threshold(name):
+                    try:
+                        started = time.perf_counter()
+                        self.compact(name)
+                        logger.info(f"Compacted journal {name} in {(time.perf_counter() - started) * 1000:.1f} ms")
+                    except OSError as e:
+                        logger.error(f"Journal compaction of {name} failed: {e}")
+
+    def close(self):
+        """Dừng thread nền, gộp hết journal và đóng file"""
+        if self._thread is None:
+            # Chưa start (vd: server không bind được port) - không đụng tới file
+            return
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.compact_all()
+        for name in list(self._handles):
+            with self.lock(name):
+                handle = self._handles.pop(name, None)
+                if handle is not None:
+                    handle.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'collections': len(self._data),
+            'pending_ops': sum(ops for ops, _ in self._pending.values()),
+            'journal_bytes': sum(size for _, size in self._pending.values()),
+        }
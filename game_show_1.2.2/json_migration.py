@@ -0,0 +1,315 @@
+"""
+Migrate dữ liệu từ các file JSON trong db/ sang db_manager (MongoDB hoặc SQLite).
+
+Ảnh cũ của teams / judges được đọc thẳng bytes từ đĩa (không qua base64) và xử
+lý song song trên process pool (image_processing.process_image_file); ảnh đã
+xử lý được ghi theo lô bằng store_processed_images. Sau mỗi lô, image_id của
+các ảnh đã lưu được ghi vào file checkpoint, nên chạy lại sau khi bị ngắt chỉ
+xử lý các ảnh còn thiếu. Các collection còn lại ghi bằng save_data (ghi lại
+nhiều lần vẫn cho cùng kết quả). Checkpoint bị xóa khi migrate xong.
+
+Với MongoDB, nếu bị ngắt giữa một lô thì file GridFS của lô đó có thể bị mồ côi
+(chưa có trong checkpoint nên sẽ được upload lại); SQLite ghi cả lô trong một
+transaction.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from config import COLLECTIONS, QUESTION_DUPLICATE_THRESHOLD
+from dedup import find_duplicates
+from image_processing import process_image_file
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+# Các file chỉ cần chép nguyên danh sách (save_data)
+LIST_FILES = ('questions', 'used_judges', 'used_questions', 'used_final_questions')
+
+# Số ảnh dùng để đo tốc độ xử lý khi --dry-run
+SAMPLE_IMAGES = 3
+
+
+class ImageTask(NamedTuple):
+    """Một ảnh cũ cần upload: owner là team / judge (dict) sẽ được gán image_id"""
+    owner: Dict[str, Any]
+    field: str          # Trường chứa đường dẫn cũ ('imagePath' / 'image'), bị xóa sau khi migrate
+    path: str
+    name: str
+    owner_id: Optional[str]
+    key: str            # Khóa trong checkpoint (đổi khi file ảnh đổi)
+    size: int
+
+
+def _is_team_image(value: Any) -> bool:
+    # Chấp nhận cả đường dẫn 'images/' và '../../'
+    return isinstance(value, str) and (value.startswith('images/') or value.startswith('../../'))
+
+
+def _is_judge_image(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith('images/')
+
+
+class JsonMigration:
+    """
+        migration = JsonMigration(db_manager, DB_DIRECTORY, application_path, workers=4)
+        migration.plan()   # --dry-run: số bản ghi, số bytes ảnh, thời gian ước tính
+        migration.run()    # migrate, trả về thống kê
+    """
+
+    def __init__(self, db_manager, db_directory: str, base_directory: str, workers: int = 0,
+                 batch_size: int = 20, checkpoint_path: Optional[str] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None):
+        self.db_manager = db_manager
+        self.db_directory = db_directory
+        self.base_directory = base_directory
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_path = checkpoint_path
+        self.on_progress = on_progress
+
+    # =============== INPUT ===============
+
+    def _read_json(self, name: str) -> Optional[Any]:
+        path = os.path.join(self.db_directory, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _image_tasks(self, teams: Optional[List], judges: Optional[List]) -> List[ImageTask]:
+        tasks = []
+        sources = [(team, 'imagePath', team.get('name', 'Unknown Team'), team.get('team_id'), 'team', _is_team_image)
+                   for team in teams or [] if isinstance(team, dict)]
+        sources += [(judge, 'image', judge.get('name', 'Unknown Judge'), judge.get('id'), 'judge', _is_judge_image)
+                    for judge in judges or [] if isinstance(judge, dict)]
+        for owner, field, name, owner_id, kind, is_local in sources:
+            value = owner.get(field)
+            if not is_local(value):
+                continue
+            path = os.path.normpath(os.path.join(self.base_directory, value))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                tasks.append(ImageTask(owner, field, path, name, owner_id, '', -1))
+                continue
+            key = f"{kind}:{owner_id}:{path}:{stat.st_size}:{stat.st_mtime_ns}"
+            tasks.append(ImageTask(owner, field, path, name, owner_id, key, stat.st_size))
+        return tasks
+
+    # =============== CHECKPOINT ===============
+
+    def _target(self) -> str:
+        """Database đích - checkpoint của database khác bị bỏ qua"""
+        path = getattr(self.db_manager, 'path', None)
+        if path:
+            return f"{self.db_manager.backend}:{os.path.abspath(path)}"
+        return f"{self.db_manager.backend}:{self.db_manager.db.name}"
+
+    def _load_checkpoint(self, target: Optional[str]) -> Dict[str, str]:
+        """key ảnh -> image_id đã lưu ở lần chạy trước"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable migration checkpoint {self.checkpoint_path}: {e}")
+            return {}
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            return {}
+        if target is not None and checkpoint.get('target') != target:
+            logger.warning(f"Ignoring migration checkpoint for another database: {checkpoint.get('target')}")
+            return {}
+        return dict(checkpoint.get('images') or {})
+
+    def _save_checkpoint(self, target: str, images: Dict[str, str]):
+        if not self.checkpoint_path:
+            return
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'target': target, 'images': images}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # =============== DRY RUN ===============
+
+    def plan(self) -> Dict[str, Any]:
+        """Thống kê những gì sẽ được migrate, không ghi gì vào database"""
+        teams = self._read_json('teams')
+        judges = self._read_json('judges')
+        tasks = self._image_tasks(teams, judges)
+        done = self._load_checkpoint(None)
+
+        found = [task for task in tasks if task.size >= 0]
+        pending = [task for task in found if task.key not in done]
+        pending_bytes = sum(task.size for task in pending)
+
+        # Đo tốc độ xử lý trên vài ảnh đầu rồi nhân theo số bytes còn lại
+        sample_bytes = 0
+        sample_seconds = 0.0
+        for task in pending[:SAMPLE_IMAGES]:
+            started = time.perf_counter()
+            try:
+                process_image_file(task.path)
+            except Exception as e:
+                logger.warning(f"Sample image {task.path} failed: {e}")
+                continue
+            sample_seconds += time.perf_counter() - started
+            sample_bytes += task.size
+        estimated = None
+        if sample_bytes:
+            parallel = min(self.workers, len(pending)) or 1
+            estimated = round(sample_seconds / sample_bytes * pending_bytes / parallel, 1)
+
+        collections = {'teams': len(teams) if teams is not None else None,
+                       'judges': len(judges) if judges is not None else None}
+        for name in LIST_FILES:
+            data = self._read_json(name)
+            collections[name] = len(data) if isinstance(data, list) else None
+
+        return {
+            'collections': collections,
+            'images': len(found),
+            'image_bytes': sum(task.size for task in found),
+            'missing_images': [task.path for task in tasks if task.size < 0],
+            'already_migrated': len(found) - len(pending),
+            'pending_images': len(pending),
+            'pending_bytes': pending_bytes,
+            'workers': self.workers,
+            'batch_size': self.batch_size,
+            'sampled_images': min(len(pending), SAMPLE_IMAGES),
+            'estimated_seconds': estimated,
+        }
+
+    # =============== RUN ===============
+
+    def _processed_images(self, tasks: List[ImageTask]):
+        """(task, processed hoặc None) theo thứ tự tasks, tối đa 2 * workers ảnh đang xử lý cùng lúc"""
+        if self.workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                try:
+                    yield task, process_image_file(task.path)
+                except Exception as e:
+                    logger.error(f"Failed to process image for '{task.name}': {e}")
+                    yield task, None
+            return
+
+        # 'spawn' giống ImageJobQueue: không fork các thread của pymongo
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            window = deque()
+            for task in tasks:
+                window.append((task, pool.submit(process_image_file, task.path)))
+                if len(window) >= self.workers * 2:
+                    yield self._result(*window.popleft())
+            while window:
+                yield self._result(*window.popleft())
+
+    @staticmethod
+    def _result(task: ImageTask, future):
+        try:
+            return task, future.result()
+        except Exception as e:
+            logger.error(f"Failed to process image for '{task.name}': {e}")
+            return task, None
+
+    def _migrate_images(self, tasks: List[ImageTask], done: Dict[str, str], target: str) -> Dict[str, int]:
+        pending = [task for task in tasks if task.size >= 0 and task.key not in done]
+        stats = {'total': len(tasks), 'resumed': sum(task.key in done for task in tasks),
+                 'missing': sum(task.size < 0 for task in tasks), 'stored': 0, 'failed': 0}
+        finished = 0
+
+        def flush(batch):
+            results = self.db_manager.store_processed_images(
+                [(processed, task.name, task.owner_id) for task, processed in batch])
+            for (task, _), result in zip(batch, results):
+                if result:
+                    done[task.key] = result['image_id']
+                    stats['stored'] += 1
+                else:
+                    stats['failed'] += 1
+            self._save_checkpoint(target, done)
+
+        batch = []
+        for task, processed in self._processed_images(pending):
+            finished += 1
+            if processed is None:
+                stats['failed'] += 1
+            else:
+                batch.append((task, processed))
+                if len(batch) >= self.batch_size:
+                    flush(batch)
+                    batch = []
+            if self.on_progress:
+                self.on_progress(finished, len(pending))
+        if batch:
+            flush(batch)
+        return stats
+
+    def run(self) -> Dict[str, Any]:
+        """Migrate toàn bộ; raise nếu một bước ghi lỗi (checkpoint được giữ lại để chạy tiếp)"""
+        started = time.perf_counter()
+        target = self._target()
+        done = self._load_checkpoint(target)
+        if done:
+            logger.info(f"Resuming migration: {len(done)} images already stored")
+
+        teams = self._read_json('teams')
+        judges = self._read_json('judges')
+        tasks = self._image_tasks(teams, judges)
+        image_stats = self._migrate_images(tasks, done, target)
+
+        # Gán image_id cho team / judge, xóa đường dẫn cũ (ảnh lỗi giữ nguyên đường dẫn)
+        for task in tasks:
+            image_id = done.get(task.key) if task.key else None
+            if image_id:
+                task.owner['image_id'] = image_id
+                task.owner.pop(task.field, None)
+
+        if teams is not None:
+            self.db_manager._replace_teams(teams)
+            logger.info("Migrated teams.json")
+        if judges is not None:
+            if not self.db_manager.save_data(COLLECTIONS['judges'], judges):
+                raise RuntimeError("Could not save judges")
+            logger.info("Migrated judges.json")
+
+        question_duplicates = []
+        for name in LIST_FILES:
+            data = self._read_json(name)
+            if data is None:
+                continue
+            if name == 'questions':
+                # Chỉ báo cáo, không tự bỏ câu nào (câu gần giống vẫn có thể là câu khác nhau)
+                question_duplicates = find_duplicates(data, QUESTION_DUPLICATE_THRESHOLD)
+                if question_duplicates:
+                    logger.warning(f"questions.json has {len(question_duplicates)} groups of near-duplicate questions")
+            if not self.db_manager.save_data(COLLECTIONS[name], data):
+                raise RuntimeError(f"Could not save {name}")
+            logger.info(f"Migrated {name}.json")
+
+        login = self._read_json('login')
+        if login is not None:
+            self.db_manager.set_login_status(login.get('logged_in', False))
+            logger.info("Migrated login.json")
+
+        self.clear_checkpoint()
+        return {
+            'images': image_stats,
+            'image_bytes': sum(task.size for task in tasks if task.size > 0),
+            'elapsed_seconds': round(time.perf_counter() - started, 2),
+            'question_duplicates': question_duplicates,
+        }
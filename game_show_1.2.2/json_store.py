@@ -0,0 +1,168 @@
+"""
+Lưu trữ JSON dạng file cho server_python.py (db/<name>.json).
+
+Ghi: serialize gọn -> file tạm cùng thư mục -> fsync -> os.replace, trong lock
+riêng của từng file. Hai lần lưu cùng lúc hoặc mất điện giữa chừng không bao
+giờ để lại file JSON bị cắt cụt - người đọc luôn thấy bản cũ hoặc bản mới.
+
+Đọc: giữ bản đã parse trong bộ nhớ, chỉ parse lại khi mtime / size của file
+đổi (ví dụ sửa tay file trong db/). Object trả về được dùng chung giữa các
+request - không sửa trực tiếp, hãy dùng update().
+"""
+
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def dumps_compact(data: Any) -> bytes:
+    """JSON gọn (không indent, không khoảng trắng thừa), giữ nguyên tiếng Việt"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def fsync_directory(directory: str):
+    """fsync thư mục để os.replace bền qua mất điện (Windows không hỗ trợ, bỏ qua)"""
+    if os.name == 'nt':
+        return
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError as e:
+        logger.debug(f"fsync directory {directory} failed: {e}")
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write(file_path: str, body: bytes):
+    """Ghi bytes vào file tạm cùng thư mục, fsync rồi os.replace đè lên file_path"""
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    prefix = '.' + os.path.basename(file_path) + '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix='.tmp', dir=directory)
+    try:
+        # mkstemp tạo file 0600 - giữ quyền của file cũ (hoặc 0644 cho file mới)
+        try:
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+
+
+class JsonFileStore:
+    """Đọc / ghi các file <name>.json trong một thư mục"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # name -> ((st_mtime_ns, st_size), data)
+        self._cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def lock(self, name: str) -> threading.RLock:
+        """Lock của một file (tạo khi dùng lần đầu)"""
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.RLock()
+            return lock
+
+    @staticmethod
+    def _signature(stat) -> Tuple[int, int]:
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def read(self, name: str, default: Any = None) -> Any:
+        """
+        Đọc dữ liệu của file; trả về default nếu file chưa tồn tại.
+        Raise json.JSONDecodeError nếu file hỏng.
+        """
+        file_path = self.path(name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return default
+
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == self._signature(stat):
+            return cached[1]
+
+        with self.lock(name):
+            # Thread khác có thể vừa parse xong trong lúc chờ lock
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                return default
+            cached = self._cache.get(name)
+            if cached is not None and cached[0] == self._signature(stat):
+                return cached[1]
+
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8-sig')) if raw.strip() else default
+            self._cache[name] = (self._signature(stat), data)
+            return data
+
+    def write(self, name: str, data: Any):
+        """Ghi nguyên tử: file tạm + fsync + os.replace"""
+        body = dumps_compact(data)
+        file_path = self.path(name)
+
+        with self.lock(name):
+            atomic_write(file_path, body)
+            self._cache[name] = (self._signature(os.stat(file_path)), data)
+
+    def update(self, name: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        """
+        Đọc - sửa - ghi trong lock của file. func nhận dữ liệu hiện tại và trả về
+        dữ liệu mới (hoặc chính object cũ nếu không có gì thay đổi - khi đó không ghi).
+        """
+        with self.lock(name):
+            current = self.read(name, default)
+            new_data = func(current)
+            if new_data is not current:
+                self.write(name, new_data)
+            return new_data
+
+    def add_item(self, name: str, value: Any) -> bool:
+        """Thêm value vào list nếu chưa có; trả về True nếu có thay đổi"""
+        with self.lock(name):
+            items = self.read(name, [])
+            if value in items:
+                return False
+            self.write(name, items + [value])
+            return True
+
+    def remove_item(self, name: str, value: Any) -> bool:
+        """Bỏ value khỏi list; trả về True nếu có thay đổi"""
+        with self.lock(name):
+            items = self.read(name, [])
+            if value not in items:
+                return False
+            self.write(name, [item for item in items if item != value])
+            return True
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Load test cho Game Show server
+Mô phỏng nhiều màn hình trình duyệt cùng gọi API và đo throughput / độ trễ p50-p99.
+
+Ví dụ:
+    python load_test.py --clients 60 --duration 20
+    python load_test.py --port 8126 --paths /api/data/questions /api/data/used_questions
+"""
+
+import argparse
+import http.client
+import threading
+import time
+import sys
+
+DEFAULT_PATHS = [
+    '/api/data/questions',
+    '/api/data/teams',
+    '/api/data/used_questions',
+    '/api/data/judges',
+    '/api/health',
+]
+
+
+def percentile(sorted_values, pct):
+    """Lấy percentile từ danh sách đã sắp xếp (nearest-rank)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def client_worker(host, port, paths, deadline, latencies, errors, lock):
+    """Một 'màn hình' gửi request liên tục cho tới hết thời gian"""
+    local_latencies = []
+    local_errors = 0
+    conn = None
+    index = 0
+
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+            if response.will_close:
+                conn.close()
+                conn = None
+        except Exception:
+            local_errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        local_latencies.append(time.perf_counter() - start)
+
+    if conn is not None:
+        conn.close()
+
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def run_load_test(host, port, clients, duration, paths):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    threads = [
+        threading.Thread(target=client_worker, args=(host, port, paths, deadline, latencies, errors, lock), daemon=True)
+        for _ in range(clients)
+    ]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] * 1000) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test cho Game Show server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8127)
+    parser.add_argument('--clients', type=int, default=60, help='Số client đồng thời (mặc định 60)')
+    parser.add_argument('--duration', type=float, default=15.0, help='Thời gian chạy (giây)')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help='Các URL sẽ được gọi xoay vòng')
+    args = parser.parse_args()
+
+    print("Game Show Load Test")
+    print("=" * 50)
+    print(f"Target:   http://{args.host}:{args.port}")
+    print(f"Clients:  {args.clients}")
+    print(f"Duration: {args.duration:.0f}s")
+    print(f"Paths:    {', '.join(args.paths)}")
+    print("-" * 50)
+
+    result = run_load_test(args.host, args.port, args.clients, args.duration, args.paths)
+
+    print(f"Requests:   {result['requests']} ({result['errors']} errors)")
+    print(f"Throughput: {result['throughput']:.1f} req/s")
+    print(f"Latency:    p50 {result['p50_ms']:.1f} ms | p95 {result['p95_ms']:.1f} ms | "
+          f"p99 {result['p99_ms']:.1f} ms | max {result['max_ms']:.1f} ms")
+
+    sys.exit(1 if result['requests'] == 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Các tác vụ bảo trì database (dùng backend theo DATABASE_BACKEND giống server_mongodb.py)
+
+    python maintenance.py gc              # xóa ảnh không còn team / judge nào dùng, sửa ref_count
+    python maintenance.py gc --dry-run    # chỉ thống kê, không xóa gì
+    python maintenance.py gc --min-age 0  # không chừa các ảnh vừa upload
+"""
+
+import argparse
+import sys
+
+from config import DATABASE_BACKEND, IMAGE_GC_MIN_AGE
+from migrate import format_bytes
+
+if DATABASE_BACKEND == 'sqlite':
+    from sqlite_database import db_manager
+else:
+    from database import db_manager
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bao tri database Game Show")
+    commands = parser.add_subparsers(dest='command', required=True)
+    gc = commands.add_parser('gc', help="don anh khong con duoc tham chieu")
+    gc.add_argument('--dry-run', action='store_true', help="chi thong ke, khong xoa")
+    gc.add_argument('--min-age', type=float, default=IMAGE_GC_MIN_AGE,
+                    help=f"bo qua anh duoc dung toi trong N giay gan nhat (mac dinh {IMAGE_GC_MIN_AGE})")
+    args = parser.parse_args()
+    if args.min_age < 0:
+        parser.error("--min-age must be >= 0")
+    return args
+
+
+def run_gc(args):
+    stats = db_manager.collect_garbage(dry_run=args.dry_run, min_age=args.min_age)
+    if stats is None:
+        print("❌ Don anh that bai! Kiem tra logs de biet them chi tiet.")
+        return False
+    print(f"\n{'Dry run - khong xoa du lieu.' if args.dry_run else 'Don anh hoan thanh.'}")
+    print("-" * 30)
+    print(f"  Anh da kiem tra: {stats['images']}")
+    print(f"  Anh khong con tham chieu: {stats['deleted_images']}")
+    print(f"  ref_count da sua: {stats['ref_counts_fixed']}")
+    print(f"  File mo coi: {stats['orphan_files']}")
+    print(f"  Dung luong {'co the giai phong' if args.dry_run else 'da giai phong'}: "
+          f"{format_bytes(stats['freed_bytes'])}")
+    return True
+
+
+def main():
+    args = parse_args()
+    if not db_manager.connect():
+        print(f"❌ Không thể kết nối tới database ({DATABASE_BACKEND})!")
+        sys.exit(1)
+    try:
+        ok = run_gc(args)
+    finally:
+        db_manager.disconnect()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,78 @@
 #!/usr/bin/env python3
 """
-Migration script to transfer data from JSON files to MongoDB
-Chạy script này để chuyển đổi dữ liệu hiện tại sang MongoDB
+Migration script to transfer data from JSON files to MongoDB (hoặc SQLite khi DATABASE_BACKEND=sqlite)
+Chạy script này để chuyển đổi dữ liệu hiện tại sang database
+
+    python migrate.py                 # migrate (chạy tiếp từ checkpoint nếu lần trước bị ngắt)
+    python migrate.py --dry-run       # chỉ thống kê số bản ghi, dung lượng ảnh, thời gian ước tính
+    python migrate.py --workers 8 --batch-size 50
+    python migrate.py --restart       # bỏ checkpoint cũ, migrate lại từ đầu
 """
 
+import argparse
 import sys
 import os
-from database import db_manager
-from config import DB_DIRECTORY
+from config import (
+    DATABASE_BACKEND, DB_DIRECTORY, COLLECTIONS, IMAGE_WORKERS, MIGRATE_BATCH_SIZE, MIGRATE_CHECKPOINT_PATH
+)
+from database import application_path
+from json_migration import JsonMigration
+
+if DATABASE_BACKEND == 'sqlite':
+    from sqlite_database import db_manager
+else:
+    from database import db_manager
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate db/*.json va anh cu sang MongoDB / SQLite")
+    parser.add_argument('--workers', type=int, default=IMAGE_WORKERS,
+                        help="so process xu ly anh (0 = tu chon theo so CPU, toi da 4)")
+    parser.add_argument('--batch-size', type=int, default=MIGRATE_BATCH_SIZE,
+                        help=f"so anh ghi vao database moi lo (mac dinh {MIGRATE_BATCH_SIZE})")
+    parser.add_argument('--checkpoint', default=MIGRATE_CHECKPOINT_PATH,
+                        help="file luu tien do de chay tiep sau khi bi ngat")
+    parser.add_argument('--restart', action='store_true', help="bo checkpoint cu, migrate lai tu dau")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="chi thong ke va uoc tinh thoi gian, khong ket noi / ghi database")
+    args = parser.parse_args()
+    if args.workers < 0 or args.batch_size < 1:
+        parser.error("--workers must be >= 0 and --batch-size >= 1")
+    return args
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def database_location():
+    """Đường dẫn file SQLite hoặc tên database MongoDB"""
+    return getattr(db_manager, 'path', None) or db_manager.db.name
+
+def print_plan(migration):
+    """--dry-run: in thống kê, không ghi gì"""
+    plan = migration.plan()
+    print("\nDry run - khong ghi du lieu.")
+    print("-" * 30)
+    for name, count in plan['collections'].items():
+        print(f"  {name}: {'khong co file' if count is None else f'{count} items'}")
+    print(f"\n  Anh: {plan['images']} file, {format_bytes(plan['image_bytes'])}")
+    for path in plan['missing_images']:
+        print(f"  Khong tim thay anh: {path}")
+    if plan['already_migrated']:
+        print(f"  Da migrate (checkpoint): {plan['already_migrated']} anh")
+    print(f"  Can xu ly: {plan['pending_images']} anh, {format_bytes(plan['pending_bytes'])} "
+          f"({plan['workers']} workers, lo {plan['batch_size']} anh)")
+    if plan['estimated_seconds'] is not None:
+        print(f"  Uoc tinh thoi gian xu ly anh: ~{plan['estimated_seconds']} giay "
+              f"(do tren {plan['sampled_images']} anh, chua tinh thoi gian upload)")
+
+def print_progress(done, total):
+    print(f"\r  Anh: {done}/{total}", end='' if done < total else '\n', flush=True)
 
 def main():
+    args = parse_args()
     print("Game Show Data Migration Tool")
     print("=" * 50)
     
@@ -18,15 +81,26 @@ def main():
         print(f"❌ Không tìm thấy thư mục dữ liệu: {DB_DIRECTORY}")
         sys.exit(1)
     
-    # Kết nối MongoDB
-    print("Dang ket noi toi MongoDB...")
+    migration = JsonMigration(db_manager, DB_DIRECTORY, application_path, workers=args.workers,
+                              batch_size=args.batch_size, checkpoint_path=args.checkpoint)
+    if args.restart:
+        migration.clear_checkpoint()
+    if args.dry_run:
+        print_plan(migration)
+        return
+    
+    # Kết nối database
+    print(f"Dang ket noi toi database ({DATABASE_BACKEND})...")
     if not db_manager.connect():
-        print("❌ Không thể kết nối tới MongoDB!")
-        print("💡 Hãy đảm bảo MongoDB đang chạy và cấu hình connection string đúng")
-        print(f"   Connection string hiện tại: {db_manager.client}")
+        if DATABASE_BACKEND == 'sqlite':
+            print(f"❌ Không thể mở file SQLite: {db_manager.path}")
+        else:
+            print("❌ Không thể kết nối tới MongoDB!")
+            print("💡 Hãy đảm bảo MongoDB đang chạy và cấu hình connection string đúng")
+            print(f"   Connection string hiện tại: {db_manager.client}")
         sys.exit(1)
     
-    print("Ket noi MongoDB thanh cong!")
+    print("Ket noi database thanh cong!")
     
     # Xác nhận migration
     # response = input("\nWARNING: Migration se xoa tat ca du lieu hien co trong MongoDB.\nBan co chac chan muon tiep tuc? (y/N): ")
@@ -38,12 +112,19 @@ def main():
     
     # Thực hiện migration
     print("\nBat dau migration...")
-    success = db_manager.migrate_from_json_files()
+    success = db_manager.migrate_from_json_files(workers=args.workers, batch_size=args.batch_size,
+                                                 checkpoint_path=args.checkpoint, on_progress=print_progress)
     
     if success:
         print("\nMigration hoan thanh thanh cong!")
         
         # Hiển thị thống kê
+        stats = db_manager.last_migration_stats
+        images = stats['images']
+        print(f"\nAnh: {images['stored']} da luu, {images['resumed']} tu checkpoint, "
+              f"{images['failed']} loi, {images['missing']} khong tim thay file "
+              f"({format_bytes(stats['image_bytes'])}, {stats['elapsed_seconds']} giay)")
+        
         print("\nThong ke du lieu sau migration:")
         print("-" * 30)
         
@@ -57,21 +138,25 @@ def main():
         ]
         
         for collection_key, display_name in collections_info:
-            try:
-                if collection_key == 'images':
-                    count = db_manager.db['images'].count_documents({})
-                else:
-                    from config import COLLECTIONS
-                    count = db_manager.db[COLLECTIONS[collection_key]].count_documents({})
-                print(f"  {display_name}: {count} items")
-            except Exception as e:
-                print(f"  {display_name}: Error - {e}")
+            count = db_manager.count_documents(COLLECTIONS[collection_key])
+            print(f"  {display_name}: {'Error' if count is None else f'{count} items'}")
+        
+        # Câu hỏi gần trùng (chỉ báo cáo, dữ liệu vẫn được migrate nguyên vẹn)
+        duplicates = db_manager.last_migration_stats.get('question_duplicates', [])
+        if duplicates:
+            print(f"\nCanh bao: {len(duplicates)} nhom cau hoi gan trung nhau:")
+            for group in duplicates[:20]:
+                indexes = ', '.join(str(item['index'] + 1) for item in group['questions'])
+                print(f"  - cau {indexes} (giong {group['similarity']:.0%}): {group['questions'][0]['question'][:60]}")
+            if len(duplicates) > 20:
+                print(f"  ... va {len(duplicates) - 20} nhom khac (xem GET /api/questions/duplicates)")
         
-        print(f"\nDu lieu da duoc chuyen doi thanh cong sang MongoDB!")
-        print(f"Database: {db_manager.db.name}")
+        print(f"\nDu lieu da duoc chuyen doi thanh cong sang {DATABASE_BACKEND}!")
+        print(f"Database: {database_location()}")
         
     else: 
         print("Migration that bai! Kiem tra logs de biet them chi tiet.")
+        print(f"Chay lai 'python migrate.py' de tiep tuc tu checkpoint: {args.checkpoint}")
         sys.exit(1)
     
     # Ngắt kết nối
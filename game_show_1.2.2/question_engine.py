@@ -0,0 +1,224 @@
+"""
+Ngân hàng câu hỏi phía server cho lưới câu hỏi Phần 1 / Phần 2.
+
+Ô số N của Phần 1 là câu hỏi thứ N (theo thứ tự trong collection questions)
+có part == 1 và được đánh dấu bằng giá trị N trong used_questions; Phần 2 dùng
+part == 2 và giá trị 'part2_N' (giữ nguyên định dạng cũ của script.js).
+
+QuestionEngine giữ cho từng phần danh sách ô chưa dùng kèm vị trí của từng ô,
+nên bốc ngẫu nhiên hay gạch một ô là O(1) (đổi chỗ với phần tử cuối rồi pop).
+Trạng thái lưới gửi cho client là bitmap các ô đã dùng (base64) cùng số câu
+hỏi của phần đó, thay vì toàn bộ questions + used_questions.
+
+Engine không tự lưu gì: dữ liệu đọc qua load_questions / load_used (object
+dùng chung của JsonFileStore / db_manager) và chỉ dựng lại khi object đổi.
+"""
+
+import base64
+import random
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_USED_VALUE_RE = re.compile(r'^part(\d+)_(\d+)$')
+
+
+def used_value(part: int, number: int) -> Any:
+    """Giá trị lưu trong used_questions cho ô number của phần part"""
+    return number if part == 1 else f"part{part}_{number}"
+
+
+def parse_used_value(value: Any) -> Optional[Tuple[int, int]]:
+    """Ngược lại của used_value: trả về (part, number) hoặc None nếu không phải ô câu hỏi"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return 1, value
+    if isinstance(value, str):
+        match = _USED_VALUE_RE.match(value)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def encode_bitmap(numbers: Iterable[int], size: int) -> str:
+    """Bitmap base64: ô N (1..size) là bit (N-1) % 8 của byte (N-1) // 8"""
+    bits = bytearray((size + 7) // 8)
+    for number in numbers:
+        if 1 <= number <= size:
+            bits[(number - 1) >> 3] |= 1 << ((number - 1) & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+class QuestionPool:
+    """Lưới của một phần: câu hỏi theo ô và tập ô đã dùng"""
+
+    def __init__(self, part: int, size: int, questions: List[Dict], used_numbers: Iterable[int]):
+        self.part = part
+        self.size = size
+        # Ô N -> questions[N - 1]
+        self.questions = questions
+        self.used = {number for number in used_numbers if 1 <= number <= size}
+
+        self._unused = [number for number in range(1, self.available + 1) if number not in self.used]
+        self._positions = {number: index for index, number in enumerate(self._unused)}
+        # Ô nhỏ nhất có thể còn trống (chỉ tăng, vì engine chỉ gạch thêm ô)
+        self._cursor = 1
+
+    @property
+    def available(self) -> int:
+        """Số ô có câu hỏi (các ô sau đó bị khoá trên lưới)"""
+        return min(len(self.questions), self.size)
+
+    def remaining(self) -> int:
+        return len(self._unused)
+
+    def mark(self, number: int):
+        """Gạch ô number: O(1)"""
+        self.used.add(number)
+        index = self._positions.pop(number, None)
+        if index is None:
+            return
+        last = self._unused.pop()
+        if last != number:
+            self._unused[index] = last
+            self._positions[last] = index
+
+    def next_number(self) -> Optional[int]:
+        """Ô chưa dùng có số nhỏ nhất"""
+        while self._cursor <= self.available and self._cursor in self.used:
+            self._cursor += 1
+        return self._cursor if self._cursor <= self.available else None
+
+    def random_number(self, rng: random.Random) -> Optional[int]:
+        """Một ô chưa dùng bất kỳ: O(1)"""
+        return rng.choice(self._unused) if self._unused else None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'part': self.part,
+            'size': self.size,
+            'count': len(self.questions),
+            'remaining': self.remaining(),
+            'used': encode_bitmap(self.used, self.size),
+        }
+
+
+class QuestionEngine:
+    """
+    Lưới câu hỏi của mọi phần trên một nguồn dữ liệu.
+
+    load_questions() / load_used() trả về list questions / used_questions hiện tại,
+    mark_used(value) đánh dấu một giá trị và trả về True / False (đã có sẵn) / None (lỗi).
+    """
+
+    def __init__(self, load_questions: Callable[[], Any], load_used: Callable[[], Any],
+                 mark_used: Callable[[Any], Optional[bool]], grid_sizes: Dict[int, int],
+                 rng: Optional[random.Random] = None):
+        self._load_questions = load_questions
+        self._load_used = load_used
+        self._mark_used = mark_used
+        self.grid_sizes = dict(grid_sizes)
+        self._rng = rng or random.SystemRandom()
+
+        self._lock = threading.Lock()
+        self._pools: Dict[int, QuestionPool] = {}
+        self._questions_source = None
+        self._used_source = None
+        self.rebuilds = 0
+
+    def _sync(self):
+        """Dựng lại các pool nếu questions / used_questions đã đổi (so sánh theo object)"""
+        questions = self._load_questions()
+        used = self._load_used()
+        if questions is None:
+            questions = []
+        if used is None:
+            used = []
+        if questions is self._questions_source and used is self._used_source and self._pools:
+            return
+
+        by_part = {part: [] for part in self.grid_sizes}
+        for question in questions:
+            if isinstance(question, dict):
+                part = question.get('part')
+                if part in by_part and not isinstance(part, bool):
+                    by_part[part].append(question)
+
+        used_by_part = {part: [] for part in self.grid_sizes}
+        for value in used:
+            parsed = parse_used_value(value)
+            if parsed and parsed[0] in used_by_part:
+                used_by_part[parsed[0]].append(parsed[1])
+
+        self._pools = {part: QuestionPool(part, size, by_part[part], used_by_part[part])
+                       for part, size in self.grid_sizes.items()}
+        self._questions_source = questions
+        self._used_source = used
+        self.rebuilds += 1
+
+    def _pool(self, part: int) -> QuestionPool:
+        pool = self._pools.get(part)
+        if pool is None:
+            raise ValueError(f"Unknown question part: {part}")
+        return pool
+
+    def grid(self, part: int) -> Dict[str, Any]:
+        """Trạng thái lưới của một phần (bitmap ô đã dùng + số câu hỏi)"""
+        with self._lock:
+            self._sync()
+            return self._pool(part).status()
+
+    def draw(self, part: int, mode: str = 'next', number: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Chọn một ô và đánh dấu đã dùng.
+            number   - đúng ô đó (chọn lại ô đã dùng vẫn trả về câu hỏi)
+            'next'   - ô chưa dùng có số nhỏ nhất
+            'random' - ô chưa dùng ngẫu nhiên
+        Returns:
+            {'number', 'question', 'changed', 'grid'} hoặc None nếu đã hết ô trống.
+        Raise ValueError nếu tham số sai, RuntimeError nếu không lưu được.
+        """
+        if number is None and mode not in ('next', 'random'):
+            raise ValueError(f"Unknown draw mode: {mode}")
+
+        with self._lock:
+            self._sync()
+            pool = self._pool(part)
+            if number is not None and not 1 <= number <= pool.available:
+                raise ValueError(f"Question {number} of part {part} does not exist")
+
+            while True:
+                chosen = number
+                if chosen is None:
+                    chosen = pool.next_number() if mode == 'next' else pool.random_number(self._rng)
+                    if chosen is None:
+                        return None
+
+                value = used_value(part, chosen)
+                changed = self._mark_used(value)
+                if changed is None:
+                    raise RuntimeError("Failed to mark question as used")
+                pool.mark(chosen)
+                if changed:
+                    self._adopt_used(value)
+                if changed or number is not None:
+                    break
+                # Máy khác vừa bốc ô này trước - bốc ô khác
+
+            return {
+                'part': part,
+                'number': chosen,
+                'question': pool.questions[chosen - 1],
+                'changed': changed,
+                'grid': pool.status(),
+            }
+
+    def _adopt_used(self, value: Any):
+        """
+        Sau khi tự ghi thêm một giá trị: nhận list used mới làm nguồn mà không
+        dựng lại pool, nếu nó đúng là list cũ thêm đúng giá trị đó.
+        """
+        used = self._load_used()
+        previous = self._used_source
+        if (used is not None and previous is not None
+                and len(used) == len(previous) + 1 and used[-1] == value):
+            self._used_source = used
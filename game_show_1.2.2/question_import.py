@@ -0,0 +1,225 @@
+"""
+Nhập câu hỏi từ file CSV phía server (POST /api/import/questions).
+
+Định dạng giống data/cau_hoi_dap_an_new.csv:
+
+    "ques","ans_1","ans_2","ans_3","ans_4","ans_5","correct_ans"
+
+ans_3..ans_5 có thể thiếu hoặc để trống. Body được đọc từng dòng thẳng từ
+socket (không giữ cả file trong bộ nhớ) và trả về theo lô BATCH_SIZE câu cho
+DatabaseManager.import_documents. Dòng lỗi được bỏ qua và ghi lại số dòng +
+lý do; câu hỏi trùng (cùng nội dung sau khi bỏ khác biệt hoa / thường và
+khoảng trắng) chỉ giữ lần xuất hiện đầu tiên. Câu gần trùng với một câu trước
+đó trong file (dedup.py) vẫn được nhập nhưng được báo lại kèm số dòng.
+
+id của câu hỏi là 'csv_<hash nội dung>' nên nhập lại cùng một file sẽ
+ghi đè đúng các câu cũ thay vì tạo bản sao.
+"""
+
+import csv
+import hashlib
+import io
+from typing import Any, Dict, Iterator, List, Optional
+
+from dedup import DuplicateDetector
+
+ANSWER_COLUMNS = ('ans_1', 'ans_2', 'ans_3', 'ans_4', 'ans_5')
+ANSWER_LETTERS = ('A', 'B', 'C', 'D', 'E')
+REQUIRED_COLUMNS = ('ques', 'ans_1', 'ans_2', 'correct_ans')
+DEFAULT_QUESTION_TIME = 300  # Giống parseCSV trong script.js
+
+
+class BoundedReader(io.RawIOBase):
+    """Đọc đúng `length` bytes từ stream (rfile của kết nối keep-alive không tự EOF)"""
+
+    def __init__(self, stream, length: int):
+        self._stream = stream
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        size = min(len(buffer), self.remaining)
+        data = self._stream.read(size)
+        if not data:
+            # Client ngắt kết nối giữa chừng
+            raise ConnectionError(f"Upload ended with {self.remaining} bytes missing")
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def question_key(text: str) -> str:
+    """Khóa dedup của câu hỏi: bỏ khác biệt hoa / thường và khoảng trắng"""
+    normalized = ' '.join(text.split()).casefold()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def build_question(row: Dict[str, str], part: int) -> Dict[str, Any]:
+    """Một dòng CSV -> document câu hỏi cùng cấu trúc với parseCSV; raise ValueError nếu dòng không hợp lệ"""
+    question = (row.get('ques') or '').strip()
+    if not question:
+        raise ValueError("Missing question text (ques)")
+
+    answers = {letter: (row.get(column) or '').strip() for letter, column in zip(ANSWER_LETTERS, ANSWER_COLUMNS)}
+    if not answers['A'] or not answers['B']:
+        raise ValueError("At least two answers (ans_1, ans_2) are required")
+
+    correct = (row.get('correct_ans') or '').strip().upper()
+    if correct not in answers:
+        raise ValueError(f"correct_ans must be one of A-E, got {correct!r}")
+    if not answers[correct]:
+        raise ValueError(f"correct_ans is {correct} but that answer is empty")
+
+    if any('\ufffd' in value for value in (question, *answers.values())):
+        raise ValueError("Invalid UTF-8 text")
+
+    answer_text = ''.join(f"{letter}: {text}\n" for letter, text in answers.items() if text)
+    answer_text += f"\nĐáp án đúng: {correct}"
+
+    return {
+        'id': f"csv_{question_key(question)}",
+        'part': part,
+        'question': question,
+        'answer_options': answers,
+        'correct_answer': correct,
+        'answer': answer_text,
+        'time': DEFAULT_QUESTION_TIME,
+    }
+
+
+class CsvQuestionImporter:
+    """
+    Parse CSV câu hỏi theo luồng.
+
+        importer = CsvQuestionImporter(BoundedReader(rfile, length), part1_count=58)
+        importer.read_header()              # ValueError nếu thiếu cột
+        db_manager.import_documents(name, importer.batches(), replace=True)
+        importer.summary()
+
+    part1_count câu hợp lệ đầu tiên thuộc Phần 1, các câu sau thuộc Phần 2
+    (giống cách script.js chia phần). duplicate_threshold: báo câu gần trùng
+    (None = không kiểm tra).
+    """
+
+    def __init__(self, stream, part1_count: int, batch_size: int = 500, max_errors: int = 100,
+                 duplicate_threshold: Optional[float] = None):
+        # errors='replace': byte UTF-8 hỏng chỉ làm hỏng dòng chứa nó (báo lỗi theo dòng)
+        self._text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig',
+                                      errors='replace', newline='')
+        self._reader = csv.reader(self._text)
+        self.part1_count = part1_count
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.columns: Optional[List[str]] = None
+
+        self._seen = set()
+        self._detector = DuplicateDetector(duplicate_threshold) if duplicate_threshold else None
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.parts = {1: 0, 2: 0}
+        self.errors: List[Dict[str, Any]] = []
+        self.near_duplicates = 0
+        self.near_duplicate_lines: List[Dict[str, Any]] = []
+
+    def read_header(self) -> List[str]:
+        try:
+            header = next(self._reader)
+        except StopIteration:
+            raise ValueError("CSV file is empty")
+        self.columns = [name.strip().lower() for name in header]
+        missing = [name for name in REQUIRED_COLUMNS if name not in self.columns]
+        if missing:
+            raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+        return self.columns
+
+    def _error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def _rows(self) -> Iterator[Dict[str, Any]]:
+        """Các câu hỏi hợp lệ, chưa trùng, theo thứ tự trong file"""
+        if self.columns is None:
+            self.read_header()
+        while True:
+            try:
+                values = next(self._reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # Vd: trường quá dài - bỏ dòng này, đọc tiếp
+                self.rows += 1
+                self._error(self._reader.line_num, str(e))
+                continue
+
+            if not any(value.strip() for value in values):
+                continue
+            self.rows += 1
+            row = dict(zip(self.columns, values))
+            part = 1 if self.imported < self.part1_count else 2
+            try:
+                question = build_question(row, part)
+            except ValueError as e:
+                self._error(self._reader.line_num, str(e))
+                continue
+
+            if question['id'] in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(question['id'])
+            if self._detector is not None:
+                line = self._reader.line_num
+                match = self._detector.add(line, question['question'])
+                if match is not None:
+                    self.near_duplicates += 1
+                    if len(self.near_duplicate_lines) < self.max_errors:
+                        self.near_duplicate_lines.append(
+                            {'line': line, 'similar_to_line': match[0], 'similarity': round(match[1], 3)})
+            self.imported += 1
+            self.parts[part] += 1
+            yield question
+
+    def batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """Câu hỏi hợp lệ theo lô batch_size phần tử"""
+        batch = []
+        for question in self._rows():
+            batch.append(question)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'near_duplicates': self.near_duplicates,
+            'parts': self.parts,
+            'errors': self.errors,
+            'near_duplicate_lines': self.near_duplicate_lines,
+        }
+
+
+def merge_questions(existing: List[Any], imported: List[Dict], replace: bool) -> List[Any]:
+    """
+    Danh sách câu hỏi mới cho backend file (server_python.py).
+    replace=False: giữ câu cũ, câu trùng id được thay tại chỗ, câu mới thêm vào cuối.
+    """
+    if replace:
+        return imported
+    by_id = {question['id']: question for question in imported}
+    merged = []
+    for question in existing:
+        question_id = question.get('id') if isinstance(question, dict) else None
+        merged.append(by_id.pop(question_id, question) if question_id is not None else question)
+    merged.extend(question for question in imported if question['id'] in by_id)
+    return merged
@@ -249,6 +249,36 @@ async function saveDataToFile(key, data) {
     }
 }
 
+// Đánh dấu / bỏ đánh dấu một phần tử 'đã dùng' (used_questions, used_judges, used_final_questions).
+// Chỉ gửi đúng 1 giá trị lên server, an toàn khi nhiều máy điều khiển bấm cùng lúc.
+async function updateUsedItem(key, value, action = 'add') {
+    try {
+        const response = await fetch(`/api/used/${key}/${action}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ value: value })
+        });
+
+        if (response.ok) {
+            // Update in-memory cache
+            if (window._dataCache && Array.isArray(window._dataCache[key])) {
+                const items = window._dataCache[key].filter(item => item !== value);
+                if (action === 'add') items.push(value);
+                window._dataCache[key] = items;
+            }
+            return true;
+        } else {
+            console.error(`Lỗi cập nhật ${key}:`, response.statusText);
+            return false;
+        }
+    } catch (error) {
+        console.error(`Error updating ${key}:`, error);
+        return false;
+    }
+}
+
 // Clear all data function
 async function clearAllData() {
     try {
@@ -532,62 +562,64 @@ function parseCSVLine(line) {
     return result;
 }
 
-// Hàm load questions từ CSV
+// Hàm load questions từ CSV: gửi nguyên file cho server parse và ghi theo lô
+// (POST /api/import/questions), trình duyệt không phải parse cả file
 async function loadQuestionsFromCSV(showAlert = false) {
-    const csvFiles = ['data/cau_hoi_dap_an_new.csv']; // File CSV mới với nhiều cột đáp án
-    let allCsvQuestions = [];
+    const csvFile = 'data/cau_hoi_dap_an_new.csv'; // File CSV mới với nhiều cột đáp án
 
-    for (const file of csvFiles) {
-        try {
-            const urlWithCacheBust = `${file}?t=${Date.now()}`;
-            console.log(`[CSV LOAD] 🚀 Bắt đầu tải file CSV từ: ${urlWithCacheBust}`);
-            // Thêm timestamp để tránh trình duyệt cache file CSV
-            const response = await fetch(urlWithCacheBust);
-            if (!response.ok) {
-                const errorMsg = `Không thể tải file ${file}`;
-                console.warn(errorMsg);
-                if (showAlert) showToast(errorMsg, 'error');
-                continue;
-            }
-            const csvText = await response.text();
-            console.log(`[CSV LOAD] ✅ Tải thành công file CSV. Bắt đầu phân tích...`);
-            const csvQuestions = parseCSV(csvText);
-            allCsvQuestions.push(...csvQuestions);
-        } catch (error) {
-            const errorMsg = `Lỗi khi load ${file}: ${error.message}`;
-            console.error(errorMsg);
+    try {
+        const urlWithCacheBust = `${csvFile}?t=${Date.now()}`;
+        console.log(`[CSV LOAD] 🚀 Bắt đầu tải file CSV từ: ${urlWithCacheBust}`);
+        // Thêm timestamp để tránh trình duyệt cache file CSV
+        const fileResponse = await fetch(urlWithCacheBust);
+        if (!fileResponse.ok) {
+            const errorMsg = `Không thể tải file ${csvFile}`;
+            console.warn(errorMsg);
             if (showAlert) showToast(errorMsg, 'error');
+            return;
         }
-    }
-
-    // Gán lại id theo thứ tự để đảm bảo không trùng
-    allCsvQuestions.forEach((question, index) => {
-        question.id = 'csv_' + (index + 1);
-    });
+        const csvBlob = await fileResponse.blob();
 
-    // Lấy questions hiện tại và xóa tất cả để đảm bảo chỉ có dữ liệu từ CSV
-    let existingQuestions = await loadDataFromFile('questions', []);
-
-    // XÓA TẤT CẢ QUESTIONS HIỆN TẠI để chỉ giữ dữ liệu từ CSV
-    existingQuestions = [];
-
-    // Thêm questions từ CSV
-    const allQuestions = [...existingQuestions, ...allCsvQuestions];
+        // mode=replace: XÓA TẤT CẢ QUESTIONS HIỆN TẠI để chỉ giữ dữ liệu từ CSV
+        const response = await fetch('/api/import/questions?mode=replace', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'text/csv; charset=utf-8',
+            },
+            body: csvBlob
+        });
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        const result = await response.json();
 
-    await saveDataToFile('questions', allQuestions);
+        if (window._dataCache) {
+            delete window._dataCache['questions'];
+        }
+        if (result.invalid > 0) {
+            console.warn(`[CSV LOAD] ⚠️ ${result.invalid} dòng lỗi:`, result.errors);
+        }
+        if (result.near_duplicates > 0) {
+            console.warn(`[CSV LOAD] ⚠️ ${result.near_duplicates} câu gần trùng câu trước đó:`, result.near_duplicate_lines);
+        }
 
-    // Tính số câu hỏi theo phần
-    const part1Count = allCsvQuestions.filter(q => q.part === 1).length;
-    const part2Count = allCsvQuestions.filter(q => q.part === 2).length;
-    
-    const message = `Đã load ${allCsvQuestions.length} câu hỏi từ CSV (${part1Count} câu phần 1, ${part2Count} câu phần 2), tổng cộng ${allQuestions.length} câu hỏi.`;
-    console.log(message);
-    if (showAlert) {
-        showToast(message, 'success');
-        // Cập nhật thống kê nếu đang ở màn hình quản lý câu hỏi
-        if (document.getElementById('questionManagement').classList.contains('active')) {
-            await loadQuestionStats();
+        let message = `Đã load ${result.imported} câu hỏi từ CSV (${result.parts[1]} câu phần 1, ${result.parts[2]} câu phần 2)`;
+        if (result.duplicates > 0) message += `, bỏ qua ${result.duplicates} câu trùng`;
+        if (result.invalid > 0) message += `, ${result.invalid} dòng lỗi`;
+        if (result.near_duplicates > 0) message += `, ${result.near_duplicates} câu gần trùng (xem console)`;
+        message += '.';
+        console.log(message);
+        if (showAlert) {
+            showToast(message, result.invalid > 0 ? 'warning' : 'success');
+            // Cập nhật thống kê nếu đang ở màn hình quản lý câu hỏi
+            if (document.getElementById('questionManagement').classList.contains('active')) {
+                await loadQuestionStats();
+            }
         }
+    } catch (error) {
+        const errorMsg = `Lỗi khi load ${csvFile}: ${error.message}`;
+        console.error(errorMsg);
+        if (showAlert) showToast(errorMsg, 'error');
     }
 }
 
@@ -675,9 +707,53 @@ async function logout() {
     form.reset();
 }
 
+// Màn hình nào cần vẽ lại khi một loại dữ liệu thay đổi
+const SCREEN_REFRESHERS = {
+    judgeManagement: { keys: ['judges'], refresh: () => loadJudges() },
+    teamImages: { keys: ['teams'], refresh: () => loadTeams() },
+    questionManagement: { keys: ['questions'], refresh: () => loadQuestionStats() },
+    teamListScreen: { keys: ['teams'], refresh: () => loadTeamsGrid() },
+    gameScreen: { keys: ['questions', 'used_questions'], refresh: () => loadQuestionGrid() },
+    gameScreen2: { keys: ['questions', 'used_questions'], refresh: () => loadQuestionGrid2() },
+    finalRound: { keys: ['judges', 'used_judges'], refresh: () => loadFinalRoundJudges() }
+};
+
+// Nhận thông báo thay đổi dữ liệu từ server (Server-Sent Events) thay vì tải lại liên tục.
+// Chỉ màn hình đang hiển thị và dùng đúng collection vừa đổi mới tải lại dữ liệu.
+function subscribeServerEvents() {
+    if (!window.EventSource) return;
+
+    const source = new EventSource('/api/events');
+    source.addEventListener('change', (event) => {
+        let notice;
+        try {
+            notice = JSON.parse(event.data);
+        } catch (e) {
+            return;
+        }
+        console.log(`[EVENTS] 🔔 '${notice.collection}' thay đổi (version ${notice.version})`);
+
+        const activeScreen = document.querySelector('.screen.active');
+        const refresher = activeScreen ? SCREEN_REFRESHERS[activeScreen.id] : null;
+        if (refresher && refresher.keys.includes(notice.collection)) {
+            refresher.refresh();
+        }
+    });
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            // Server không hỗ trợ /api/events (vd: server_python.py)
+            console.warn('[EVENTS] ⚠️ Server không hỗ trợ kênh thông báo.');
+        } else {
+            // EventSource tự kết nối lại (retry do server gửi)
+            console.warn('[EVENTS] ⚠️ Mất kết nối kênh thông báo, đang thử lại...');
+        }
+    };
+}
+
 // Kiểm tra trạng thái đăng nhập khi tải trang
 window.addEventListener('load', async function() {
     await initializeData();
+    subscribeServerEvents();
     // Không tự động load CSV, chỉ load khi người dùng click nút
 
     const loginData = await loadDataFromFile('login', { logged_in: false });
@@ -1040,18 +1116,17 @@ document.getElementById('teamForm').addEventListener('submit', async function(e)
         return;
     }
     
-    // Xử lý và lưu ảnh
-    try {
-        const imageData = await keepOriginalImage(teamImageFile);
-        saveTeam(teamName, imageData);
-    } catch (error) {
-        console.error('Error processing image:', error);
-        showToast('Lỗi khi xử lý ảnh. Vui lòng thử lại.', 'error');
+    if (!isSupportedImageFile(teamImageFile)) {
+        showToast('Định dạng ảnh không được hỗ trợ. Chỉ chấp nhận: JPEG, PNG, GIF, WEBP', 'error');
+        return;
     }
+    
+    // Upload nguyên file ảnh (không chuyển sang base64) và lưu đội
+    saveTeam(teamName, teamImageFile);
 });
 
 // Hàm lưu đội với upload ảnh GridFS
-async function saveTeam(teamName, imageData) {
+async function saveTeam(teamName, imageFile) {
     try {
         let imagePath = '';
         let imageId = null;
@@ -1060,10 +1135,10 @@ async function saveTeam(teamName, imageData) {
         const teamId = 'team_' + Date.now().toString();
         
         // Upload ảnh nếu có
-        if (imageData && imageData.startsWith('data:image/')) {
+        if (imageFile) {
             console.log('🖼️ Bắt đầu xử lý ảnh cho đội:', teamName);
             
-            const uploadResult = await uploadImage(imageData, teamName, teamId);
+            const uploadResult = await uploadImage(imageFile, teamName, teamId);
             if (uploadResult.success) {
                 imagePath = uploadResult.imagePath;
                 imageId = uploadResult.image_id;
@@ -1118,12 +1193,17 @@ async function saveTeam(teamName, imageData) {
     }
 }
 
+// Định dạng ảnh được phép upload
+function isSupportedImageFile(file) {
+    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp'];
+    return allowedTypes.includes(file.type);
+}
+
 // Function giữ nguyên ảnh gốc hoàn toàn - không xử lý gì
 function keepOriginalImage(file) {
     return new Promise((resolve, reject) => {
         // Kiểm tra định dạng file
-        const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp'];
-        if (!allowedTypes.includes(file.type)) {
+        if (!isSupportedImageFile(file)) {
             reject(new Error('Định dạng ảnh không được hỗ trợ. Chỉ chấp nhận: JPEG, PNG, GIF, WEBP'));
             return;
         }
@@ -1183,106 +1263,36 @@ function createImagePreview(file, maxWidth = 200, maxHeight = 150, quality = 0.7
     });
 }
 
-// Function upload ảnh với MongoDB GridFS
-async function uploadImage(imageData, teamName, teamId = null) {
+// Function upload ảnh với MongoDB GridFS: gửi nguyên bytes file (Content-Type: image/*),
+// server đưa thẳng cho Pillow - không qua base64 / JSON
+async function uploadImage(imageFile, teamName, teamId = null) {
     try {
         console.log(`📤 Đang upload ảnh cho đội: ${teamName}`);
-        console.log(`📏 Kích thước dữ liệu ảnh: ${(imageData.length / 1024 / 1024).toFixed(2)}MB`);
-        
-        // Clean and validate base64 data - remove all whitespace and non-ASCII characters
-        let cleanImageData = imageData.replace(/[\s\n\r\t]/g, '');
-        
-        // Remove any non-ASCII characters
-        cleanImageData = cleanImageData.replace(/[^\x00-\x7F]/g, '');
-        
-        // Validate base64 format
-        if (!cleanImageData.startsWith('data:image/')) {
-            throw new Error('Invalid image format - must be base64 data URL');
-        }
+        console.log(`📏 Kích thước file ảnh: ${(imageFile.size / 1024 / 1024).toFixed(2)}MB`);
         
-        // Extract base64 part and validate
-        const [header, base64Part] = cleanImageData.split(',');
-        if (!base64Part) {
-            throw new Error('Invalid base64 data - missing comma separator');
+        const params = new URLSearchParams({ async: '1', teamName: teamName });
+        if (teamId) {
+            params.set('teamId', teamId);
         }
         
-        // More aggressive cleaning - only keep valid base64 characters
-        let cleanBase64 = base64Part.replace(/[^A-Za-z0-9+/=]/g, '');
-        
-        // Remove any existing padding first, then add correct padding
-        let paddedBase64 = cleanBase64.replace(/=+$/, '');
-        
-        // Add correct padding
-        const missingPadding = paddedBase64.length % 4;
-        if (missingPadding) {
-            paddedBase64 += '='.repeat(4 - missingPadding);
-        }
-        
-        // Final validation of base64 characters (only A-Z, a-z, 0-9, +, /, =)
-        const base64Regex = /^[A-Za-z0-9+/]*={0,3}$/;
-        if (!base64Regex.test(paddedBase64)) {
-            console.error('Invalid base64 characters found in:', paddedBase64.slice(0, 100));
-            throw new Error('Invalid base64 characters detected');
-        }
-        
-        // Additional length validation
-        if (paddedBase64.length % 4 !== 0) {
-            throw new Error(`Invalid base64 length: ${paddedBase64.length} characters`);
-        }
-        
-        // Test decode on client side to catch issues early
-        try {
-            const testBinary = atob(paddedBase64);
-            console.log(`🔍 Client-side decode test: ${testBinary.length} bytes decoded`);
-        } catch (e) {
-            console.error('Client-side base64 decode test failed:', e);
-            throw new Error(`Client-side base64 validation failed: ${e.message}`);
-        }
-        
-        // Additional image validation - try to load it in a test Image object
-        try {
-            await new Promise((resolve, reject) => {
-                const testImg = new Image();
-                testImg.onload = () => {
-                    console.log(`✅ Image validation successful: ${testImg.width}x${testImg.height}`);
-                    resolve();
-                };
-                testImg.onerror = (e) => {
-                    console.error('Image validation failed:', e);
-                    reject(new Error('Image data appears to be corrupted'));
-                };
-                testImg.src = header + ',' + paddedBase64;
-            });
-        } catch (e) {
-            console.error('Image validation error:', e);
-            throw new Error(`Image validation failed: ${e.message}`);
-        }
-        
-        // Reconstruct clean image data
-        cleanImageData = header + ',' + paddedBase64;
-        
-        console.log(`🔧 Cleaned data size: ${(cleanImageData.length / 1024 / 1024).toFixed(2)}MB`);
-        
-        const requestBody = {
-            imageData: cleanImageData,
-            teamName: teamName,
-            teamId: teamId
-        };
-        
-        // Convert to JSON string with proper escaping
-        const jsonString = JSON.stringify(requestBody);
-        console.log(`📦 Request size: ${(jsonString.length / 1024 / 1024).toFixed(2)}MB`);
-        
-        const response = await fetch('/api/upload-image', {
+        // async=1: server xử lý ảnh trên process pool và trả job id ngay
+        const response = await fetch(`/api/upload-image?${params}`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json; charset=utf-8',
+                'Content-Type': imageFile.type,
             },
-            body: jsonString
+            body: imageFile
         });
         
         if (response.ok) {
-            const result = await response.json();
+            let result = await response.json();
+            if (response.status === 202) {
+                result = await waitForImageJob(result.statusUrl);
+                if (!result.success) {
+                    console.error('❌ Lỗi xử lý ảnh:', result.error);
+                    return result;
+                }
+            }
             console.log('✅ Upload ảnh thành công:');
             console.log(`   - Image ID: ${result.image_id}`);
             console.log(`   - Path: ${result.imagePath}`);
@@ -1303,6 +1313,24 @@ async function uploadImage(imageData, teamName, teamId = null) {
     }
 }
 
+// Theo dõi job xử lý ảnh tới khi xong (server_mongodb: /api/image-jobs/<job_id>)
+async function waitForImageJob(statusUrl, intervalMs = 300) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        if (!response.ok) {
+            return { success: false, error: `Không lấy được trạng thái xử lý ảnh (${response.status})` };
+        }
+        const job = await response.json();
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'error') {
+            return { success: false, error: job.error };
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 // Tải danh sách đội
 async function loadTeams() {
     const teams = await loadDataFromFile('teams', []);
@@ -1559,32 +1587,104 @@ async function loadQuestionStats() {
     document.getElementById('part2Count').textContent = part2Count;
 }
 
+// Tìm kiếm câu hỏi (GET /api/search): không phân biệt dấu, đợi người dùng ngừng gõ 250ms
+let questionSearchTimer = null;
+let questionSearchSeq = 0;
+
+function onQuestionSearchInput(query) {
+    clearTimeout(questionSearchTimer);
+    questionSearchTimer = setTimeout(() => searchQuestions(query), 250);
+}
+
+async function searchQuestions(query) {
+    const container = document.getElementById('questionSearchResults');
+    if (!container) return;
+    const seq = ++questionSearchSeq;
+    query = query.trim();
+    if (!query) {
+        container.replaceChildren();
+        return;
+    }
+
+    let result;
+    try {
+        const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&limit=20`);
+        if (!response.ok) {
+            console.error('Lỗi tìm kiếm câu hỏi:', response.statusText);
+            return;
+        }
+        result = await response.json();
+    } catch (error) {
+        console.error('Error searching questions:', error);
+        return;
+    }
+    // Bỏ kết quả của truy vấn cũ trả về muộn
+    if (seq !== questionSearchSeq) return;
+
+    const summary = document.createElement('p');
+    summary.className = 'question-search-summary';
+    summary.textContent = `${result.total} kết quả (${result.took_ms} ms)`;
+    const items = result.results.map(item => {
+        const row = document.createElement('div');
+        row.className = 'question-search-item';
+        const source = document.createElement('span');
+        source.className = 'question-search-source';
+        source.textContent = item.type === 'question'
+            ? `Phần ${item.part ?? '?'} - câu ${item.index + 1}`
+            : `BGK ${item.judge_name || item.judge_id || ''} - câu phụ ${item.index + 1}`;
+        const text = document.createElement('span');
+        text.textContent = item.question;
+        row.append(source, text);
+        return row;
+    });
+    container.replaceChildren(summary, ...items);
+}
+
 // === GAME SCREEN ===
 
-// Tải lưới câu hỏi
-async function loadQuestionGrid() {
-    const grid = document.getElementById('questionGrid');
-    const usedQuestions = await loadDataFromFile('used_questions', []);
-    const questions = await loadDataFromFile('questions', []);
-    const part1Questions = questions.filter(q => q.part === 1);
+// Trạng thái lưới câu hỏi của một phần do server tính sẵn:
+// { size, count, remaining, used } - used là bitmap base64 các ô đã dùng
+async function fetchQuestionGrid(part) {
+    try {
+        const response = await fetch(`/api/questions/${part}/grid`);
+        if (response.ok) {
+            return await response.json();
+        }
+        console.error(`Lỗi tải lưới câu hỏi phần ${part}:`, response.statusText);
+    } catch (error) {
+        console.error(`Error loading question grid ${part}:`, error);
+    }
+    return null;
+}
+
+// Ô number đã dùng chưa: bit (number - 1) % 8 của byte (number - 1) / 8 trong bitmap
+function isQuestionUsed(usedBytes, number) {
+    const byte = usedBytes.charCodeAt((number - 1) >> 3) || 0;
+    return (byte & (1 << ((number - 1) & 7))) !== 0;
+}
+
+// Vẽ lưới câu hỏi từ trạng thái server
+function renderQuestionGrid(gridId, gridStatus, onSelect, notEnoughMessage) {
+    const grid = document.getElementById(gridId);
+    const usedBytes = atob(gridStatus.used);
 
     grid.innerHTML = '';
 
-    for (let i = 1; i <= 58; i++) {
+    for (let i = 1; i <= gridStatus.size; i++) {
         const button = document.createElement('button');
         button.className = 'question-number';
         button.textContent = i;
-        button.onclick = () => selectQuestion(i);
+        button.onclick = () => onSelect(i);
 
-        if (usedQuestions.includes(i)) {
+        if (isQuestionUsed(usedBytes, i)) {
             button.classList.add('used');
             button.onclick = null;
-        } else if (i > part1Questions.length) {
+        } else if (i > gridStatus.count) {
             // Disable nếu không có đủ câu hỏi
             button.classList.add('disabled');
             button.onclick = () => {
                 addShakeEffect(button);
-                showToast('Chưa đủ câu hỏi!', 'warning');
+                showToast(notEnoughMessage, 'warning');
             };
         } else {
             // Add hover effect for available questions
@@ -1593,6 +1693,14 @@ async function loadQuestionGrid() {
 
         grid.appendChild(button);
     }
+}
+
+// Tải lưới câu hỏi
+async function loadQuestionGrid() {
+    const gridStatus = await fetchQuestionGrid(1);
+    if (gridStatus) {
+        renderQuestionGrid('questionGrid', gridStatus, selectQuestion, 'Chưa đủ câu hỏi!');
+    }
     
     // Update animation indices for staggered entrance
     // updateQuestionNumberAnimations();
@@ -1600,96 +1708,71 @@ async function loadQuestionGrid() {
 
 // Tải lưới câu hỏi cho Phần 2
 async function loadQuestionGrid2() {
-    const grid = document.getElementById('questionGrid2');
-    const usedQuestions = await loadDataFromFile('used_questions', []);
-    const questions = await loadDataFromFile('questions', []);
-    const part2Questions = questions.filter(q => q.part === 2);
-
-    grid.innerHTML = '';
+    const gridStatus = await fetchQuestionGrid(2);
+    if (gridStatus) {
+        renderQuestionGrid('questionGrid2', gridStatus, selectQuestion2, 'Chưa đủ câu hỏi phần 2!');
+    }
+}
 
-    for (let i = 1; i <= 60; i++) {
-        const button = document.createElement('button');
-        button.className = 'question-number';
-        button.textContent = i;
-        button.onclick = () => selectQuestion2(i);
+// Bốc câu hỏi trên server: đánh dấu ô đã dùng, nhận câu hỏi + lưới mới trong 1 request.
+// selection: { number: N } hoặc { mode: 'next' | 'random' }
+async function drawQuestion(part, selection, notEnoughMessage) {
+    try {
+        const response = await fetch(`/api/questions/${part}/draw`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(selection)
+        });
 
-        if (usedQuestions.includes(`part2_${i}`)) {
-            button.classList.add('used');
-            button.onclick = null;
-        } else if (i > part2Questions.length) {
-            button.classList.add('disabled');
-            // THÊM HIỆU ỨNG SHAKE
-            button.onclick = () => {
-                addShakeEffect(button);
-                showToast('Chưa đủ câu hỏi phần 2!', 'warning');
-            };
+        if (response.ok) {
+            const result = await response.json();
+            // Update in-memory cache
+            const usedValue = part === 1 ? result.number : `part${part}_${result.number}`;
+            if (result.changed && window._dataCache && Array.isArray(window._dataCache.used_questions)) {
+                window._dataCache.used_questions = [...window._dataCache.used_questions, usedValue];
+            }
+            return result;
+        } else if (response.status === 400) {
+            showToast(notEnoughMessage, 'error');
+        } else if (response.status === 409) {
+            showToast('Đã dùng hết câu hỏi!', 'warning');
         } else {
-            // THÊM HIỆU ỨNG PULSE KHI HOVER
-            button.addEventListener('mouseenter', () => addPulseEffect(button));
+            console.error('Lỗi chọn câu hỏi:', response.statusText);
+            showToast('Lỗi khi chọn câu hỏi: ' + response.statusText, 'error');
         }
-
-        grid.appendChild(button);
+    } catch (error) {
+        console.error('Error drawing question:', error);
+        showToast('Không kết nối được server!', 'error');
     }
+    return null;
 }
 
 // Chọn câu hỏi
 async function selectQuestion(number) {
-    const questions = await loadDataFromFile('questions', []);
-    const part1Questions = questions.filter(q => q.part === 1);
-
-    if (part1Questions.length === 0) {
-        showToast('Chưa có câu hỏi nào!', 'error');
-        return;
-    }
-
-    if (number > part1Questions.length) {
-        showToast('Chưa đủ câu hỏi!', 'error');
-        return;
-    }
-
-    // Chọn câu hỏi theo thứ tự (number - 1 là index)
-    const selectedQuestion = part1Questions[number - 1];
-
-    // Đánh dấu ô đã sử dụng
-    let usedQuestions = await loadDataFromFile('used_questions', []);
-    usedQuestions.push(number);
-    await saveDataToFile('used_questions', usedQuestions);
+    // Câu hỏi thứ number của phần 1, server đánh dấu ô đã sử dụng
+    const result = await drawQuestion(1, { number: number }, 'Chưa đủ câu hỏi!');
+    if (!result) return;
 
     // Hiển thị câu hỏi
-    showQuestionModal(selectedQuestion, `Câu hỏi số ${number}`);
+    showQuestionModal(result.question, `Câu hỏi số ${result.number}`);
 
     // Cập nhật lưới
-    await loadQuestionGrid();
+    renderQuestionGrid('questionGrid', result.grid, selectQuestion, 'Chưa đủ câu hỏi!');
 }
 
 // Chọn câu hỏi cho Phần 2
 async function selectQuestion2(number) {
-    const questions = await loadDataFromFile('questions', []);
-    const part2Questions = questions.filter(q => q.part === 2);
-
-    if (part2Questions.length === 0) {
-        showToast('Chưa có câu hỏi phần 2 nào!', 'error');
-        return;
-    }
-
-    if (number > part2Questions.length) {
-        showToast('Chưa đủ câu hỏi phần 2!', 'error');
-        return;
-    }
-
-    // Chọn câu hỏi theo thứ tự (number - 1 là index)
-    const selectedQuestion = part2Questions[number - 1];
-
-    // Đánh dấu ô đã sử dụng (với prefix part2_ để phân biệt với phần 1)
-    let usedQuestions = await loadDataFromFile('used_questions', []);
-    usedQuestions.push(`part2_${number}`);
-    await saveDataToFile('used_questions', usedQuestions);
+    // Server lưu ô đã dùng với prefix part2_ để phân biệt với phần 1
+    const result = await drawQuestion(2, { number: number }, 'Chưa đủ câu hỏi phần 2!');
+    if (!result) return;
 
     // Hiển thị câu hỏi
-    showQuestionModal(selectedQuestion, `Câu hỏi Phần 2 số ${number}`);
+    showQuestionModal(result.question, `Câu hỏi Phần 2 số ${result.number}`);
 
     // Cập nhật lưới
-    await loadQuestionGrid2();
+    renderQuestionGrid('questionGrid2', result.grid, selectQuestion2, 'Chưa đủ câu hỏi phần 2!');
 }
 
 // === VÒNG CHUNG KẾT ===
@@ -1864,11 +1947,7 @@ async function checkFinalChallengeAnswer(button, selectedKey, correctKey, questi
 
     // 4. Lưu trạng thái 'used' của câu hỏi này vào database
     const questionUniqueId = `${finalChallengeJudgeId}_${questionIndex}`;
-    const usedFinalQuestions = await loadDataFromFile('used_final_questions', []);
-    if (!usedFinalQuestions.includes(questionUniqueId)) {
-        usedFinalQuestions.push(questionUniqueId);
-        await saveDataToFile('used_final_questions', usedFinalQuestions);
-    }
+    await updateUsedItem('used_final_questions', questionUniqueId);
     
     // 5. Kiểm tra xem đã trả lời hết tất cả các câu hỏi chưa
     const answeredCount = document.querySelectorAll('.challenge-question-block.answered').length;
@@ -1938,21 +2017,13 @@ async function endFinalChallenge(isWin) {
 
             // Đánh dấu giám khảo là đã dùng (chuyển vào đây)
             if (inFinalChallenge && finalChallengeJudgeId) {
-                let usedJudges = await loadDataFromFile('used_judges', []);
-                if (!usedJudges.includes(finalChallengeJudgeId)) {
-                    usedJudges.push(finalChallengeJudgeId);
-                    await saveDataToFile('used_judges', usedJudges);
-                }
+                await updateUsedItem('used_judges', finalChallengeJudgeId);
             }
 
         }, 3000);
     } else { // Khi thắng (trả lời hết) 
         if (inFinalChallenge && finalChallengeJudgeId) {
-            let usedJudges = await loadDataFromFile('used_judges', []);
-            if (!usedJudges.includes(finalChallengeJudgeId)) {
-                usedJudges.push(finalChallengeJudgeId);
-                await saveDataToFile('used_judges', usedJudges);
-            }
+            await updateUsedItem('used_judges', finalChallengeJudgeId);
         }
     }
 }
@@ -2407,6 +2478,10 @@ async function loadTeamsGrid() {
     
     // Tải ảnh từ imagePath hoặc image_id
     const loadTeamImage = (team) => {
+        // Lưới đội chỉ cần bản thumbnail (server chọn WebP/JPEG theo trình duyệt)
+        if (team.imagePath && team.imagePath.startsWith('/api/image/')) {
+            return Promise.resolve(`${window.location.origin}${team.imagePath}?size=thumb`);
+        }
         // Ưu tiên imagePath nếu có
         if (team.imagePath) {
             // Nếu imagePath đã là URL đầy đủ, sử dụng luôn
@@ -2419,7 +2494,7 @@ async function loadTeamsGrid() {
         
         // Nếu có image_id, tạo API path
         if (team.image_id) {
-            return Promise.resolve(`${window.location.origin}/api/image/${team.image_id}`);
+            return Promise.resolve(`${window.location.origin}/api/image/${team.image_id}?size=thumb`);
         }
         
         // Fallback
@@ -0,0 +1,316 @@
+"""
+Tìm kiếm câu hỏi (GET /api/search): inverted index trong bộ nhớ trên
+nội dung câu hỏi, các đáp án và câu hỏi phụ (extra_questions) của BGK.
+
+Token được chuẩn hoá không dấu ("cường bức" -> "cuong buc", "đ" -> "d") nên gõ
+không dấu vẫn tìm được; kết quả khớp đúng dấu được xếp cao hơn. Điểm xếp hạng
+theo BM25, nội dung câu hỏi nặng gấp đôi đáp án. Mọi từ trong truy vấn đều phải
+khớp, từ cuối (từ 2 ký tự) được khớp theo tiền tố (gõ tới đâu tìm tới đó).
+
+Posting list lưu dạng array (doc id + tần suất, ~8 bytes / phần tử) để index
+của vài chục nghìn câu hỏi vẫn nhỏ; điểm BM25 của một từ được tính ở truy vấn
+đầu tiên dùng tới từ đó và giữ trong cache có giới hạn (gõ tiếp truy vấn chỉ
+tốn phần giao các từ).
+
+Giống QuestionEngine, index đọc dữ liệu qua load_questions / load_judges và chỉ
+dựng lại khi object dữ liệu dùng chung đổi. Index lớn được dựng lại ở thread
+nền, trong lúc đó truy vấn vẫn dùng index cũ.
+"""
+
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Trọng số từng trường khi tính tần suất từ
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+
+# Tham số BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Từ cuối của truy vấn khớp tiền tố khi dài ít nhất N ký tự, tối đa M từ trong index
+PREFIX_MIN_LENGTH = 2
+MAX_PREFIX_EXPANSION = 16
+
+# Index có từ N document trở lên được dựng lại ở thread nền
+BACKGROUND_REBUILD_DOCS = 2000
+
+# Số phần tử tối đa của cache điểm BM25 (dict doc_id -> điểm của các từ đã truy vấn)
+SCORE_CACHE_MAX_ENTRIES = 500_000
+
+
+def _build_fold_table() -> Dict[int, Optional[str]]:
+    """Bảng str.translate: chữ Latin có dấu -> không dấu, bỏ dấu rời (NFD)"""
+    table: Dict[int, Optional[str]] = {ord('đ'): 'd', ord('Đ'): 'd'}
+    for start, end in ((0x00C0, 0x0250), (0x1E00, 0x1F00)):
+        for code in range(start, end):
+            char = chr(code)
+            folded = ''.join(ch for ch in unicodedata.normalize('NFD', char.lower())
+                             if not unicodedata.combining(ch))
+            if folded != char:
+                table[code] = folded
+    for code in range(0x0300, 0x0370):
+        table[code] = None
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt: 'Cưỡng Bức' -> 'cuong buc'"""
+    return text.lower().translate(_FOLD_TABLE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _exact_text(text: str) -> str:
+    """Chữ thường, giữ dấu (NFC) - dùng để ưu tiên kết quả khớp đúng dấu"""
+    return ' '.join(unicodedata.normalize('NFC', text).lower().split())
+
+
+def _same_source(current: Any, previous: Any) -> bool:
+    # Store trả về list rỗng mới mỗi lần khi chưa có dữ liệu - coi như không đổi
+    return current is previous or (not current and not previous)
+
+
+class _IndexData:
+    """Một bản index hoàn chỉnh; không bị sửa sau khi dựng (trừ cache điểm BM25)"""
+
+    __slots__ = ('docs', 'postings', 'scores', 'score_entries', 'vocabulary', 'length_norms', 'type_ids')
+
+    def __init__(self):
+        # doc_id -> thông tin trả về cho client
+        self.docs: List[Dict[str, Any]] = []
+        # token -> (array doc_id, array tần suất)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        # token -> {doc_id: điểm BM25} (tính khi dùng lần đầu)
+        self.scores: Dict[str, Dict[int, float]] = {}
+        self.score_entries = 0
+        self.vocabulary: List[str] = []
+        self.length_norms = array('f')
+        # 'question' / 'extra_question' -> tập doc_id
+        self.type_ids: Dict[str, set] = {}
+
+
+class SearchIndex:
+    """
+    load_questions() trả về list questions, load_judges() trả về list judges.
+    Mỗi câu hỏi / câu hỏi phụ là một document trong index.
+    """
+
+    def __init__(self, load_questions: Callable[[], Any], load_judges: Callable[[], Any]):
+        self._load_questions = load_questions
+        self._load_judges = load_judges
+
+        self._lock = threading.Lock()
+        self._data: Optional[_IndexData] = None
+        self._sources: Tuple[Any, Any] = (None, None)
+        self._rebuild_thread: Optional[threading.Thread] = None
+
+        self.build_ms = 0.0
+
+    # =============== BUILD ===============
+
+    def _current(self) -> _IndexData:
+        """Index ứng với dữ liệu hiện tại (hoặc index cũ nếu đang dựng lại ở thread nền)"""
+        questions = self._load_questions()
+        judges = self._load_judges()
+        with self._lock:
+            data = self._data
+            if (data is not None and _same_source(questions, self._sources[0])
+                    and _same_source(judges, self._sources[1])):
+                return data
+            if data is not None and len(data.docs) >= BACKGROUND_REBUILD_DOCS:
+                if self._rebuild_thread is None:
+                    self._rebuild_thread = threading.Thread(target=self._rebuild, args=(questions, judges),
+                                                            name='search-index', daemon=True)
+                    self._rebuild_thread.start()
+                return data
+            self._install(self._build(questions or [], judges or []), questions, judges)
+            return self._data
+
+    def _rebuild(self, questions: Any, judges: Any):
+        try:
+            data = self._build(questions or [], judges or [])
+            with self._lock:
+                self._install(data, questions, judges)
+        except Exception as e:
+            logger.error(f"Search index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._rebuild_thread = None
+
+    def _install(self, built: Tuple[_IndexData, float], questions: Any, judges: Any):
+        self._data, self.build_ms = built
+        self._sources = (questions, judges)
+
+    @staticmethod
+    def _build(questions: List[Any], judges: List[Any]) -> Tuple[_IndexData, float]:
+        started = time.perf_counter()
+        data = _IndexData()
+        docs = data.docs
+        lengths = []
+        type_ids = defaultdict(set)
+        posting_ids = defaultdict(lambda: array('I'))
+        posting_tfs = defaultdict(lambda: array('I'))
+
+        def add(info: Dict[str, Any], item: Dict[str, Any]):
+            question = str(item.get('question') or '')
+            options = item.get('answer_options')
+            answers = [str(value) for value in options.values() if value] if isinstance(options, dict) else []
+            if not answers and item.get('answer'):
+                answers = [str(item['answer'])]
+
+            frequencies = Counter(_TOKEN_RE.findall(fold(question)))
+            for token in frequencies:
+                frequencies[token] *= QUESTION_WEIGHT
+            if answers:
+                frequencies.update(_TOKEN_RE.findall(fold(' '.join(answers))))
+            if not frequencies:
+                return
+
+            doc_id = len(docs)
+            for token, frequency in frequencies.items():
+                posting_ids[token].append(doc_id)
+                posting_tfs[token].append(frequency)
+
+            info['question'] = question
+            info['answer_options'] = options if isinstance(options, dict) else None
+            info['correct_answer'] = item.get('correct_answer')
+            docs.append(info)
+            lengths.append(sum(frequencies.values()))
+            type_ids[info['type']].add(doc_id)
+
+        for index, item in enumerate(questions):
+            if isinstance(item, dict):
+                add({'type': 'question', 'index': index, 'id': item.get('id'), 'part': item.get('part')}, item)
+
+        for judge in judges:
+            if not isinstance(judge, dict) or not isinstance(judge.get('extra_questions'), list):
+                continue
+            for index, item in enumerate(judge['extra_questions']):
+                if isinstance(item, dict):
+                    add({'type': 'extra_question', 'index': index, 'judge_id': judge.get('id'),
+                         'judge_name': judge.get('name')}, item)
+
+        # Phần mẫu số BM25 chỉ phụ thuộc độ dài document
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+        norm = BM25_K1 * (1 - BM25_B)
+        slope = BM25_K1 * BM25_B / avg_length
+        data.length_norms = array('f', (norm + slope * length for length in lengths))
+        data.postings = {token: (posting_ids[token], posting_tfs[token]) for token in posting_ids}
+        data.vocabulary = sorted(data.postings)
+        data.type_ids = dict(type_ids)
+        return data, (time.perf_counter() - started) * 1000
+
+    # =============== QUERY ===============
+
+    @staticmethod
+    def _token_scores(data: _IndexData, token: str) -> Dict[int, float]:
+        """doc_id -> điểm BM25 của một token có trong index (dict dùng chung - không sửa)"""
+        scores = data.scores.get(token)
+        if scores is None:
+            doc_ids, frequencies = data.postings[token]
+            doc_count = len(doc_ids)
+            idf = math.log(1 + (len(data.docs) - doc_count + 0.5) / (doc_count + 0.5))
+            factor = idf * (BM25_K1 + 1)
+            norms = data.length_norms
+            scores = {doc_id: factor * frequency / (frequency + norms[doc_id])
+                      for doc_id, frequency in zip(doc_ids, frequencies)}
+            if data.score_entries + doc_count > SCORE_CACHE_MAX_ENTRIES:
+                data.scores.clear()
+                data.score_entries = 0
+            data.scores[token] = scores
+            data.score_entries += doc_count
+        return scores
+
+    @staticmethod
+    def _expand(data: _IndexData, word: str, prefix: bool) -> List[str]:
+        if not prefix or len(word) < PREFIX_MIN_LENGTH:
+            return [word] if word in data.postings else []
+        start = bisect.bisect_left(data.vocabulary, word)
+        matches = []
+        for token in data.vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not token.startswith(word):
+                break
+            matches.append(token)
+        return matches
+
+    def _word_scores(self, data: _IndexData, tokens: List[str]) -> Dict[int, float]:
+        """doc_id -> điểm của một từ truy vấn (lấy điểm cao nhất trong các biến thể tiền tố)"""
+        variants = sorted((self._token_scores(data, token) for token in tokens), key=len, reverse=True)
+        if len(variants) == 1:
+            return variants[0]
+        scores = dict(variants[0])
+        for other in variants[1:]:
+            for doc_id, score in other.items():
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def search(self, query: str, limit: int = 20, scope: str = 'all') -> Dict[str, Any]:
+        """
+        Tìm theo query. scope: 'all' | 'questions' | 'judges'.
+        Returns: {'query', 'total', 'took_ms', 'results': [...]}
+        """
+        started = time.perf_counter()
+        data = self._current()
+        words = list(dict.fromkeys(tokenize(query)))
+
+        matches: List[Tuple[float, int]] = []
+        expansions = [self._expand(data, word, position == len(words) - 1) for position, word in enumerate(words)]
+        if expansions and all(expansions):
+            # Giao các từ bằng phép toán set, cộng điểm trên phần giao
+            per_word = sorted((self._word_scores(data, tokens) for tokens in expansions), key=len)
+            common = set(per_word[0]).intersection(*per_word[1:])
+            wanted_type = {'questions': 'question', 'judges': 'extra_question'}.get(scope)
+            if wanted_type:
+                common &= data.type_ids.get(wanted_type, set())
+            doc_ids = list(common)
+            scores = map(sum, zip(*(map(scores.__getitem__, doc_ids) for scores in per_word)))
+            matches = list(zip(scores, doc_ids))
+
+        # Điểm thưởng khi nội dung câu hỏi khớp cả cụm / khớp đúng dấu (chỉ xét nhóm đầu)
+        exact_phrase = _exact_text(query)
+        folded_phrase = ' '.join(words)
+        ranked = []
+        for score, doc_id in heapq.nlargest(limit * 5, matches):
+            text = data.docs[doc_id]['question']
+            if exact_phrase and exact_phrase in _exact_text(text):
+                score *= 1.5
+            elif len(words) > 1 and folded_phrase in ' '.join(tokenize(text)):
+                score *= 1.25
+            ranked.append((score, doc_id))
+        ranked.sort(key=lambda entry: (-entry[0], entry[1]))
+
+        return {
+            'query': query,
+            'total': len(matches),
+            'took_ms': round((time.perf_counter() - started) * 1000, 2),
+            'results': [dict(data.docs[doc_id], score=round(score, 4)) for score, doc_id in ranked[:limit]],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        data = self._data
+        return {
+            'documents': len(data.docs) if data else 0,
+            'terms': len(data.vocabulary) if data else 0,
+            'build_ms': round(self.build_ms, 1),
+            'rebuilding': self._rebuild_thread is not None,
+        }
@@ -5,7 +5,6 @@ Chạy trên IP: 113.161.151.124:8126
 """
 
 import http.server
-import socketserver
 import os
 import sys
 import json
@@ -13,6 +12,7 @@ import urllib.parse
 import base64
 import uuid
 import re
+import multiprocessing
 from pathlib import Path
 import logging
 
@@ -26,33 +26,107 @@ else:
     application_path = os.path.dirname(os.path.abspath(__file__))
 # ==========================
 
-# Import MongoDB components
-from database import db_manager
-from config import HOST, PORT, COLLECTIONS , PUBLIC_IP
+from config import (
+    HOST, PORT, COLLECTIONS , PUBLIC_IP, SERVER_WORKERS, SERVER_QUEUE_SIZE, DATABASE_BACKEND, SQLITE_PATH,
+    SSE_MAX_CLIENTS, SSE_HEARTBEAT, IMAGE_VARIANTS, COMPRESS_MIN_BYTES, STATIC_CACHE_DIRECTORY,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_KEEPALIVE_MAX_REQUESTS, QUESTION_GRID_SIZES,
+    QUESTION_IMPORT_BATCH_SIZE, QUESTION_IMPORT_MAX_BYTES, QUESTION_IMPORT_MAX_ERRORS, QUESTION_DUPLICATE_THRESHOLD,
+    IMAGE_WORKERS, IMAGE_QUEUE_SIZE, IMAGE_JOB_TTL, IMAGE_JOB_TIMEOUT, MAX_IMAGE_SIZE
+)
+from http_utils import PooledHTTPServer, JsonResponseCache, GameShowHandlerMixin, StaticFiles, EventBroker
+from image_processing import ImageJobQueue
+from image_upload import UploadTooLarge, is_binary_upload, read_image_upload
+from question_engine import QuestionEngine
+from question_import import BoundedReader, CsvQuestionImporter
+from search_index import SearchIndex
+from dedup import DuplicateReport
+
+# Import database components (MongoDB hoặc SQLite cục bộ, xem DATABASE_BACKEND trong config.py)
+if DATABASE_BACKEND == 'sqlite':
+    from sqlite_database import db_manager
+else:
+    from database import db_manager
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+# Bytes JSON đã encode sẵn + ETag cho các GET /api/data/<key>
+response_cache = JsonResponseCache(compress_min_bytes=COMPRESS_MIN_BYTES)
+
+# Fingerprint file tĩnh cho ETag và URL ?v=<hash>
+static_files = StaticFiles(compress_min_bytes=COMPRESS_MIN_BYTES, cache_dir=STATIC_CACHE_DIRECTORY)
+
+# Kênh SSE thông báo thay đổi dữ liệu cho các màn hình
+event_broker = EventBroker(heartbeat=SSE_HEARTBEAT, max_clients=SSE_MAX_CLIENTS)
+
+# Tên collection MongoDB -> key dữ liệu phía client (/api/data/<key>)
+DATA_KEYS = {COLLECTIONS[key]: key for key in
+             ('teams', 'judges', 'questions', 'used_judges', 'used_questions', 'used_final_questions')}
+DATA_KEYS[COLLECTIONS['users']] = 'login'
+
+# Xử lý ảnh upload trên process pool (Pillow giữ GIL khi decode / resize / encode)
+image_jobs = ImageJobQueue(db_manager.store_processed_image, workers=IMAGE_WORKERS,
+                           queue_size=IMAGE_QUEUE_SIZE, job_ttl=IMAGE_JOB_TTL)
+
+# Lưới câu hỏi Phần 1 / Phần 2: trạng thái dạng bitmap, bốc câu hỏi chưa dùng trong 1 request
+question_engine = QuestionEngine(
+    lambda: db_manager.get_data(COLLECTIONS['questions']),
+    lambda: db_manager.get_data(COLLECTIONS['used_questions']),
+    lambda value: db_manager.add_used_item(COLLECTIONS['used_questions'], value),
+    QUESTION_GRID_SIZES
+)
+
+# Báo cáo câu hỏi gần trùng (/api/questions/duplicates), chỉ tính lại khi questions đổi
+duplicate_report = DuplicateReport(lambda: db_manager.get_data(COLLECTIONS['questions']))
+
+# Tìm kiếm câu hỏi / câu hỏi phụ của BGK không phân biệt dấu (/api/search)
+search_index = SearchIndex(
+    lambda: db_manager.get_data(COLLECTIONS['questions']),
+    lambda: db_manager.get_data(COLLECTIONS['judges'])
+)
+
+# Giá trị hợp lệ cho /api/image/<id>?size=
+IMAGE_SIZES = set(IMAGE_VARIANTS) | {'full'}
+
+def publish_data_change(collection_name, version):
+    """Change listener của db_manager: gửi thông báo SSE nhỏ gọn cho client"""
+    key = DATA_KEYS.get(collection_name)
+    if key:
+        event_broker.publish('change', {'collection': key, 'version': version})
+
+class CustomHTTPRequestHandler(GameShowHandlerMixin, http.server.SimpleHTTPRequestHandler):
+    timeout = HTTP_KEEPALIVE_TIMEOUT
+    max_keepalive_requests = HTTP_KEEPALIVE_MAX_REQUESTS
+
     def __init__(self, *args, **kwargs):
+        self._cache_control_sent = False
         super().__init__(*args, directory=application_path, **kwargs)
     
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'cache-control':
+            self._cache_control_sent = True
+        super().send_header(keyword, value)
+    
     def end_headers(self):
         # Add CORS headers for API calls
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, Range, If-Range')
 
         # === FIX: Chống cache phía server và trình duyệt ===
-        # Ra lệnh không lưu cache cho tất cả các yêu cầu để đảm bảo dữ liệu luôn mới nhất
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
+        # Ra lệnh không lưu cache cho các yêu cầu không tự khai báo Cache-Control
+        # (các response có ETag dùng 'no-cache' để trình duyệt xác thực lại bằng 304)
+        if not self._cache_control_sent:
+            self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
+        self._cache_control_sent = False
         super().end_headers()
     
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
@@ -63,8 +137,8 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             # Serve images (both legacy files and MongoDB images)
             self.serve_image()
         else:
-            # Serve static files
-            super().do_GET()
+            # Serve static files (sendfile + ETag / Last-Modified, asset có hash cache lâu dài)
+            self.serve_static(static_files)
     
     def serve_image(self):
         """Serve images - both from filesystem and MongoDB GridFS"""
@@ -80,36 +154,13 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 return
             
             # Legacy image serving from filesystem
-            image_path = urllib.parse.unquote(self.path[1:])  # Remove leading /
-            full_path = os.path.join(application_path, image_path)
-            
-            if not os.path.exists(full_path):
+            # translate_path chuẩn hoá đường dẫn (không cho thoát khỏi thư mục gốc)
+            full_path = self.translate_path(self.path)
+            if not os.path.isfile(full_path):
                 self.send_error(404, "Image not found")
                 return
-            
-            # Get file extension for MIME type
-            ext = os.path.splitext(full_path)[1].lower()
-            mime_types = {
-                '.png': 'image/png',
-                '.jpg': 'image/jpeg', 
-                '.jpeg': 'image/jpeg',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp',
-                '.svg': 'image/svg+xml'
-            }
-            
-            content_type = mime_types.get(ext, 'application/octet-stream')
-            
-            # Read and serve the image
-            with open(full_path, 'rb') as f:
-                image_data = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.send_header('Content-length', len(image_data))
-            self.send_header('Cache-Control', 'public, max-age=3600')  # Cache for 1 hour
-            self.end_headers()
-            self.wfile.write(image_data)
+
+            self.serve_static_file(full_path, static_files, cache_control='public, max-age=3600')
             
         except Exception as e:
             logger.error(f"Error serving image: {e}")
@@ -118,32 +169,59 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def serve_mongodb_image(self, image_id):
         """Serve image from MongoDB GridFS"""
         try:
-            logger.info(f"🖼️  Serving image {image_id} from MongoDB")
             if not db_manager.is_connected():
                 logger.error("❌ Database not available")
                 self.send_error(503, "Database not available")
                 return
 
-            image_info = db_manager.get_team_image(image_id)
+            # ?size=thumb|medium|full chọn biến thể, WebP nếu trình duyệt hỗ trợ (header Accept)
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            size = query.get('size', [None])[0]
+            if size is not None and size not in IMAGE_SIZES:
+                self.send_error(400, f"Invalid size: {size}")
+                return
+            accept_webp = 'image/webp' in self.headers.get('Accept', '')
+
+            image_info = db_manager.open_team_image(image_id, size=size, accept_webp=accept_webp)
             
             if not image_info:
                 logger.warning(f"⚠️  Image {image_id} not found in MongoDB")
                 self.send_error(404, "Image not found")
                 return
 
-            logger.info(f"✅ Image {image_id} found:")
-            logger.info(f"   - Content-Type: {image_info['content_type']}")
-            logger.info(f"   - Data size: {len(image_info['data'])} bytes")
-            logger.info(f"   - Dimensions: {image_info['dimensions']['width']}x{image_info['dimensions']['height']}")
-            
-            self.send_response(200)
-            self.send_header('Content-type', image_info['content_type'])
-            self.send_header('Content-length', len(image_info['data']))
-            self.send_header('Cache-Control', 'public, max-age=86400')  # Cache for 24 hours
-            self.send_header('X-Image-Dimensions', f"{image_info['dimensions']['width']}x{image_info['dimensions']['height']}")
-            self.end_headers()
-            self.wfile.write(image_info['data'])
-            logger.info(f"📤 Image {image_id} sent successfully ({len(image_info['data'])} bytes)")
+            extra_headers = [('X-Image-Dimensions', f"{image_info['dimensions']['width']}x{image_info['dimensions']['height']}")]
+            if image_info['has_variants']:
+                # Cùng URL trả về WebP hoặc JPEG tuỳ trình duyệt - cache phải phân biệt theo Accept
+                extra_headers.append(('Vary', 'Accept'))
+
+            stream = image_info.get('stream')
+
+            def write_range(start, end):
+                if stream is None:
+                    self.wfile.write(memoryview(image_info['data'])[start:end + 1])
+                    return
+                # Ảnh lớn: gửi từng chunk GridFS / SQLite blob, không giữ cả file trong bộ nhớ
+                chunk_size = getattr(stream, 'chunk_size', 256 * 1024)
+                stream.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = stream.read(min(remaining, chunk_size))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+            try:
+                self.send_ranged_body(
+                    image_info['content_type'], image_info['length'], write_range,
+                    etag=image_info['etag'], last_modified=image_info['last_modified'],
+                    cache_control='public, max-age=86400',  # Cache for 24 hours
+                    extra_headers=extra_headers
+                )
+            finally:
+                if stream is not None:
+                    stream.close()
+            logger.debug(f"Image {image_id} sent ({image_info['length']} bytes, {image_info['content_type']})")
             
         except Exception as e:
             logger.error(f"❌ Error serving MongoDB image {image_id}: {e}")
@@ -177,10 +255,7 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
             success = db_manager.delete_team(team_id)
             if success:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"success": True}).encode('utf-8'))
+                self.send_json({"success": True})
             else:
                 self.send_error(404, "Team not found or failed to delete")
         except Exception as e:
@@ -208,13 +283,29 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 elif resource == 'data' and len(path_parts) >= 4:
                     filename = path_parts[3]
                     self.handle_data_request(filename)
+                elif resource == 'used' and self.command == 'POST' and len(path_parts) >= 5:
+                    self.handle_used_item(path_parts[3], path_parts[4])
+                elif (resource == 'import' and self.command == 'POST' and
+                      len(path_parts) >= 4 and path_parts[3] == 'questions'):
+                    self.handle_question_import()
+                elif (resource == 'questions' and self.command == 'GET' and
+                      len(path_parts) == 4 and path_parts[3] == 'duplicates'):
+                    self.handle_question_duplicates()
+                elif resource == 'questions' and len(path_parts) >= 5:
+                    self.handle_question_grid(path_parts[3], path_parts[4])
+                elif resource == 'search' and self.command == 'GET':
+                    self.handle_search()
                 elif resource == 'upload-image' and self.command == 'POST':
                     self.handle_image_upload()
+                elif resource == 'image-jobs' and len(path_parts) >= 4 and self.command == 'GET':
+                    self.handle_image_job(path_parts[3])
                 elif resource == 'image' and len(path_parts) >= 4 and self.command == 'GET':
                     image_id = path_parts[3]
                     self.serve_mongodb_image(image_id)
                 elif resource == 'clear-all' and self.command == 'DELETE':
                     self.handle_clear_all()
+                elif resource == 'events' and self.command == 'GET':
+                    self.handle_events()
                 elif resource == 'health' and self.command == 'GET':
                     self.handle_health_check()
                 elif resource == 'welcome' and self.command == 'GET':
@@ -236,17 +327,49 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             health_info = {
                 "status": "ok",
                 "database": db_status,
-                "timestamp": db_manager.db.command("serverStatus")["localTime"].isoformat() if db_manager.is_connected() else None
+                "backend": db_manager.backend,
+                "timestamp": self.server_timestamp(),
+                "cache": db_manager.cache_stats(),
+                "sse_clients": event_broker.client_count(),
+                "image_jobs": image_jobs.stats(),
+                "image_cache": db_manager.image_cache.stats(),
+                "search_index": search_index.stats()
             }
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(health_info).encode('utf-8'))
+            self.send_json(health_info)
 
         except Exception as e:
             self.send_error(500, f"Health check failed: {str(e)}")
 
+    @staticmethod
+    def server_timestamp():
+        """Giờ của database server dạng ISO (None nếu mất kết nối)"""
+        server_time = db_manager.server_time()
+        return server_time.isoformat() if server_time else None
+
+    def handle_events(self):
+        """Server-Sent Events: GET /api/events - báo collection nào vừa thay đổi (kèm version)"""
+        if event_broker.client_count() >= event_broker.max_clients:
+            self.send_error(503, "Too many event stream clients")
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        # Stream không có Content-Length: kết nối này không được dùng lại (keep-alive)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        
+        # Gửi version hiện tại để client biết trạng thái ban đầu
+        versions = {DATA_KEYS[name]: version for name, version in db_manager.get_versions().items()
+                    if name in DATA_KEYS}
+        hello = b'retry: 3000\n' + EventBroker.format_event('hello', {'versions': versions})
+        
+        # Socket được chuyển cho broker, worker thread trả lại pool ngay
+        event_broker.subscribe(self.server, self.request, hello)
+        self.close_connection = True
+    
     def handle_welcome(self):
         """Welcome endpoint with logging"""
         try:
@@ -256,13 +379,10 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             welcome_message = {
                 "message": "Welcome to the Game Show API Service!",
                 "status": "success",
-                "timestamp": db_manager.db.command("serverStatus")["localTime"].isoformat() if db_manager.is_connected() else None
+                "timestamp": self.server_timestamp()
             }
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(welcome_message, ensure_ascii=False).encode('utf-8'))
+            self.send_json(welcome_message, ensure_ascii=False)
 
         except Exception as e:
             logger.error(f"Error handling welcome request: {e}")
@@ -276,8 +396,7 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 if filename == 'teams':
                     data = db_manager.get_teams()
                 elif filename == 'login':
-                    login_doc = db_manager.db['users'].find_one({'type': 'login_status'})
-                    data = {"logged_in": login_doc['logged_in'] if login_doc else False}
+                    data = db_manager.get_login_status()
                 else:
                     collection_mapping = {
                         'judges': 'judges',
@@ -295,10 +414,7 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                         self.send_error(404, "Data type not found")
                         return
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+                self.send_cached_json(response_cache, filename, data)
                 
             except Exception as e:
                 logger.error(f"Error reading {filename}: {e}")
@@ -311,21 +427,17 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 data = json.loads(post_data.decode('utf-8'))
                 
                 success = False
+                # Thống kê ghi của chính request này (không đọc trạng thái dùng chung giữa các thread)
+                write_stats = {}
                 
                 if filename == 'teams':
                     # === FIX: Gọi lại hàm save_teams đã được khôi phục ===
                     if isinstance(data, list):
-                        success = db_manager.save_teams(data)
+                        success = db_manager.save_teams(data, stats=write_stats)
                     else:
                         logger.error("Invalid data format for teams, expected a list.")
                 elif filename == 'login':
-                    from datetime import datetime
-                    db_manager.db['users'].update_one(
-                        {'type': 'login_status'},
-                        {'$set': {'logged_in': data.get('logged_in', False), 'updated_at': datetime.utcnow()}},
-                        upsert=True
-                    )
-                    success = True
+                    success = db_manager.set_login_status(data.get('logged_in', False))
                 else:
                     collection_mapping = {
                         'judges': 'judges',
@@ -337,17 +449,21 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     }
                     if filename in collection_mapping:
                         collection_name = COLLECTIONS[collection_mapping[filename]]
-                        success = db_manager.save_data(collection_name, data)
+                        success = db_manager.save_data(collection_name, data, stats=write_stats)
                     else:
                         logger.warning(f"Unknown data type for POST: {filename}")
                         self.send_error(404, "Data type not found")
                         return
 
                 if success:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"success": True}).encode('utf-8'))
+                    result = {"success": True}
+                    if write_stats:
+                        # Số thao tác thực sự đã gửi tới MongoDB (diff-based save_data)
+                        result["write"] = write_stats
+                    self.send_json(result)
+                elif write_stats and write_stats.get('errors'):
+                    failed = ', '.join(str(err['team_id']) for err in write_stats['errors'])
+                    self.send_error(500, f"Failed to save {filename}: {failed}")
                 else:
                     self.send_error(500, f"Failed to save {filename}")
                     
@@ -355,19 +471,180 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 logger.error(f"Error writing {filename}: {e}")
                 self.send_error(500, f"Error writing {filename}: {str(e)}")
     
+    def handle_used_item(self, kind, action):
+        """Thêm / bỏ một giá trị trong danh sách 'đã dùng': POST /api/used/<kind>/add|remove"""
+        try:
+            if kind not in db_manager.USED_KEYS or action not in ('add', 'remove'):
+                self.send_error(404, "API endpoint not found")
+                return
+            
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            
+            value = data.get('value') if isinstance(data, dict) else None
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                self.send_error(400, "Bad Request: 'value' must be a string or number")
+                return
+            
+            collection_name = COLLECTIONS[kind]
+            if action == 'add':
+                changed = db_manager.add_used_item(collection_name, value)
+            else:
+                changed = db_manager.remove_used_item(collection_name, value)
+            
+            if changed is None:
+                self.send_error(500, f"Failed to update {kind}")
+                return
+            
+            self.send_json({"success": True, "changed": changed})
+            
+        except json.JSONDecodeError as e:
+            self.send_error(400, f"Invalid JSON data: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error updating {kind}: {e}")
+            self.send_error(500, f"Error updating {kind}: {str(e)}")
+    
+    def handle_question_grid(self, part, action):
+        """
+        Lưới câu hỏi của một phần (part = 1 | 2):
+            GET  /api/questions/<part>/grid - bitmap ô đã dùng + số câu hỏi
+            POST /api/questions/<part>/draw - {"number": N} hoặc {"mode": "next" | "random"}
+        """
+        try:
+            if not part.isdigit() or int(part) not in question_engine.grid_sizes:
+                self.send_error(404, "Question part not found")
+                return
+            part = int(part)
+            
+            if action == 'grid' and self.command == 'GET':
+                self.send_json(question_engine.grid(part))
+            elif action == 'draw' and self.command == 'POST':
+                content_length = int(self.headers.get('Content-Length') or 0)
+                post_data = self.rfile.read(content_length) if content_length else b''
+                data = json.loads(post_data.decode('utf-8')) if post_data.strip() else {}
+                if not isinstance(data, dict):
+                    data = {}
+                
+                number = data.get('number')
+                if number is not None and (isinstance(number, bool) or not isinstance(number, int)):
+                    self.send_error(400, "Bad Request: 'number' must be an integer")
+                    return
+                
+                result = question_engine.draw(part, data.get('mode', 'next'), number)
+                if result is None:
+                    self.send_error(409, "No unused questions left")
+                    return
+                self.send_json(result, ensure_ascii=False)
+            else:
+                self.send_error(404, "API endpoint not found")
+            
+        except ValueError as e:
+            # Gồm cả json.JSONDecodeError
+            self.send_error(400, f"Bad Request: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error handling question grid request: {e}")
+            self.send_error(500, f"Error handling question grid request: {str(e)}")
+    
+    def handle_question_duplicates(self):
+        """GET /api/questions/duplicates[?threshold=0.8] - các nhóm câu hỏi gần trùng"""
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            try:
+                threshold = float(query.get('threshold', [QUESTION_DUPLICATE_THRESHOLD])[0])
+            except ValueError:
+                threshold = -1.0
+            if not 0 < threshold <= 1:
+                self.send_error(400, "Bad Request: 'threshold' must be in (0, 1]")
+                return
+            
+            self.send_json(duplicate_report.report(threshold), ensure_ascii=False)
+            
+        except Exception as e:
+            logger.error(f"Error building duplicate report: {e}")
+            self.send_error(500, f"Error building duplicate report: {str(e)}")
+    
+    def handle_search(self):
+        """GET /api/search?q=<từ khóa>[&limit=20][&scope=all|questions|judges] - không phân biệt dấu"""
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            text = query.get('q', [''])[0].strip()
+            scope = query.get('scope', ['all'])[0]
+            limit = query.get('limit', ['20'])[0]
+            
+            if not text:
+                self.send_error(400, "Bad Request: missing 'q'")
+                return
+            if scope not in ('all', 'questions', 'judges'):
+                self.send_error(400, "Bad Request: 'scope' must be all, questions or judges")
+                return
+            if not limit.isdigit() or not 1 <= int(limit) <= 100:
+                self.send_error(400, "Bad Request: 'limit' must be between 1 and 100")
+                return
+            
+            self.send_json(search_index.search(text, int(limit), scope), ensure_ascii=False)
+            
+        except Exception as e:
+            logger.error(f"Error searching questions: {e}")
+            self.send_error(500, f"Error searching questions: {str(e)}")
+    
+    def handle_question_import(self):
+        """
+        POST /api/import/questions[?mode=replace|merge] - body là file CSV (ques, ans_1..ans_5, correct_ans).
+        replace (mặc định): thay toàn bộ câu hỏi bằng nội dung file; merge: ghi đè câu trùng, thêm câu mới.
+        """
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            mode = query.get('mode', ['replace'])[0]
+            if mode not in ('replace', 'merge'):
+                self.send_error(400, "Bad Request: mode must be 'replace' or 'merge'")
+                return
+            
+            if self.headers.get('Content-Length') is None:
+                self.send_error(411, "Content-Length required")
+                return
+            content_length = int(self.headers['Content-Length'])
+            if content_length > QUESTION_IMPORT_MAX_BYTES:
+                self.send_error(413, f"CSV file too large (max {QUESTION_IMPORT_MAX_BYTES} bytes)")
+                return
+            
+            # Đọc body theo luồng: parse từng dòng, ghi từng lô QUESTION_IMPORT_BATCH_SIZE câu
+            body = BoundedReader(self.rfile, content_length)
+            importer = CsvQuestionImporter(body, QUESTION_GRID_SIZES[1], batch_size=QUESTION_IMPORT_BATCH_SIZE,
+                                           max_errors=QUESTION_IMPORT_MAX_ERRORS,
+                                           duplicate_threshold=QUESTION_DUPLICATE_THRESHOLD)
+            importer.read_header()
+            write_stats = db_manager.import_documents(COLLECTIONS['questions'], importer.batches(),
+                                                      replace=mode == 'replace')
+            if body.remaining:
+                # Body chưa đọc hết - không dùng lại kết nối này
+                self.close_connection = True
+            
+            if write_stats is None:
+                self.send_error(500, "Failed to import questions")
+                return
+            
+            result = {"success": True, "mode": mode}
+            result.update(importer.summary())
+            result["write"] = write_stats
+            self.send_json(result, ensure_ascii=False)
+            
+        except ValueError as e:
+            self.send_error(400, f"Bad Request: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error importing questions: {e}")
+            self.send_error(500, f"Error importing questions: {str(e)}")
+    
     def handle_clear_all(self):
         """Clear all data from MongoDB"""
         try:
             success = db_manager.clear_all_data()
             
             if success:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
+                self.send_json({
                     "success": True, 
                     "message": "Đã xóa tất cả dữ liệu từ MongoDB!"
-                }).encode('utf-8'))
+                })
             else:
                 self.send_error(500, "Failed to clear data")
             
@@ -375,68 +652,54 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             logger.error(f"Error clearing data: {e}")
             self.send_error(500, f"Error clearing data: {str(e)}")
     
+    @staticmethod
+    def image_upload_response(result):
+        """Body JSON trả về cho client sau khi lưu ảnh thành công"""
+        return {
+            "success": True,
+            "image_id": result['image_id'],
+            "imagePath": f"/api/image/{result['image_id']}",
+            "original_size": result['original_size'],
+            "optimized_size": result['optimized_size'],
+            "dimensions": result['dimensions'],
+            "variants": result.get('variants', {})
+        }
+
+    def handle_image_job(self, job_id):
+        """GET /api/image-jobs/<job_id> - trạng thái xử lý ảnh bất đồng bộ"""
+        job = image_jobs.status(job_id)
+        if job is None:
+            self.send_error(404, "Image job not found")
+            return
+        if job.get('result'):
+            job['result'] = self.image_upload_response(job['result'])
+        self.send_json_body(json.dumps(job).encode('utf-8'))
+
     def handle_image_upload(self):
-        """Handle image upload with MongoDB GridFS"""
+        """
+        Handle image upload with MongoDB GridFS.
+        Body: JSON {imageData (data URL base64), teamName, teamId}, hoặc nguyên file ảnh
+        (Content-Type: image/*, teamName / teamId trên query string), hoặc multipart/form-data.
+        """
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            
-            # Log request size for debugging
-            logger.info(f"Received image upload request: {content_length} bytes")
-            
-            try:
-                # Try to decode with strict=False to handle control characters
-                decoded_data = post_data.decode('utf-8', errors='replace')
-                
-                # Clean any potential control characters that might cause JSON parsing issues
-                import re
-                cleaned_data = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', decoded_data)
-                
-                data = json.loads(cleaned_data)
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error at position {e.pos}: {str(e)}")
-                # Try alternative approach - parse in chunks
-                try:
-                    # Alternative: try parsing the raw bytes differently
-                    decoded_text = post_data.decode('utf-8', errors='ignore')
-                    data = json.loads(decoded_text)
-                except Exception as e2:
-                    logger.error(f"Secondary parsing also failed: {str(e2)}")
-                    raise ValueError(f"Cannot parse JSON data. Original error: {str(e)}")
-            
-            # Extract image data and metadata
-            image_data = data.get('imageData', '')
-            team_name = data.get('teamName', '')
-            team_id = data.get('teamId', '')
-            
-            logger.info(f"Processing image for team: {team_name}")
-            logger.info(f"Image data size: {len(image_data)} characters")
-            
-            if not image_data or not image_data.startswith('data:image/'):
-                raise ValueError("Invalid image data format")
-            
-            # Save image using MongoDB GridFS
-            result = db_manager.save_team_image(image_data, team_name, team_id)
-            
-            if result:
-                logger.info(f"Image upload successful for team: {team_name}")
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    "success": True,
-                    "image_id": result['image_id'],
-                    "imagePath": f"/api/image/{result['image_id']}",
-                    "original_size": result['original_size'],
-                    "optimized_size": result['optimized_size'],
-                    "dimensions": result['dimensions']
-                }).encode('utf-8'))
+            if self.headers.get('Content-Length') is None:
+                self.send_error(411, "Content-Length required")
+                return
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            if is_binary_upload(self.headers.get('Content-Type')):
+                # Bytes ảnh đưa thẳng cho Pillow, không qua base64 / JSON
+                upload = read_image_upload(self.rfile, self.headers, query, MAX_IMAGE_SIZE)
+                logger.info(f"Received binary image upload: {len(upload.data)} bytes ({upload.mime_type})")
+                team_name, team_id = upload.team_name, upload.team_id
+                job_id = image_jobs.submit_bytes(upload.data, upload.mime_type, team_name, team_id)
             else:
-                logger.error(f"❌ Failed to save image for team: {team_name}")
-                self.send_error(500, "Failed to save image to MongoDB")
-            
+                team_name, team_id, job_id = self._submit_json_image_upload()
+            self._finish_image_upload(job_id, team_name, query)
+        except UploadTooLarge as e:
+            logger.error(f"❌ Upload rejected: {e}")
+            # Phần body chưa đọc vẫn nằm trên socket - không dùng lại kết nối này
+            self.close_connection = True
+            self.send_error(413, str(e))
         except ValueError as e:
             logger.error(f"❌ Validation error: {e}")
             self.send_error(400, f"Invalid request: {str(e)}")
@@ -444,24 +707,122 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             logger.error(f"❌ Unexpected error uploading image: {e}")
             self.send_error(500, f"Server error: {str(e)}")
 
+    def _submit_json_image_upload(self):
+        """Body JSON cũ {imageData, teamName, teamId} -> (team_name, team_id, job_id)"""
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        
+        # Log request size for debugging
+        logger.info(f"Received image upload request: {content_length} bytes")
+        
+        try:
+            # Try to decode with strict=False to handle control characters
+            decoded_data = post_data.decode('utf-8', errors='replace')
+            
+            # Clean any potential control characters that might cause JSON parsing issues
+            import re
+            cleaned_data = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', decoded_data)
+            
+            data = json.loads(cleaned_data)
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error at position {e.pos}: {str(e)}")
+            # Try alternative approach - parse in chunks
+            try:
+                # Alternative: try parsing the raw bytes differently
+                decoded_text = post_data.decode('utf-8', errors='ignore')
+                data = json.loads(decoded_text)
+            except Exception as e2:
+                logger.error(f"Secondary parsing also failed: {str(e2)}")
+                raise ValueError(f"Cannot parse JSON data. Original error: {str(e)}")
+        
+        # Extract image data and metadata
+        image_data = data.get('imageData', '')
+        team_name = data.get('teamName', '')
+        team_id = data.get('teamId', '')
+        
+        logger.info(f"Processing image for team: {team_name}")
+        logger.info(f"Image data size: {len(image_data)} characters")
+        
+        if not image_data or not image_data.startswith('data:image/'):
+            raise ValueError("Invalid image data format")
+        
+        # Xử lý ảnh trên process pool, lưu vào MongoDB GridFS khi xong
+        return team_name, team_id, image_jobs.submit(image_data, team_name, team_id)
+
+    def _finish_image_upload(self, job_id, team_name, query):
+        """Trả 503 nếu hàng đợi đầy, 202 nếu ?async=1, còn lại chờ job xử lý xong"""
+        if job_id is None:
+            logger.warning("Image processing queue is full")
+            body = json.dumps({"success": False, "error": "Image processing queue is full"}).encode('utf-8')
+            self.send_response(503)
+            self.send_header('Retry-After', '2')
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # ?async=1: trả job id ngay, client theo dõi qua /api/image-jobs/<job_id>
+        # (image_id chỉ có trong trạng thái 'done' - ảnh trùng nội dung dùng ID của ảnh đã có)
+        if query.get('async', ['0'])[0] in ('1', 'true'):
+            job = image_jobs.status(job_id)
+            job['statusUrl'] = f"/api/image-jobs/{job_id}"
+            self.send_json_body(json.dumps(job).encode('utf-8'), status=202)
+            return
+
+        job = image_jobs.wait(job_id, timeout=IMAGE_JOB_TIMEOUT)
+        if job['status'] == 'done':
+            result = job['result']
+            logger.info(f"Image upload successful for team: {team_name}")
+            
+            self.send_json(self.image_upload_response(result))
+        elif job['status'] == 'error' and job['invalid']:
+            raise ValueError(job['error'])
+        elif job['status'] == 'error':
+            logger.error(f"❌ Failed to save image for team: {team_name}")
+            self.send_error(500, "Failed to save image to MongoDB")
+        else:
+            self.send_error(504, f"Image processing timed out (job {job_id})")
+
 def main():
     try:
         print("\n" + "="*50)
         print("🚀 GAME SHOW HỘI THI DUYÊN DÁNG XƯA VÀ NAY")
         print("="*50)
         
-        # Kết nối MongoDB
-        print("🔌 Đang kết nối tới MongoDB Atlas...")
-        if not db_manager.connect():
-            print("\n❌ LỖI: Không thể kết nối tới MongoDB!")
-            print("   - Hãy đảm bảo máy tính có kết nối internet.")
-            print("   - Kiểm tra lại chuỗi kết nối trong file `config.py`.")
-            print("   - Đảm bảo IP của bạn đã được cho phép (whitelist) trên MongoDB Atlas.")
-            sys.exit(1)
+        if DATABASE_BACKEND == 'sqlite':
+            # Chạy offline: toàn bộ dữ liệu nằm trong một file SQLite
+            print(f"🗄️  Đang mở database SQLite: {SQLITE_PATH}")
+            if not db_manager.connect():
+                print("\n❌ LỖI: Không thể mở file SQLite!")
+                print("   - Kiểm tra quyền ghi vào thư mục chứa SQLITE_PATH.")
+                sys.exit(1)
+        else:
+            # Kết nối MongoDB
+            print("🔌 Đang kết nối tới MongoDB Atlas...")
+            if not db_manager.connect():
+                print("\n❌ LỖI: Không thể kết nối tới MongoDB!")
+                print("   - Hãy đảm bảo máy tính có kết nối internet.")
+                print("   - Kiểm tra lại chuỗi kết nối trong file `config.py`.")
+                print("   - Đảm bảo IP của bạn đã được cho phép (whitelist) trên MongoDB Atlas.")
+                print("   - Hoặc chạy offline với DATABASE_BACKEND=sqlite.")
+                sys.exit(1)
         
         print(f"✅ Kết nối thành công tới database")
         
-        with socketserver.TCPServer((HOST, PORT), CustomHTTPRequestHandler) as httpd:
+        # Mọi thay đổi dữ liệu được đẩy tới màn hình qua /api/events
+        db_manager.add_change_listener(publish_data_change)
+        # Đồng bộ cache với các server khác dùng chung cluster (CACHE_SYNC_MODE)
+        db_manager.start_cache_sync()
+        
+        # File .gz/.br của index.html, script.js, styles.css... trong STATIC_CACHE_DIRECTORY (chỉ build lại khi nội dung đổi)
+        built = static_files.build_sidecars(application_path)
+        if built:
+            print(f"🗜️  Đã tạo {built} file nén sẵn (.gz/.br)")
+        
+        with PooledHTTPServer((HOST, PORT), CustomHTTPRequestHandler,
+                              workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE) as httpd:
             local_url = f"http://{'localhost' if HOST == '0.0.0.0' else HOST}:{PORT}"
 
             print("\n" + "-"*50)
@@ -469,6 +830,7 @@ def main():
             print(f"   - 🏠 Truy cập tại máy này: {local_url}")
             print(f"   - 🌍 Truy cập từ máy khác: http://{PUBLIC_IP}:{PORT}")
             print(f"   - 📁 Thư mục gốc: {application_path}")
+            print(f"   - 🧵 Worker threads: {SERVER_WORKERS} (hàng đợi: {SERVER_QUEUE_SIZE})")
             print(f"\n💡 Nhấn Ctrl+C để dừng server.")
             print("-" * 50 + "\n")
             httpd.serve_forever()
@@ -483,8 +845,11 @@ def main():
         sys.exit(1)
     except KeyboardInterrupt:
         print("\n👋 Đang dừng server...")
+        image_jobs.shutdown()
         db_manager.disconnect()
         print("✅ Server đã dừng!")
 
 if __name__ == "__main__":
+    # Cần cho ProcessPoolExecutor khi chạy bản đóng gói (PyInstaller)
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -5,7 +5,6 @@ Chạy trên IP: 113.161.151.124:8126
 """
 
 import http.server
-import socketserver
 import os
 import sys
 import json
@@ -15,6 +14,22 @@ import uuid
 from pathlib import Path
 import datetime
 
+from config import (
+    SERVER_WORKERS, SERVER_QUEUE_SIZE, COMPRESS_MIN_BYTES, STATIC_CACHE_DIRECTORY,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_KEEPALIVE_MAX_REQUESTS,
+    FILE_STORE_BACKEND, JOURNAL_COMPACT_OPS, JOURNAL_COMPACT_BYTES, JOURNAL_COMPACT_INTERVAL,
+    QUESTION_GRID_SIZES, QUESTION_IMPORT_BATCH_SIZE, QUESTION_IMPORT_MAX_BYTES, QUESTION_IMPORT_MAX_ERRORS,
+    QUESTION_DUPLICATE_THRESHOLD, MAX_IMAGE_SIZE, ALLOWED_IMAGE_TYPES
+)
+from http_utils import PooledHTTPServer, JsonResponseCache, GameShowHandlerMixin, StaticFiles
+from json_store import JsonFileStore
+from journal_store import JournalStore
+from question_engine import QuestionEngine
+from question_import import BoundedReader, CsvQuestionImporter, merge_questions
+from search_index import SearchIndex
+from dedup import DuplicateReport
+from image_upload import UploadTooLarge, is_binary_upload, read_image_upload
+
 # Configuration
 HOST = "0.0.0.0"  # Bind to all interfaces (cho phép truy cập từ ngoài)
 # PUBLIC_IP = "113.161.151.124"  # IP public (đã port forward). Bỏ ghi chú khi deploy.
@@ -24,7 +39,45 @@ DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 DB_DIRECTORY = os.path.join(DIRECTORY, 'db')
 IMAGES_DIRECTORY = os.path.join(DIRECTORY, 'images', 'teams')
 
-class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+# Đọc / ghi db/<name>.json: ghi nguyên tử, đọc từ bản trong bộ nhớ.
+# FILE_STORE_BACKEND='journal': ghi nối từng thay đổi vào db/<name>.journal
+if FILE_STORE_BACKEND == 'journal':
+    file_store = JournalStore(DB_DIRECTORY, compact_ops=JOURNAL_COMPACT_OPS,
+                              compact_bytes=JOURNAL_COMPACT_BYTES,
+                              compact_interval=JOURNAL_COMPACT_INTERVAL)
+else:
+    file_store = JsonFileStore(DB_DIRECTORY)
+
+# Bytes JSON đã encode sẵn + ETag cho các GET /api/data/<key>
+response_cache = JsonResponseCache(compress_min_bytes=COMPRESS_MIN_BYTES)
+
+# Fingerprint file tĩnh cho ETag và URL ?v=<hash>
+static_files = StaticFiles(compress_min_bytes=COMPRESS_MIN_BYTES, cache_dir=STATIC_CACHE_DIRECTORY)
+
+# Các danh sách 'đã dùng' hỗ trợ thêm / bớt từng phần tử
+USED_KEYS = ('used_questions', 'used_judges', 'used_final_questions')
+
+# Lưới câu hỏi Phần 1 / Phần 2: trạng thái dạng bitmap, bốc câu hỏi chưa dùng trong 1 request
+question_engine = QuestionEngine(
+    lambda: file_store.read('questions', []),
+    lambda: file_store.read('used_questions', []),
+    lambda value: file_store.add_item('used_questions', value),
+    QUESTION_GRID_SIZES
+)
+
+# Báo cáo câu hỏi gần trùng (/api/questions/duplicates), chỉ tính lại khi questions đổi
+duplicate_report = DuplicateReport(lambda: file_store.read('questions', []))
+
+# Tìm kiếm câu hỏi / câu hỏi phụ của BGK không phân biệt dấu (/api/search)
+search_index = SearchIndex(
+    lambda: file_store.read('questions', []),
+    lambda: file_store.read('judges', [])
+)
+
+class CustomHTTPRequestHandler(GameShowHandlerMixin, http.server.SimpleHTTPRequestHandler):
+    timeout = HTTP_KEEPALIVE_TIMEOUT
+    max_keepalive_requests = HTTP_KEEPALIVE_MAX_REQUESTS
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
     
@@ -32,11 +85,12 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         # Add CORS headers for API calls
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
         super().end_headers()
     
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
@@ -47,42 +101,19 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             # Serve images with proper MIME types
             self.serve_image()
         else:
-            # Serve static files
-            super().do_GET()
+            # Serve static files (sendfile + ETag / Last-Modified, asset có hash cache lâu dài)
+            self.serve_static(static_files)
     
     def serve_image(self):
         """Serve images from images directory"""
         try:
-            # Remove leading slash and decode URL
-            image_path = urllib.parse.unquote(self.path[1:])  # Remove leading /
-            full_path = os.path.join(DIRECTORY, image_path)
-            
-            if not os.path.exists(full_path):
+            # translate_path chuẩn hoá đường dẫn (không cho thoát khỏi thư mục gốc)
+            full_path = self.translate_path(self.path)
+            if not os.path.isfile(full_path):
                 self.send_error(404, "Image not found")
                 return
-            
-            # Get file extension for MIME type
-            ext = os.path.splitext(full_path)[1].lower()
-            mime_types = {
-                '.png': 'image/png',
-                '.jpg': 'image/jpeg', 
-                '.jpeg': 'image/jpeg',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp',
-                '.svg': 'image/svg+xml'
-            }
-            
-            content_type = mime_types.get(ext, 'application/octet-stream')
-            
-            # Read and serve the image
-            with open(full_path, 'rb') as f:
-                image_data = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.send_header('Content-length', len(image_data))
-            self.end_headers()
-            self.wfile.write(image_data)
+
+            self.serve_static_file(full_path, static_files)
             
         except Exception as e:
             self.send_error(500, f"Error serving image: {str(e)}")
@@ -110,6 +141,18 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 if action == 'data' and len(path_parts) >= 4:
                     filename = path_parts[3]
                     self.handle_data_request(filename)
+                elif action == 'used' and self.command == 'POST' and len(path_parts) >= 5:
+                    self.handle_used_item(path_parts[3], path_parts[4])
+                elif (action == 'import' and self.command == 'POST' and
+                      len(path_parts) >= 4 and path_parts[3] == 'questions'):
+                    self.handle_question_import()
+                elif (action == 'questions' and self.command == 'GET' and
+                      len(path_parts) == 4 and path_parts[3] == 'duplicates'):
+                    self.handle_question_duplicates()
+                elif action == 'questions' and len(path_parts) >= 5:
+                    self.handle_question_grid(path_parts[3], path_parts[4])
+                elif action == 'search' and self.command == 'GET':
+                    self.handle_search()
                 elif action == 'upload-image' and self.command == 'POST':
                     self.handle_image_upload()
                 elif action == 'clear-all' and self.command == 'DELETE':
@@ -130,34 +173,31 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             health_info = {
                 "status": "ok",
                 "database": "file_based",
-                "timestamp": str(datetime.datetime.now())
+                "fileStore": FILE_STORE_BACKEND,
+                "timestamp": str(datetime.datetime.now()),
+                "search_index": search_index.stats()
             }
+            if isinstance(file_store, JournalStore):
+                health_info["journal"] = file_store.stats()
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(health_info).encode('utf-8'))
+            self.send_json(health_info)
             
         except Exception as e:
             self.send_error(500, f"Health check failed: {str(e)}")
     
     def handle_data_request(self, filename):
         """Handle data file operations"""
-        file_path = os.path.join(DB_DIRECTORY, f"{filename}.json")
+        if not filename or filename.startswith('.') or '/' in filename or '\\' in filename:
+            self.send_error(404, "API endpoint not found")
+            return
         
         if self.command == 'GET':
-            # Read data
+            # Read data (parse lại chỉ khi file đổi trên đĩa)
             try:
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                else:
-                    data = [] if filename not in ['login'] else {"logged_in": False}
+                default = [] if filename not in ['login'] else {"logged_in": False}
+                data = file_store.read(filename, default)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+                self.send_cached_json(response_cache, filename, data)
                 
             except json.JSONDecodeError as e:
                 # Handle corrupted JSON files
@@ -176,22 +216,170 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 if filename == 'teams' and isinstance(data, list):
                     data = self.validate_and_clean_teams_data(data)
                 
-                # Ensure db directory exists
-                os.makedirs(DB_DIRECTORY, exist_ok=True)
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                # File tạm + fsync + os.replace: không bao giờ để lại file ghi dở
+                file_store.write(filename, data)
                 
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"success": True}).encode('utf-8'))
+                self.send_json({"success": True})
                 
             except json.JSONDecodeError as e:
                 self.send_error(400, f"Invalid JSON data: {str(e)}")
             except Exception as e:
                 self.send_error(500, f"Error writing {filename}: {str(e)}")
     
+    def handle_used_item(self, kind, action):
+        """Thêm / bỏ một giá trị trong danh sách 'đã dùng': POST /api/used/<kind>/add|remove"""
+        try:
+            if kind not in USED_KEYS or action not in ('add', 'remove'):
+                self.send_error(404, "API endpoint not found")
+                return
+            
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            
+            value = data.get('value') if isinstance(data, dict) else None
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                self.send_error(400, "Bad Request: 'value' must be a string or number")
+                return
+            
+            # Đọc - sửa - ghi trong lock của file để hai máy bấm cùng lúc không ghi đè nhau
+            if action == 'add':
+                changed = file_store.add_item(kind, value)
+            else:
+                changed = file_store.remove_item(kind, value)
+            
+            self.send_json({"success": True, "changed": changed})
+            
+        except json.JSONDecodeError as e:
+            self.send_error(400, f"Invalid JSON data: {str(e)}")
+        except Exception as e:
+            self.send_error(500, f"Error updating {kind}: {str(e)}")
+    
+    def handle_question_grid(self, part, action):
+        """
+        Lưới câu hỏi của một phần (part = 1 | 2):
+            GET  /api/questions/<part>/grid - bitmap ô đã dùng + số câu hỏi
+            POST /api/questions/<part>/draw - {"number": N} hoặc {"mode": "next" | "random"}
+        """
+        try:
+            if not part.isdigit() or int(part) not in question_engine.grid_sizes:
+                self.send_error(404, "Question part not found")
+                return
+            part = int(part)
+            
+            if action == 'grid' and self.command == 'GET':
+                self.send_json(question_engine.grid(part))
+            elif action == 'draw' and self.command == 'POST':
+                content_length = int(self.headers.get('Content-Length') or 0)
+                post_data = self.rfile.read(content_length) if content_length else b''
+                data = json.loads(post_data.decode('utf-8')) if post_data.strip() else {}
+                if not isinstance(data, dict):
+                    data = {}
+                
+                number = data.get('number')
+                if number is not None and (isinstance(number, bool) or not isinstance(number, int)):
+                    self.send_error(400, "Bad Request: 'number' must be an integer")
+                    return
+                
+                result = question_engine.draw(part, data.get('mode', 'next'), number)
+                if result is None:
+                    self.send_error(409, "No unused questions left")
+                    return
+                self.send_json(result, ensure_ascii=False)
+            else:
+                self.send_error(404, "API endpoint not found")
+            
+        except ValueError as e:
+            # Gồm cả json.JSONDecodeError
+            self.send_error(400, f"Bad Request: {str(e)}")
+        except Exception as e:
+            self.send_error(500, f"Error handling question grid request: {str(e)}")
+    
+    def handle_question_duplicates(self):
+        """GET /api/questions/duplicates[?threshold=0.8] - các nhóm câu hỏi gần trùng"""
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            try:
+                threshold = float(query.get('threshold', [QUESTION_DUPLICATE_THRESHOLD])[0])
+            except ValueError:
+                threshold = -1.0
+            if not 0 < threshold <= 1:
+                self.send_error(400, "Bad Request: 'threshold' must be in (0, 1]")
+                return
+            
+            self.send_json(duplicate_report.report(threshold), ensure_ascii=False)
+            
+        except Exception as e:
+            self.send_error(500, f"Error building duplicate report: {str(e)}")
+    
+    def handle_search(self):
+        """GET /api/search?q=<từ khóa>[&limit=20][&scope=all|questions|judges] - không phân biệt dấu"""
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            text = query.get('q', [''])[0].strip()
+            scope = query.get('scope', ['all'])[0]
+            limit = query.get('limit', ['20'])[0]
+            
+            if not text:
+                self.send_error(400, "Bad Request: missing 'q'")
+                return
+            if scope not in ('all', 'questions', 'judges'):
+                self.send_error(400, "Bad Request: 'scope' must be all, questions or judges")
+                return
+            if not limit.isdigit() or not 1 <= int(limit) <= 100:
+                self.send_error(400, "Bad Request: 'limit' must be between 1 and 100")
+                return
+            
+            self.send_json(search_index.search(text, int(limit), scope), ensure_ascii=False)
+            
+        except Exception as e:
+            self.send_error(500, f"Error searching questions: {str(e)}")
+    
+    def handle_question_import(self):
+        """
+        POST /api/import/questions[?mode=replace|merge] - body là file CSV (ques, ans_1..ans_5, correct_ans).
+        replace (mặc định): thay toàn bộ câu hỏi bằng nội dung file; merge: ghi đè câu trùng, thêm câu mới.
+        """
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            mode = query.get('mode', ['replace'])[0]
+            if mode not in ('replace', 'merge'):
+                self.send_error(400, "Bad Request: mode must be 'replace' or 'merge'")
+                return
+            
+            if self.headers.get('Content-Length') is None:
+                self.send_error(411, "Content-Length required")
+                return
+            content_length = int(self.headers['Content-Length'])
+            if content_length > QUESTION_IMPORT_MAX_BYTES:
+                self.send_error(413, f"CSV file too large (max {QUESTION_IMPORT_MAX_BYTES} bytes)")
+                return
+            
+            # Parse body theo luồng; file questions.json vẫn được ghi lại một lần ở cuối
+            body = BoundedReader(self.rfile, content_length)
+            importer = CsvQuestionImporter(body, QUESTION_GRID_SIZES[1], batch_size=QUESTION_IMPORT_BATCH_SIZE,
+                                           max_errors=QUESTION_IMPORT_MAX_ERRORS,
+                                           duplicate_threshold=QUESTION_DUPLICATE_THRESHOLD)
+            importer.read_header()
+            imported = [question for batch in importer.batches() for question in batch]
+            
+            replace = mode == 'replace'
+            questions = file_store.update(
+                'questions',
+                lambda existing: merge_questions(existing, imported, replace) if imported else existing,
+                []
+            )
+            
+            result = {"success": True, "mode": mode}
+            result.update(importer.summary())
+            result["total"] = len(questions)
+            self.send_json(result, ensure_ascii=False)
+            
+        except ValueError as e:
+            self.send_error(400, f"Bad Request: {str(e)}")
+        except Exception as e:
+            self.send_error(500, f"Error importing questions: {str(e)}")
+    
     def validate_and_clean_teams_data(self, teams_data):
         """Validate and clean teams data - chỉ lưu metadata, không lưu base64"""
         cleaned_teams = []
@@ -232,26 +420,26 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                          'used_judges.json', 'used_questions.json']
             
             for file_name in data_files:
-                file_path = os.path.join(DB_DIRECTORY, file_name)
-                if os.path.exists(file_path):
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump([], f)
+                name = file_name[:-len('.json')]
+                if file_store.exists(name):
+                    file_store.write(name, [])
             
             # Reset login
-            login_path = os.path.join(DB_DIRECTORY, 'login.json')
-            with open(login_path, 'w', encoding='utf-8') as f:
-                json.dump({"logged_in": False}, f)
+            file_store.write('login', {"logged_in": False})
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"success": True, "message": "Đã xóa tất cả dữ liệu!"}).encode('utf-8'))
+            self.send_json({"success": True, "message": "Đã xóa tất cả dữ liệu!"})
             
         except Exception as e:
             self.send_error(500, f"Error clearing data: {str(e)}")
     
     def handle_image_upload(self):
-        """Handle image upload for teams"""
+        """
+        Handle image upload for teams.
+        Body: JSON {imageData, teamName, teamId}, nguyên file ảnh (Content-Type: image/*) hoặc multipart/form-data
+        """
+        if is_binary_upload(self.headers.get('Content-Type')):
+            self.handle_binary_image_upload()
+            return
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
@@ -300,11 +488,42 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 "dimensions": {"width": 0, "height": 0}  # No dimension detection in basic version
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            self.send_json(response_data)
+            
+        except Exception as e:
+            self.send_error(500, f"Error uploading image: {str(e)}")
+
+    def handle_binary_image_upload(self):
+        """Ghi thẳng bytes ảnh từ body image/* hoặc multipart ra images/teams (không qua base64)"""
+        if self.headers.get('Content-Length') is None:
+            self.send_error(411, "Content-Length required")
+            return
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            upload = read_image_upload(self.rfile, self.headers, query, MAX_IMAGE_SIZE)
+            if upload.mime_type not in ALLOWED_IMAGE_TYPES:
+                raise ValueError(f"Unsupported image type: {upload.mime_type}")
+            
+            file_id = str(uuid.uuid4())
+            filename = f"{file_id}.{upload.mime_type.split('/')[1]}"
+            os.makedirs(IMAGES_DIRECTORY, exist_ok=True)
+            with open(os.path.join(IMAGES_DIRECTORY, filename), 'wb') as f:
+                f.write(upload.data)
             
+            self.send_json({
+                "success": True,
+                "image_id": file_id,
+                "imagePath": f"images/teams/{filename}",
+                "original_size": len(upload.data),
+                "optimized_size": len(upload.data),
+                "dimensions": {"width": 0, "height": 0}
+            })
+        except UploadTooLarge as e:
+            # Phần body chưa đọc vẫn nằm trên socket - không dùng lại kết nối này
+            self.close_connection = True
+            self.send_error(413, str(e))
+        except ValueError as e:
+            self.send_error(400, f"Invalid request: {str(e)}")
         except Exception as e:
             self.send_error(500, f"Error uploading image: {str(e)}")
 
@@ -314,13 +533,28 @@ def main():
         os.makedirs(DB_DIRECTORY, exist_ok=True)
         os.makedirs(IMAGES_DIRECTORY, exist_ok=True)
         
-        with socketserver.TCPServer((HOST, PORT), CustomHTTPRequestHandler) as httpd:
+        if isinstance(file_store, JournalStore):
+            started = datetime.datetime.now()
+            loaded = file_store.load_all()
+            elapsed = (datetime.datetime.now() - started).total_seconds() * 1000
+            print(f"📒 Journal: đã nạp {loaded} collection trong {elapsed:.0f} ms")
+        
+        # File .gz/.br của index.html, script.js, styles.css... trong STATIC_CACHE_DIRECTORY (chỉ build lại khi nội dung đổi)
+        built = static_files.build_sidecars(DIRECTORY)
+        if built:
+            print(f"🗜️  Đã tạo {built} file nén sẵn (.gz/.br)")
+        
+        with PooledHTTPServer((HOST, PORT), CustomHTTPRequestHandler,
+                              workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE) as httpd:
+            if isinstance(file_store, JournalStore):
+                file_store.start()
             print(f"🎮 Game Show Server với API đang chạy...")
             print(f"🌐 Local URL: http://localhost:{PORT}")
             # print(f"🌍 Public URL: http://{PUBLIC_IP}:{PORT}") # Bỏ ghi chú dòng này khi deploy
             print(f"📁 Thư mục: {DIRECTORY}")
-            print(f"🗄️  Database: {DB_DIRECTORY}")
+            print(f"🗄️  Database: {DB_DIRECTORY} ({FILE_STORE_BACKEND})")
             print(f"🖼️  Images: {IMAGES_DIRECTORY}")
+            print(f"🧵 Worker threads: {SERVER_WORKERS} (hàng đợi: {SERVER_QUEUE_SIZE})")
             print(f"⏹️  Nhấn Ctrl+C để dừng server")
             print("-" * 50)
             httpd.serve_forever()
@@ -334,6 +568,9 @@ def main():
         sys.exit(1)
     except KeyboardInterrupt:
         print("\n👋 Server đã dừng!")
+    finally:
+        if isinstance(file_store, JournalStore):
+            file_store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
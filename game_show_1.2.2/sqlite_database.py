@@ -0,0 +1,1005 @@
+"""
+SQLite backend cho Game Show (DATABASE_BACKEND='sqlite')
+
+Cùng interface với database.DatabaseManager nên server_mongodb.py chạy được
+hoàn toàn offline ở những địa điểm không vào được MongoDB Atlas. Toàn bộ dữ liệu
+nằm trong một file (SQLITE_PATH) ở chế độ WAL: các worker thread đọc song song
+trong khi một thread ghi. Ảnh nằm trong bảng image_blobs riêng.
+
+Cache đọc, version, change listener (SSE) và LRU cache ảnh dùng lại của
+DatabaseManager; lớp này chỉ thay phần đọc / ghi dữ liệu.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import COLLECTIONS, SQLITE_PATH, CACHE_SYNC_MODE, CACHE_VERSIONS_COLLECTION, IMAGE_GC_MIN_AGE
+from database import DatabaseManager
+from image_processing import image_content_hash
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    pos REAL NOT NULL,
+    doc TEXT NOT NULL,
+    value TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_collection_pos ON documents (collection, pos);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_used_value
+    ON documents (collection, value) WHERE value IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_documents_doc_id ON documents (collection, json_extract(doc, '$.id'));
+
+CREATE TABLE IF NOT EXISTS teams (
+    team_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    image_id TEXT,
+    doc TEXT NOT NULL,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_teams_name ON teams (name);
+
+CREATE TABLE IF NOT EXISTS images (
+    image_id TEXT PRIMARY KEY,
+    blob_id INTEGER,
+    team_id TEXT,
+    team_name TEXT,
+    filename TEXT,
+    mime_type TEXT NOT NULL,
+    original_size INTEGER,
+    optimized_size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    variants TEXT,
+    created_at TEXT,
+    content_hash TEXT,
+    ref_count INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_team_id ON images (team_id);
+CREATE INDEX IF NOT EXISTS idx_images_filename ON images (filename);
+
+CREATE TABLE IF NOT EXISTS image_blobs (
+    blob_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image_id TEXT NOT NULL REFERENCES images (image_id) ON DELETE CASCADE,
+    variant TEXT,
+    content_type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_image_blobs_image_id ON image_blobs (image_id);
+
+CREATE TABLE IF NOT EXISTS users (
+    type TEXT PRIMARY KEY,
+    logged_in INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS {CACHE_VERSIONS_COLLECTION} (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _json_default(value):
+    if hasattr(value, 'isoformat'):  # datetime objects
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    backend = 'sqlite'
+
+    # Collection lưu trong bảng riêng, không đi qua documents
+    _SPECIAL_COLLECTIONS = (COLLECTIONS['teams'], COLLECTIONS['images'], COLLECTIONS['users'])
+
+    def __init__(self, path: str = SQLITE_PATH):
+        super().__init__()
+        self.path = path
+        # Mỗi thread một connection (sqlite3 connection không dùng chung giữa các thread được)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # SQLite chỉ có một writer: xếp hàng trong process thay vì chờ busy_timeout
+        self._write_lock = threading.Lock()
+
+    # =============== CONNECTION ===============
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction ghi (BEGIN IMMEDIATE ... COMMIT, ROLLBACK nếu lỗi)"""
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def connect(self):
+        """Mở (hoặc tạo) file SQLite và tạo bảng / index"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._conn()
+            # WAL: đọc không bị chặn bởi ghi, mỗi commit chỉ append vào file -wal
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._upgrade_schema(conn)
+            self.connected = True
+            logger.info(f"Opened SQLite database: {self.path}")
+            return True
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"❌ Failed to open SQLite database {self.path}: {e}")
+            self.connected = False
+            return False
+
+    @staticmethod
+    def _upgrade_schema(conn):
+        """Thêm các cột mới vào file SQLite tạo bởi phiên bản cũ"""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(images)')}
+        for column, definition in (('content_hash', 'TEXT'), ('ref_count', 'INTEGER NOT NULL DEFAULT 1'),
+                                   ('updated_at', 'TEXT')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE images ADD COLUMN {column} {definition}')
+        # Ảnh cũ (content_hash NULL) không tham gia dedup
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_images_content_hash ON images (content_hash) '
+                     'WHERE content_hash IS NOT NULL')
+
+    def disconnect(self):
+        """Đóng mọi connection SQLite"""
+        self.stop_cache_sync()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        if self.connected:
+            self.connected = False
+            self.invalidate_cache(local=False)
+            logger.info("Closed SQLite database")
+
+    def is_connected(self):
+        """File cục bộ: không cần ping"""
+        return self.connected
+
+    def server_time(self) -> Optional[datetime]:
+        return datetime.utcnow() if self.connected else None
+
+    # =============== MULTI-INSTANCE CACHE SYNC ===============
+
+    def start_cache_sync(self, mode: str = CACHE_SYNC_MODE) -> None:
+        """SQLite không có change stream: mọi mode khác 'off' đều poll bảng version trong file"""
+        super().start_cache_sync('off' if mode == 'off' else 'poll')
+
+    def _bump_shared_versions(self, names) -> None:
+        try:
+            with self._transaction() as conn:
+                for name in names:
+                    conn.execute(
+                        f"INSERT INTO {CACHE_VERSIONS_COLLECTION} (name, version) VALUES (?, 1) "
+                        "ON CONFLICT (name) DO UPDATE SET version = version + 1", (name,)
+                    )
+                    if self._shared_versions is not None:
+                        self._shared_versions[name] = conn.execute(
+                            f"SELECT version FROM {CACHE_VERSIONS_COLLECTION} WHERE name = ?", (name,)
+                        ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish cache version for {names}: {e}")
+
+    def _read_shared_versions(self) -> Dict[str, int]:
+        return dict(self._conn().execute(f"SELECT name, version FROM {CACHE_VERSIONS_COLLECTION}").fetchall())
+
+    # =============== TEAM OPERATIONS ===============
+
+    def get_teams(self) -> List[Dict]:
+        """
+        Lấy danh sách tất cả các team (có cache).
+        Kết quả được dùng chung giữa các request - không sửa trực tiếp list trả về.
+        """
+        cache_key = ('teams', COLLECTIONS['teams'])
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            return []
+
+        version = self._versions.get(cache_key[1], 0)
+        try:
+            teams = []
+            for (doc,) in self._conn().execute('SELECT doc FROM teams ORDER BY rowid'):
+                team = json.loads(doc)
+                if 'image_id' in team:
+                    team['imagePath'] = f"/api/image/{team['image_id']}"
+                elif 'imagePath' not in team:
+                    team['imagePath'] = 'images/default-team.png'
+                teams.append(team)
+
+            self._cache_put(cache_key, teams, version)
+            return teams
+
+        except Exception as e:
+            logger.error(f"Error getting teams: {e}")
+            return []
+
+    def save_teams(self, teams_data: List[Dict], stats: Optional[Dict] = None) -> bool:
+        """
+        Upsert danh sách teams trong một transaction (giữ các trường khác của team đã có).
+        Team đổi ảnh: ref_count của ảnh mới tăng, ảnh cũ được bỏ một tham chiếu.
+        """
+        if not self.is_connected():
+            return False
+
+        try:
+            teams = [team for team in teams_data if 'team_id' in team and 'name' in team]
+            stats = {} if stats is None else stats
+            stats.update({'operations': len(teams), 'upserted': 0, 'modified': 0, 'errors': []})
+            if not teams:
+                return True
+
+            now = _now()
+            old_images, new_images = [], []
+            with self._transaction() as conn:
+                for team in teams:
+                    row = conn.execute('SELECT doc FROM teams WHERE team_id = ?', (team['team_id'],)).fetchone()
+                    doc = json.loads(row[0]) if row else {'team_id': team['team_id']}
+                    updated = dict(doc, name=str(team['name']))
+                    if 'image_id' in team:
+                        updated['image_id'] = team['image_id']
+                    if 'imagePath' in team:
+                        updated['imagePath'] = team['imagePath']
+                    old_images.append(doc)
+                    new_images.append(updated)
+
+                    if row is None:
+                        conn.execute(
+                            'INSERT INTO teams (team_id, name, image_id, doc, created_at, updated_at) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (team['team_id'], updated['name'], updated.get('image_id'), _dumps(updated), now, now)
+                        )
+                        stats['upserted'] += 1
+                    elif updated != doc:
+                        conn.execute(
+                            'UPDATE teams SET name = ?, image_id = ?, doc = ?, updated_at = ? WHERE team_id = ?',
+                            (updated['name'], updated.get('image_id'), _dumps(updated), now, team['team_id'])
+                        )
+                        stats['modified'] += 1
+
+                deleted = self._update_image_references(conn, self._reference_counts(old_images),
+                                                        self._reference_counts(new_images))
+            self._forget_images(deleted)
+
+            logger.info(f"Saved {len(teams)} teams in one transaction "
+                        f"({stats['upserted']} upserted, {stats['modified']} modified)")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving teams: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
+
+    def save_team(self, team_data: Dict) -> bool:
+        """Lưu một team mới vào database."""
+        if not self.is_connected():
+            return False
+
+        try:
+            if 'team_id' not in team_data or 'name' not in team_data:
+                logger.error("Team data is missing 'team_id' or 'name'.")
+                return False
+
+            now = _now()
+            with self._transaction() as conn:
+                conn.execute(
+                    'INSERT INTO teams (team_id, name, image_id, doc, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (team_data['team_id'], str(team_data['name']), team_data.get('image_id'),
+                     _dumps(team_data), now, now)
+                )
+                self._update_image_references(conn, Counter(), self._reference_counts([team_data]))
+            logger.info(f"Successfully saved team: {team_data['name']}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error saving teams: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
+
+    def delete_team(self, team_id: str) -> bool:
+        """Xóa một team và ảnh của team (cùng một transaction)"""
+        if not self.is_connected():
+            return False
+        logger.info(f"--- Attempting to delete team with id: '{team_id}' ---")
+
+        try:
+            with self._transaction() as conn:
+                row = conn.execute('SELECT doc FROM teams WHERE team_id = ?', (team_id,)).fetchone()
+                if row is None:
+                    logger.warning(f"Team with id: {team_id} not found for deletion.")
+                    return False
+                conn.execute('DELETE FROM teams WHERE team_id = ?', (team_id,))
+                # Bỏ một tham chiếu; ảnh chỉ bị xóa khi không còn team / judge nào dùng
+                deleted = self._update_image_references(conn, self._reference_counts([json.loads(row[0])]), Counter())
+
+            logger.info(f"Successfully deleted team with id: {team_id}")
+            self._forget_images(deleted)
+            for image_id in deleted:
+                logger.info(f"Successfully deleted associated image with id: {image_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting team {team_id}: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['teams'])
+
+    def _replace_teams(self, teams_data: List[Dict]) -> None:
+        now = _now()
+        with self._transaction() as conn:
+            old_references = self._reference_counts(json.loads(row[0]) for row in conn.execute('SELECT doc FROM teams'))
+            conn.execute('DELETE FROM teams')
+            for team in teams_data:
+                team_id = team.get('team_id', team.get('id'))
+                conn.execute(
+                    'INSERT OR REPLACE INTO teams (team_id, name, image_id, doc, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (team_id, str(team.get('name', '')), team.get('image_id'), _dumps(team), now, now)
+                )
+            deleted = self._update_image_references(conn, old_references, self._reference_counts(teams_data))
+        self._forget_images(deleted)
+        logger.info("Replaced team data.")
+
+    def delete_judge(self, judge_id: str) -> bool:
+        """Xóa một judge và bỏ tham chiếu tới ảnh của judge (cùng một transaction)"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT id, doc FROM documents WHERE collection = ? AND json_extract(doc, '$.id') = ?",
+                    (COLLECTIONS['judges'], judge_id)
+                ).fetchone()
+                if row is None:
+                    logger.warning(f"Judge with id: {judge_id} not found for deletion.")
+                    return False
+                conn.execute('DELETE FROM documents WHERE id = ?', (row[0],))
+                deleted = self._update_image_references(conn, self._reference_counts([json.loads(row[1])]), Counter())
+            self._forget_images(deleted)
+            logger.info(f"Successfully deleted judge with id: {judge_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting judge {judge_id}: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['judges'])
+
+    # =============== IMAGE OPERATIONS ===============
+
+    def store_processed_image(self, processed: Dict, team_name: str, team_id: str = None,
+                              image_id: str = None) -> Optional[Dict]:
+        """
+        Lưu ảnh đã xử lý bởi process_image vào bảng images / image_blobs.
+        Ảnh gốc và mọi biến thể được ghi trong một transaction.
+        """
+        if not self.is_connected():
+            logger.error("Cannot save image: Not connected to database")
+            return None
+
+        try:
+            with self._transaction() as conn:
+                result = self._store_image(conn, processed, team_name, team_id, image_id)
+            if result['blobs']:
+                logger.info(f"Stored image {result['image_id']} with {result['blobs']} blobs in SQLite")
+            else:
+                logger.info(f"Image content already stored as {result['image_id']}, reusing it")
+            return self._image_result(result)
+
+        except Exception as e:
+            import traceback
+            logger.error(f"Error saving team image: {e}\n{traceback.format_exc()}")
+            return None
+
+    def store_processed_images(self, items: List[tuple]) -> List[Optional[Dict]]:
+        """
+        Lưu một lô (processed, team_name, team_id) trong một transaction - cả lô cùng thành công hoặc lỗi.
+        Ảnh trùng nội dung (trong lô hoặc với ảnh đã lưu) dùng chung một image_id.
+        """
+        if not self.is_connected():
+            logger.error("Cannot save images: Not connected to database")
+            return [None] * len(items)
+
+        try:
+            with self._transaction() as conn:
+                results = [self._store_image(conn, processed, team_name, team_id)
+                           for processed, team_name, team_id in items]
+            logger.info(f"Stored {len(results)} images in one SQLite transaction "
+                        f"({sum(not result['blobs'] for result in results)} reused)")
+            return [self._image_result(result) for result in results]
+
+        except Exception as e:
+            logger.error(f"Error saving image batch: {e}")
+            return [None] * len(items)
+
+    @classmethod
+    def _store_image(cls, conn, processed: Dict, team_name: str, team_id: str = None, image_id: str = None) -> Dict:
+        """Dùng lại ảnh cùng nội dung nếu đã có (blobs=0, chỉ làm mới updated_at), nếu không thì ghi ảnh mới"""
+        content_hash = image_content_hash(processed)
+        row = conn.execute(
+            'SELECT image_id, blob_id, original_size, optimized_size, width, height, variants '
+            'FROM images WHERE content_hash = ?', (content_hash,)
+        ).fetchone()
+        if row is None:
+            return cls._insert_image(conn, processed, team_name, team_id, image_id)
+        conn.execute('UPDATE images SET updated_at = ? WHERE image_id = ?', (_now(), row[0]))
+        return {
+            'image_id': row[0],
+            'grid_file_id': row[1],
+            'original_size': row[2],
+            'optimized_size': row[3],
+            'dimensions': {'width': row[4], 'height': row[5]},
+            'variants': json.loads(row[6]) if row[6] else {},
+            'blobs': 0,
+        }
+
+    @staticmethod
+    def _insert_image(conn, processed: Dict, team_name: str, team_id: str = None, image_id: str = None) -> Dict:
+        """Ghi metadata + blob ảnh gốc và các biến thể (trong transaction của caller)"""
+        mime_type = processed['mime_type']
+        optimized_bytes = processed['optimized']
+        dimensions = processed['dimensions']
+        file_id = image_id or str(uuid.uuid4())
+        filename = f"{file_id}.{mime_type.split('/')[1]}"
+        now = _now()
+
+        def insert_blob(variant, content_type, data):
+            return conn.execute(
+                'INSERT INTO image_blobs (image_id, variant, content_type, data, created_at) VALUES (?, ?, ?, ?, ?)',
+                (file_id, variant, content_type, data, now)
+            ).lastrowid
+
+        conn.execute(
+            'INSERT INTO images (image_id, team_id, team_name, filename, mime_type, original_size, '
+            'optimized_size, width, height, created_at, content_hash, ref_count, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)',
+            (file_id, team_id, team_name, filename, mime_type, processed['original_size'],
+             len(optimized_bytes), dimensions['width'], dimensions['height'], now,
+             image_content_hash(processed), now)
+        )
+        blob_id = insert_blob(None, mime_type, optimized_bytes)
+
+        variant_docs = {}
+        stored = {}
+        for name, variant in processed['variants'].items():
+            files = {}
+            for variant_mime, data in variant['formats'].items():
+                # Biến thể trùng kích thước dùng chung một blob
+                if id(data) not in stored:
+                    stored[id(data)] = insert_blob(name, variant_mime, data)
+                files[variant_mime] = {'blob_id': stored[id(data)], 'size': len(data)}
+            variant_docs[name] = {'width': variant['width'], 'height': variant['height'], 'files': files}
+
+        conn.execute('UPDATE images SET blob_id = ?, variants = ? WHERE image_id = ?',
+                     (blob_id, json.dumps(variant_docs), file_id))
+
+        return {
+            'image_id': file_id,
+            'grid_file_id': blob_id,
+            'original_size': processed['original_size'],
+            'optimized_size': len(optimized_bytes),
+            'dimensions': dimensions,
+            'variants': variant_docs,
+            'blobs': len(stored) + 1,
+        }
+
+    def _update_image_references(self, conn, old_references: Counter, new_references: Counter) -> List[str]:
+        """Giống DatabaseManager._update_image_references, trong transaction của caller. Trả về image_id đã xóa"""
+        changes = Counter(new_references)
+        changes.subtract(old_references)
+        conn.executemany('UPDATE images SET ref_count = ref_count + ? WHERE image_id = ?',
+                         [(delta, image_id) for image_id, delta in changes.items() if delta > 0])
+        return [image_id for image_id, delta in changes.items()
+                if delta < 0 and self._release_image(conn, image_id, -delta)]
+
+    def _forget_images(self, image_ids: List[str]):
+        """Bỏ ảnh đã xóa khỏi cache (sau khi transaction đã commit)"""
+        if image_ids:
+            for image_id in image_ids:
+                self.image_cache.discard(image_id)
+            self.invalidate_cache(COLLECTIONS['images'])
+
+    def _release_image(self, conn, image_id: str, count: int = 1) -> bool:
+        """
+        Bỏ `count` tham chiếu tới ảnh (trong transaction của caller); xóa ảnh khi hết tham chiếu.
+        Giống DatabaseManager._release_image: ảnh vừa upload / dùng lại được giữ lại cho gc.
+        """
+        conn.execute('UPDATE images SET ref_count = ref_count - ? WHERE image_id = ?', (count, image_id))
+        row = conn.execute('SELECT ref_count, updated_at FROM images WHERE image_id = ?', (image_id,)).fetchone()
+        if row is None or row[0] > 0:
+            return False
+        cutoff = (datetime.utcnow() - timedelta(seconds=IMAGE_GC_MIN_AGE)).isoformat()
+        if row[1] is not None and row[1] >= cutoff:
+            logger.info(f"Image {image_id} has no references but was uploaded recently, leaving it to gc")
+            return False
+        conn.execute('DELETE FROM image_blobs WHERE image_id = ?', (image_id,))
+        conn.execute('DELETE FROM images WHERE image_id = ?', (image_id,))
+        return True
+
+    def _image_references(self, conn) -> Counter:
+        """image_id -> số team / judge đang dùng ảnh, đọc trong transaction của gc (không qua cache)"""
+        docs = [json.loads(row[0]) for row in conn.execute('SELECT doc FROM teams')]
+        docs += [json.loads(row[0]) for row in conn.execute(
+            'SELECT doc FROM documents WHERE collection = ?', (COLLECTIONS['judges'],))]
+        return self._reference_counts(docs)
+
+    def collect_garbage(self, dry_run: bool = False, min_age: float = IMAGE_GC_MIN_AGE) -> Optional[Dict]:
+        """Giống DatabaseManager.collect_garbage: đếm lại tham chiếu, xóa ảnh / blob không còn ai dùng"""
+        if not self.is_connected():
+            logger.error("Cannot collect garbage: Not connected to database")
+            return None
+
+        try:
+            cutoff = (datetime.utcnow() - timedelta(seconds=min_age)).isoformat()
+            stats = {'images': 0, 'deleted_images': 0, 'ref_counts_fixed': 0, 'orphan_files': 0, 'freed_bytes': 0}
+            deleted = []
+            with self._transaction() as conn:
+                references = self._image_references(conn)
+                rows = conn.execute('SELECT image_id, ref_count, COALESCE(updated_at, created_at) FROM images').fetchall()
+                for image_id, ref_count, touched in rows:
+                    stats['images'] += 1
+                    count = references[image_id]
+                    if touched is not None and touched >= cutoff:
+                        continue
+                    if count == 0:
+                        stats['deleted_images'] += 1
+                        stats['freed_bytes'] += conn.execute(
+                            'SELECT COALESCE(SUM(length(data)), 0) FROM image_blobs WHERE image_id = ?', (image_id,)
+                        ).fetchone()[0]
+                        deleted.append(image_id)
+                    elif ref_count != count:
+                        stats['ref_counts_fixed'] += 1
+                        if not dry_run:
+                            conn.execute('UPDATE images SET ref_count = ? WHERE image_id = ?', (count, image_id))
+
+                # Blob không thuộc ảnh nào (file tạo khi foreign_keys tắt)
+                orphan_count, orphan_bytes = conn.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(length(data)), 0) FROM image_blobs '
+                    'WHERE image_id NOT IN (SELECT image_id FROM images)'
+                ).fetchone()
+                stats['orphan_files'] = orphan_count
+                stats['freed_bytes'] += orphan_bytes
+
+                if not dry_run:
+                    for image_id in deleted:
+                        conn.execute('DELETE FROM image_blobs WHERE image_id = ?', (image_id,))
+                        conn.execute('DELETE FROM images WHERE image_id = ?', (image_id,))
+                    conn.execute('DELETE FROM image_blobs WHERE image_id NOT IN (SELECT image_id FROM images)')
+
+            if deleted and not dry_run:
+                for image_id in deleted:
+                    self.image_cache.discard(image_id)
+                self.invalidate_cache(COLLECTIONS['images'])
+            logger.info(f"Image GC{' (dry run)' if dry_run else ''}: {stats}")
+            return stats
+        except Exception as e:
+            logger.error(f"Error collecting image garbage: {e}")
+            return None
+
+    def open_team_image(self, image_id: str, size: str = None, accept_webp: bool = False) -> Optional[Dict]:
+        """
+        Mở ảnh team để gửi cho client (cùng kết quả với DatabaseManager.open_team_image).
+        Ảnh lớn hơn IMAGE_CACHE_MAX_ITEM_BYTES trả về 'stream' là sqlite3.Blob (Python 3.11+).
+        """
+        cache_key = (image_id, size or 'full', bool(accept_webp))
+        cached = self.image_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            logger.error("Cannot get image: Not connected to database")
+            return None
+
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT blob_id, mime_type, width, height, variants, filename, team_name FROM images WHERE image_id = ?',
+                (image_id,)
+            ).fetchone()
+            if not row:
+                logger.warning(f"⚠️  Image metadata not found for ID: {image_id}")
+                return None
+
+            image_doc = {
+                'mime_type': row[1],
+                'dimensions': {'width': row[2], 'height': row[3]},
+                'variants': json.loads(row[4]) if row[4] else {}
+            }
+            entry, content_type, dimensions, variant_name = self._select_variant(image_doc, size, accept_webp)
+            blob_id = entry['blob_id'] if entry else row[0]
+
+            # length() của BLOB đọc từ header, không phải nạp cả ảnh
+            blob_row = conn.execute('SELECT length(data), created_at FROM image_blobs WHERE blob_id = ?',
+                                    (blob_id,)).fetchone()
+            if not blob_row or not blob_row[0]:
+                logger.error(f"❌ Image data is empty for ID: {image_id}")
+                return None
+            length = blob_row[0]
+
+            image_info = {
+                'content_type': content_type,
+                'filename': row[5],
+                'size': length,
+                'length': length,
+                # blob_id tăng dần và không bao giờ dùng lại (AUTOINCREMENT) nên là strong ETag
+                'etag': f'"{image_id}-{blob_id}"',
+                'last_modified': datetime.fromisoformat(blob_row[1]) if blob_row[1] else None,
+                'dimensions': dimensions,
+                'variant': variant_name,
+                'has_variants': bool(image_doc['variants']),
+                'team_name': row[6]
+            }
+
+            if length > self.image_cache.max_item_bytes and hasattr(conn, 'blobopen'):
+                logger.debug(f"Streaming image {image_id} ({size or 'full'}): {length} bytes")
+                image_info['stream'] = conn.blobopen('image_blobs', 'data', blob_id, readonly=True)
+                return image_info
+
+            image_info['data'] = conn.execute('SELECT data FROM image_blobs WHERE blob_id = ?', (blob_id,)).fetchone()[0]
+            self.image_cache.put(cache_key, image_info, length)
+            return image_info
+
+        except Exception as e:
+            logger.error(f"❌ Error getting team image {image_id}: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return None
+
+    # =============== GENERIC OPERATIONS ===============
+
+    def get_data(self, collection_name: str) -> List[Dict]:
+        """
+        Lấy dữ liệu từ collection (có cache, đọc theo index (collection, pos)).
+        Kết quả được dùng chung giữa các request - không sửa trực tiếp list trả về.
+        """
+        if collection_name not in COLLECTIONS.values():
+            logger.warning(f"Collection {collection_name} not found in configuration")
+            return []
+        if collection_name == COLLECTIONS['teams']:
+            return self.get_teams()
+
+        cache_key = ('data', collection_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            return []
+
+        version = self._versions.get(collection_name, 0)
+        try:
+            data = [json.loads(doc) for (doc,) in self._conn().execute(
+                'SELECT doc FROM documents WHERE collection = ? ORDER BY pos, id', (collection_name,)
+            )]
+            self._cache_put(cache_key, data, version)
+            return data
+        except Exception as e:
+            logger.error(f"Error getting data from {collection_name}: {e}")
+            return []
+
+    def save_data(self, collection_name: str, data: List[Dict], stats: Optional[Dict] = None) -> bool:
+        """
+        Lưu danh sách vào collection trong một transaction.
+        Ghép với dòng cũ giống DatabaseManager.save_data: chỉ insert / update / delete
+        những phần tử thật sự thay đổi. stats: dict nhận số thao tác đã ghi.
+        """
+        if not self.is_connected():
+            logger.error("Cannot save data: Not connected to database")
+            return False
+
+        if collection_name not in COLLECTIONS.values() or collection_name in self._SPECIAL_COLLECTIONS:
+            logger.error(f"Collection {collection_name} cannot be saved with save_data")
+            return False
+
+        try:
+            is_used_list = collection_name in (COLLECTIONS[key] for key in self.USED_KEYS)
+            items = []  # (key, doc, value)
+            for item in data:
+                if isinstance(item, dict):
+                    item = {k: v for k, v in item.items() if k not in self._META_FIELDS}
+                    key = self._document_key(item)
+                    value = None
+                else:
+                    key = self._document_key({'value': item})
+                    # Giá trị 'đã dùng' là duy nhất trong danh sách (unique index)
+                    value = _dumps(item) if is_used_list else None
+                items.append((key, _dumps(item), value))
+
+            now = _now()
+            inserted = updated = moved = deleted = 0
+            removed_images = []
+            with self._transaction() as conn:
+                existing = defaultdict(deque)
+                old_contents = []
+                for row_id, pos, doc in conn.execute(
+                        'SELECT id, pos, doc FROM documents WHERE collection = ? ORDER BY pos, id', (collection_name,)):
+                    content = json.loads(doc)
+                    key = self._document_key(content if isinstance(content, dict) else {'value': content})
+                    existing[key].append((row_id, pos, doc))
+                    old_contents.append(content)
+
+                matches = []
+                for key, _, _ in items:
+                    bucket = existing.get(key)
+                    matches.append(bucket.popleft() if bucket else None)
+
+                # Dòng cũ không còn trong danh sách mới (xóa trước để không đụng unique index)
+                stale = [(row_id,) for bucket in existing.values() for row_id, _, _ in bucket]
+                if stale:
+                    conn.executemany('DELETE FROM documents WHERE id = ?', stale)
+                    deleted = len(stale)
+
+                new_positions = self._new_positions([match[1] if match else None for match in matches])
+                for (_, doc, value), match, pos in zip(items, matches, new_positions):
+                    if match is None:
+                        inserted += conn.execute(
+                            'INSERT OR IGNORE INTO documents (collection, pos, doc, value, updated_at) '
+                            'VALUES (?, ?, ?, ?, ?)', (collection_name, pos, doc, value, now)
+                        ).rowcount
+                        continue
+                    row_id, old_pos, old_doc = match
+                    if old_doc != doc:
+                        conn.execute('UPDATE documents SET pos = ?, doc = ?, value = ?, updated_at = ? WHERE id = ?',
+                                     (pos, doc, value, now, row_id))
+                        updated += 1
+                    elif old_pos != pos:
+                        conn.execute('UPDATE documents SET pos = ? WHERE id = ?', (pos, row_id))
+                        moved += 1
+
+                if collection_name == COLLECTIONS['judges']:
+                    # Judge đổi / bỏ ảnh: cập nhật ref_count của ảnh
+                    removed_images = self._update_image_references(
+                        conn, self._reference_counts(old_contents),
+                        self._reference_counts(json.loads(doc) for _, doc, _ in items))
+            self._forget_images(removed_images)
+
+            operations = inserted + updated + moved + deleted
+            if stats is not None:
+                stats.update({
+                    'operations': operations,
+                    'inserted': inserted,
+                    'updated': updated,
+                    'moved': moved,
+                    'deleted': deleted
+                })
+            logger.info(f"Saved {len(items)} items to {collection_name} "
+                        f"({operations} ops: +{inserted} ~{updated} >{moved} -{deleted})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error saving data to {collection_name}: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def import_documents(self, collection_name: str, batches: Iterable[List[Dict]],
+                         replace: bool = False) -> Optional[Dict]:
+        """
+        Ghi đè / thêm document theo trường 'id', mỗi lô một transaction.
+        Lô tiếp theo được đọc ngoài transaction nên không giữ lock ghi trong lúc chờ dữ liệu nguồn.
+        """
+        if not self.is_connected():
+            logger.error("Cannot import data: Not connected to database")
+            return None
+
+        if collection_name not in COLLECTIONS.values() or collection_name in self._SPECIAL_COLLECTIONS:
+            logger.error(f"Collection {collection_name} cannot be imported")
+            return None
+
+        inserted = updated = deleted = batch_count = 0
+        try:
+            with self._write_locks[collection_name]:
+                row = self._conn().execute(
+                    'SELECT MAX(pos) FROM documents WHERE collection = ?', (collection_name,)).fetchone()
+                base = row[0] + 1 if row[0] is not None else 0.0
+                pos = base
+
+                for batch in batches:
+                    if not batch:
+                        continue
+                    now = _now()
+                    with self._transaction() as conn:
+                        for doc in batch:
+                            item = {k: v for k, v in doc.items() if k not in self._META_FIELDS}
+                            existing = conn.execute(
+                                "SELECT id FROM documents WHERE collection = ? AND json_extract(doc, '$.id') = ?",
+                                (collection_name, item['id'])
+                            ).fetchone()
+                            if existing:
+                                conn.execute('UPDATE documents SET pos = ?, doc = ?, updated_at = ? WHERE id = ?',
+                                             (pos, _dumps(item), now, existing[0]))
+                                updated += 1
+                            else:
+                                conn.execute('INSERT INTO documents (collection, pos, doc, updated_at) '
+                                             'VALUES (?, ?, ?, ?)', (collection_name, pos, _dumps(item), now))
+                                inserted += 1
+                            pos += 1
+                    batch_count += 1
+
+                if replace and batch_count:
+                    # Dòng được nhập đều có pos >= base
+                    with self._transaction() as conn:
+                        deleted = conn.execute('DELETE FROM documents WHERE collection = ? AND pos < ?',
+                                               (collection_name, base)).rowcount
+
+            stats = {'inserted': inserted, 'updated': updated, 'deleted': deleted, 'batches': batch_count}
+            logger.info(f"Imported into {collection_name} in {batch_count} batches "
+                        f"(+{inserted} ~{updated} -{deleted})")
+            return stats
+
+        except Exception as e:
+            logger.error(f"Error importing data into {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def count_documents(self, collection_name: str) -> Optional[int]:
+        """Số document trong collection (None nếu lỗi)"""
+        if not self.is_connected():
+            return None
+        try:
+            if collection_name in self._SPECIAL_COLLECTIONS:
+                return self._conn().execute(f'SELECT COUNT(*) FROM {collection_name}').fetchone()[0]
+            return self._conn().execute('SELECT COUNT(*) FROM documents WHERE collection = ?',
+                                        (collection_name,)).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting {collection_name}: {e}")
+            return None
+
+    # =============== LOGIN STATUS ===============
+
+    def get_login_status(self) -> Dict:
+        """Trạng thái đăng nhập (bảng users, có cache)"""
+        cache_key = ('login', COLLECTIONS['users'])
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        if not self.is_connected():
+            return {"logged_in": False}
+
+        version = self._versions.get(COLLECTIONS['users'], 0)
+        row = self._conn().execute("SELECT logged_in FROM users WHERE type = 'login_status'").fetchone()
+        status = {"logged_in": bool(row[0]) if row else False}
+        self._cache_put(cache_key, status, version)
+        return status
+
+    def set_login_status(self, logged_in: bool) -> bool:
+        """Cập nhật trạng thái đăng nhập"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (type, logged_in, updated_at) VALUES ('login_status', ?, ?) "
+                    "ON CONFLICT (type) DO UPDATE SET logged_in = excluded.logged_in, updated_at = excluded.updated_at",
+                    (1 if logged_in else 0, _now())
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving login status: {e}")
+            return False
+        finally:
+            self.invalidate_cache(COLLECTIONS['users'])
+
+    # =============== USED ITEM OPERATIONS ===============
+
+    def add_used_item(self, collection_name: str, value: Any) -> Optional[bool]:
+        """
+        Đánh dấu một giá trị là 'đã dùng' (INSERT OR IGNORE trên unique index).
+        Returns:
+            True nếu vừa thêm, False nếu đã có sẵn, None nếu lỗi
+        """
+        if not self.is_connected():
+            logger.error("Cannot add used item: Not connected to database")
+            return None
+
+        try:
+            with self._transaction() as conn:
+                # Phần tử mới luôn nằm cuối danh sách
+                return conn.execute(
+                    'INSERT OR IGNORE INTO documents (collection, pos, doc, value, updated_at) '
+                    'SELECT ?, COALESCE(MAX(pos), -1) + 1, ?, ?, ? FROM documents WHERE collection = ?',
+                    (collection_name, _dumps(value), _dumps(value), _now(), collection_name)
+                ).rowcount > 0
+        except Exception as e:
+            logger.error(f"Error adding {value!r} to {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def remove_used_item(self, collection_name: str, value: Any) -> Optional[bool]:
+        """
+        Bỏ đánh dấu 'đã dùng' của một giá trị.
+        Returns:
+            True nếu đã xóa, False nếu không có, None nếu lỗi
+        """
+        if not self.is_connected():
+            logger.error("Cannot remove used item: Not connected to database")
+            return None
+
+        try:
+            with self._transaction() as conn:
+                return conn.execute('DELETE FROM documents WHERE collection = ? AND value = ?',
+                                    (collection_name, _dumps(value))).rowcount > 0
+        except Exception as e:
+            logger.error(f"Error removing {value!r} from {collection_name}: {e}")
+            return None
+        finally:
+            self.invalidate_cache(collection_name)
+
+    def clear_all_data(self) -> bool:
+        """Xóa tất cả dữ liệu"""
+        if not self.is_connected():
+            logger.error("Cannot clear data: Not connected to database")
+            return False
+
+        try:
+            with self._transaction() as conn:
+                for table in ('documents', 'teams', 'image_blobs', 'images', 'users'):
+                    conn.execute(f'DELETE FROM {table}')
+                conn.execute("INSERT INTO users (type, logged_in, updated_at) VALUES ('login_status', 0, ?)",
+                             (_now(),))
+            logger.info("Cleared all data from database")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error clearing data: {e}")
+            return False
+        finally:
+            self.invalidate_cache()
+
+
+# Global SQLite manager instance (server_mongodb.py dùng khi DATABASE_BACKEND='sqlite')
+db_manager = SQLiteDatabaseManager()
@@ -1,13 +1,35 @@
 #!/usr/bin/env python3
 """
 Updated test script to validate MongoDB integration with new data structures.
+
+    python test_mongodb.py            # MongoDB (database.py)
+    python test_mongodb.py sqlite     # SQLiteDatabaseManager trên một file tạm
+    python test_mongodb.py all        # chạy cùng bộ test trên cả hai backend
 """
 
+import base64
+import os
+import shutil
 import sys
+import tempfile
 import uuid
 from database import db_manager
 from config import COLLECTIONS
 
+BACKENDS = ('mongodb', 'sqlite')
+
+def use_backend(backend):
+    """Chọn db_manager cho các test. Trả về thư mục tạm cần xóa sau khi test (sqlite) hoặc None"""
+    global db_manager
+    if backend == 'sqlite':
+        from sqlite_database import SQLiteDatabaseManager
+        temp_dir = tempfile.mkdtemp(prefix='game_show_test_')
+        db_manager = SQLiteDatabaseManager(os.path.join(temp_dir, 'test.sqlite3'))
+        return temp_dir
+    import database
+    db_manager = database.db_manager
+    return None
+
 def test_mongodb_connection():
     """Test kết nối MongoDB"""
     print("🔌 Testing MongoDB connection...")
@@ -76,7 +98,7 @@ def test_delete_operations():
 
     # Test xóa team
     team_id_to_delete = f"team_to_delete_{uuid.uuid4()}"
-    test_team = [{"id": team_id_to_delete, "name": "Team To Delete"}]
+    test_team = [{"team_id": team_id_to_delete, "name": "Team To Delete"}]
     db_manager.save_teams(test_team) # Dùng save_teams để upsert
 
     if not db_manager.delete_team(team_id_to_delete):
@@ -85,7 +107,7 @@ def test_delete_operations():
     
     # Kiểm tra lại xem team đã thực sự bị xóa chưa
     remaining_teams = db_manager.get_teams()
-    if any(t['id'] == team_id_to_delete for t in remaining_teams):
+    if any(t.get('team_id') == team_id_to_delete for t in remaining_teams):
         print("❌ Team was not actually deleted from DB!")
         return False
     print("✅ Team delete function working!")
@@ -107,12 +129,37 @@ def test_delete_operations():
 
     return True
 
+def test_order_positions():
+    """Test thứ tự danh sách sau nhiều lần chèn vào giữa (_pos float hết độ chính xác)"""
+    print("\n🔢 Testing list order after repeated middle inserts...")
+
+    questions = [{"id": "q_first", "question": "First"}, {"id": "q_last", "question": "Last"}]
+    if not db_manager.save_data(COLLECTIONS['questions'], questions):
+        print("❌ Questions save failed!")
+        return False
+
+    # Luôn chèn ngay trước phần tử cuối: trung điểm float trùng nhau sau khoảng 53 lần
+    for i in range(100):
+        questions.insert(len(questions) - 1, {"id": f"q_middle_{i}", "question": f"Middle {i}"})
+        if not db_manager.save_data(COLLECTIONS['questions'], questions):
+            print(f"❌ Questions save failed at insert {i}!")
+            return False
+
+    retrieved_ids = [q.get('id') for q in db_manager.get_data(COLLECTIONS['questions'])]
+    if retrieved_ids != [q['id'] for q in questions]:
+        print("❌ Question order is wrong after repeated middle inserts!")
+        return False
+    print("✅ Question order kept after 100 middle inserts!")
+    return True
+
 def test_image_operations():
     """Test image operations, bao gồm cả ảnh giám khảo"""
     print("\n🖼️ Testing image operations...")
     
-    test_image_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg=="
-    image_data = f"data:image/png;base64,{test_image_base64}"
+    # Ảnh 1x1 quá nhỏ để process_image chấp nhận - dùng một ảnh đội có sẵn
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', 'teams', 'STT01.jpg'), 'rb') as f:
+        test_image_base64 = base64.b64encode(f.read()).decode('ascii')
+    image_data = f"data:image/jpeg;base64,{test_image_base64}"
     
     # Test lưu ảnh team
     team_result = db_manager.save_team_image(image_data, "Test Team Image", "test_img_team_1")
@@ -130,9 +177,9 @@ def test_image_operations():
     
     return True
 
-def run_all_tests():
-    """Chạy tất cả tests"""
-    print("🧪 MongoDB Integration Test Suite (Updated)")
+def run_all_tests(backend='mongodb'):
+    """Chạy tất cả tests trên db_manager của backend"""
+    print(f"🧪 MongoDB Integration Test Suite (Updated) - backend: {backend}")
     print("=" * 50)
     
     # Luôn xóa sạch database trước khi test để đảm bảo môi trường sạch
@@ -144,6 +191,7 @@ def run_all_tests():
     tests = [
         ("Judge and Question Ops", test_judge_and_question_ops),
         ("Delete Operations", test_delete_operations),
+        ("Order Positions", test_order_positions),
         ("Image Operations", test_image_operations)
     ]
     
@@ -176,16 +224,25 @@ def run_all_tests():
         return False
 
 def main():
-    try:
-        success = run_all_tests()
-        if db_manager.is_connected():
-            db_manager.disconnect()
-        sys.exit(0 if success else 1)
-    except Exception as e:
-        print(f"\n❌ An unexpected error occurred: {e}")
-        if db_manager.is_connected():
-            db_manager.disconnect()
-        sys.exit(1)
+    choice = sys.argv[1] if len(sys.argv) > 1 else 'mongodb'
+    if choice not in BACKENDS + ('all',):
+        print(f"Usage: python test_mongodb.py [{' | '.join(BACKENDS + ('all',))}]")
+        sys.exit(2)
+
+    success = True
+    for backend in (BACKENDS if choice == 'all' else (choice,)):
+        temp_dir = use_backend(backend)
+        try:
+            success = run_all_tests(backend) and success
+        except Exception as e:
+            print(f"\n❌ An unexpected error occurred: {e}")
+            success = False
+        finally:
+            if db_manager.is_connected():
+                db_manager.disconnect()
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file